@@ -0,0 +1,195 @@
+"""Catalogue of a server's backups.
+
+Every backup gets a row in a SQLite database in the server's backup folder when it starts,
+completed with its size, file count, codec, game version and duration when it finishes (or
+marked failed), and later with the result of its verification. Listing backups reads the
+catalogue only, so it stays fast with thousands of backups and never touches the backups
+themselves. Backups that are on disk but not in the catalogue (made before it existed) are
+added by sync(). Downloads of dedup and snapshot backups keep the table of their zip's members
+(offset, CRC and size) next to the backup's row, so resuming one doesn't read the backup again.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CATALOGUE_FILE = ".catalogue.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,
+    format TEXT,
+    trigger TEXT,
+    status TEXT,
+    error TEXT,
+    started REAL,
+    finished REAL,
+    size INTEGER,
+    stored INTEGER,
+    files INTEGER,
+    codec TEXT,
+    game_version TEXT,
+    verification TEXT,
+    verified REAL,
+    verified_bytes INTEGER,
+    verify_error TEXT,
+    download_table TEXT
+);
+CREATE INDEX IF NOT EXISTS backups_started ON backups (started);
+CREATE INDEX IF NOT EXISTS backups_verified ON backups (status, verified);
+"""
+COLUMNS = ("id", "name", "format", "trigger", "status", "error", "started", "finished", "size", "stored", "files",
+           "codec", "game_version", "verification", "verified", "verified_bytes", "verify_error")
+
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+def _to_json(row):
+    backup = dict(zip(COLUMNS, row))
+    backup["duration"] = backup["finished"] - backup["started"] if backup["finished"] else None
+    backup["verification"] = {
+        # not checked yet
+        "status": backup.pop("verification") or "pending",
+        "checked": backup.pop("verified"),
+        "bytes": backup.pop("verified_bytes"),
+        "error": backup.pop("verify_error"),
+    }
+    return backup
+
+
+class BackupCatalogue:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            # catalogues from before download tables existed
+            if "download_table" not in {row[1] for row in db.execute("PRAGMA table_info(backups)")}:
+                db.execute("ALTER TABLE backups ADD COLUMN download_table TEXT")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Yields a connection inside a transaction and closes it afterwards."""
+        db = sqlite3.connect(self.path)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def start(self, name, backup_format, trigger, codec=None, game_version=None, started=None):
+        """Adds a backup that is being made. A failed backup of the same name is replaced."""
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM backups WHERE name = ?", (name,))
+            db.execute("INSERT INTO backups (name, format, trigger, status, started, codec, game_version) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (name, backup_format, trigger, RUNNING, started or time.time(), codec, game_version))
+
+    def finish(self, name, size, stored, files):
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE backups SET status = ?, finished = ?, size = ?, stored = ?, files = ? WHERE name = ?",
+                       (COMPLETE, time.time(), size, stored, files, name))
+
+    def fail(self, name, error):
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE backups SET status = ?, finished = ?, error = ? WHERE name = ?",
+                       (FAILED, time.time(), str(error), name))
+
+    def remove(self, name):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM backups WHERE name = ?", (name,))
+
+    def setVerification(self, name, status, checked, checked_bytes, error):
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE backups SET verification = ?, verified = ?, verified_bytes = ?, verify_error = ? "
+                       "WHERE name = ?", (status, checked, checked_bytes, error, name))
+
+    def downloadTable(self, name):
+        """The member table saved by setDownloadTable, or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT download_table FROM backups WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row is not None and row[0] else None
+
+    def setDownloadTable(self, name, table):
+        with self._lock, self._connect() as db:
+            db.execute("UPDATE backups SET download_table = ? WHERE name = ?", (json.dumps(table), name))
+
+    def has(self, name) -> bool:
+        with self._connect() as db:
+            return db.execute("SELECT 1 FROM backups WHERE name = ?", (name,)).fetchone() is not None
+
+    def nameOf(self, backup_id):
+        """The name of the backup with this id, or None."""
+        with self._connect() as db:
+            row = db.execute("SELECT name FROM backups WHERE id = ?", (backup_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def names(self):
+        """Names of the complete backups, newest first."""
+        with self._connect() as db:
+            return [row[0] for row in db.execute(
+                "SELECT name FROM backups WHERE status = ? ORDER BY started DESC, id DESC", (COMPLETE,))]
+
+    def startTimes(self):
+        """(name, started) of the complete backups that have a start time, newest first."""
+        with self._connect() as db:
+            return db.execute("SELECT name, started FROM backups WHERE status = ? AND started IS NOT NULL "
+                              "ORDER BY started DESC, id DESC", (COMPLETE,)).fetchall()
+
+    def list(self, limit=100, before_id=None, status=None):
+        """Returns a page of backups, newest first, and how many there are in total.
+        before_id is the id of the last backup of the previous page."""
+        conditions = []
+        parameters = []
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as db:
+            total = db.execute(f"SELECT COUNT(*) FROM backups {where}", parameters).fetchone()[0]
+            if before_id is not None:
+                # keyset paging: everything older than the last backup of the previous page
+                conditions.append("(started, id) < (SELECT started, id FROM backups WHERE id = ?)")
+                parameters.append(before_id)
+                where = f"WHERE {' AND '.join(conditions)}"
+            rows = db.execute(f"SELECT {', '.join(COLUMNS)} FROM backups {where} "
+                              f"ORDER BY started DESC, id DESC LIMIT ?", parameters + [limit]).fetchall()
+        return [_to_json(row) for row in rows], total
+
+    def toVerify(self, checked_before):
+        """Names of the complete backups never verified or last verified before checked_before, newest first."""
+        with self._connect() as db:
+            return [row[0] for row in db.execute(
+                "SELECT name FROM backups WHERE status = ? AND (verified IS NULL OR verified < ?) "
+                "ORDER BY started DESC, id DESC", (COMPLETE, checked_before))]
+
+    def sync(self, on_disk):
+        """Makes the catalogue match the backups on disk: on_disk maps the name of every backup there to a
+        function returning its row values ({"format", "started", "size", "stored", "files"}), only called
+        for backups the catalogue doesn't know. Complete backups that are gone are removed; backups left
+        running by a crash are marked failed."""
+        with self._lock, self._connect() as db:
+            known = {name: status for name, status in db.execute("SELECT name, status FROM backups")}
+            for name, status in known.items():
+                if status == COMPLETE and name not in on_disk:
+                    db.execute("DELETE FROM backups WHERE name = ?", (name,))
+                elif status == RUNNING:
+                    db.execute("UPDATE backups SET status = ?, error = ? WHERE name = ?",
+                               (FAILED, "interrupted", name))
+            for name, describe in on_disk.items():
+                if known.get(name) == COMPLETE:
+                    continue
+                values = describe()
+                db.execute("DELETE FROM backups WHERE name = ?", (name,))
+                db.execute("INSERT INTO backups (name, format, trigger, status, started, finished, size, stored, "
+                           "files) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (name, values["format"], None, COMPLETE, values["started"], None, values["size"],
+                            values["stored"], values["files"]))
@@ -0,0 +1,442 @@
+"""Compression codecs and the parallel zip writer used by backups.
+
+Work is split into pieces of at most PIECE_SIZE bytes and handed to a thread pool (zlib,
+zstandard and lz4 all release the GIL while compressing); results are consumed in order,
+so archives come out exactly as a serial writer would produce them. StreamedZip produces a
+zip for download piece by piece instead, without writing it anywhere.
+
+zstd and lz4 are only available when the optional zstandard / lz4 packages are installed.
+"""
+import bisect
+import hashlib
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+PIECE_SIZE = 1024 * 1024
+# formats that are already compressed; compressing them again only burns CPU
+COMPRESSED_EXTENSIONS = {".jar", ".zip", ".gz", ".mca", ".mcc", ".png", ".jpg", ".ogg", ".zst", ".xz", ".7z"}
+
+
+class Codec:
+    def __init__(self, codec_id, name, default_level):
+        self.id = codec_id
+        self.name = name
+        self.default_level = default_level
+
+    def compress(self, data, level):
+        return data
+
+    def decompress(self, data):
+        return data
+
+
+class DeflateCodec(Codec):
+    def compress(self, data, level):
+        return zlib.compress(data, level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+    def compress(self, data, level):
+        # compressor objects aren't thread-safe, and creating one is cheap next to a 1 MiB piece
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+class Lz4Codec(Codec):
+    def compress(self, data, level):
+        return lz4.frame.compress(data, compression_level=level)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+# ids are stored in front of every chunk in the backup store; never reuse one
+STORED = Codec(0, "stored", 0)
+DEFLATE = DeflateCodec(1, "deflate", 6)
+ZSTD = ZstdCodec(2, "zstd", 3)
+LZ4 = Lz4Codec(3, "lz4", 0)
+
+CODECS = {codec.name: codec for codec in (STORED, DEFLATE, ZSTD, LZ4)}
+CODECS_BY_ID = {codec.id: codec for codec in CODECS.values()}
+
+
+def is_available(codec) -> bool:
+    if codec is ZSTD:
+        return zstandard is not None
+    if codec is LZ4:
+        return lz4 is not None
+    return True
+
+
+def available_codecs() -> list[str]:
+    return [name for name, codec in CODECS.items() if is_available(codec)]
+
+
+def get_codec(name) -> Codec:
+    """Returns the codec with this name. Raises ValueError if it is unknown or its package isn't installed."""
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown compression codec \"{name}\". Use one of: {', '.join(CODECS)}.")
+    if not is_available(codec):
+        raise ValueError(f"Compression codec \"{name}\" needs the {'zstandard' if codec is ZSTD else 'lz4'} package.")
+    return codec
+
+
+def is_compressed_file(path) -> bool:
+    return os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS
+
+
+def default_threads() -> int:
+    return os.cpu_count() or 1
+
+
+def ordered_map(executor, func, tasks, window):
+    """Submits func(*task) for every task and yields the futures in submission order,
+    keeping at most window of them in flight."""
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(func, *task))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def read_piece(path, offset, length):
+    with open(path, "rb") as file:
+        file.seek(offset)
+        return file.read(length)
+
+
+def piece_offsets(size):
+    return range(0, size, PIECE_SIZE)
+
+
+# zip writing. zipfile can't take data that was compressed elsewhere, so the records are written here.
+# Pieces of a deflated file are flushed to a byte boundary (pigz style) and simply concatenated.
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_UTF8_FLAG = 0x800
+# the CRC and sizes follow the data instead of being in the local header
+ZIP_DESCRIPTOR_FLAG = 0x08
+ZIP_FILE_ATTRIBUTES = 0o100644 << 16
+ZIP_DIR_ATTRIBUTES = (0o40755 << 16) | 0x10
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_END_LOCATOR = struct.Struct("<IIQI")
+
+
+def _dos_time(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _compress_zip_piece(path, offset, level, method, last, throttle=None):
+    data = read_piece(path, offset, PIECE_SIZE)
+    if throttle is not None:
+        throttle.consume(len(data))
+    if method == ZIP_STORED:
+        return data, data
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return data, compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def write_zip(zip_path, source, files, dirs=(), codec=DEFLATE, level=None, threads=None, progress=None,
+              throttle=None):
+    """Writes the files and dirs (as returned by backup_store.scan) of source into a zip archive.
+    Only the stored and deflate codecs exist in zip files; anything else falls back to deflate.
+    progress (a backup_progress.Progress) is updated after every piece. throttle (a
+    backup_throttle.BackupThrottle) limits reads and sets up the worker threads.
+    Returns {"files": {path: SHA-256 of the content}, "skipped": [paths that couldn't be read]}."""
+    if codec is not STORED and codec is not DEFLATE:
+        print(f"Zip backups can't use {codec.name}, using deflate instead.")
+        codec = DEFLATE
+    if level is None:
+        level = codec.default_level
+    threads = threads or default_threads()
+    method = ZIP_DEFLATED if codec is DEFLATE else ZIP_STORED
+
+    def tasks():
+        for path, size, _ in files:
+            file_method = ZIP_STORED if is_compressed_file(path) else method
+            full_path = os.path.join(source, *path.split("/"))
+            # an empty file still needs its final deflate block
+            offsets = piece_offsets(size) or [0]
+            for offset in offsets:
+                yield full_path, offset, level, file_method, offset == offsets[-1], throttle
+
+    if progress is not None:
+        progress.setTotal(sum(size for _, size, _ in files), len(files))
+    central = []
+    checksums = {}
+    skipped = []
+    done = 0
+    files_done = 0
+    initializer = throttle.initWorker if throttle is not None else None
+    with ThreadPoolExecutor(threads, initializer=initializer) as executor, open(zip_path, "wb") as zipf:
+        results = ordered_map(executor, _compress_zip_piece, tasks(), threads * 4)
+        for path, size, mtime_ns in files:
+            file_method = ZIP_STORED if is_compressed_file(path) else method
+            name = path.encode("utf-8")
+            dos_time, dos_date = _dos_time(mtime_ns / 1e9)
+            zip64 = size > ZIP64_LIMIT
+            header_offset = zipf.tell()
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+            zipf.write(LOCAL_HEADER.pack(0x04034b50, 45 if zip64 else 20, ZIP_UTF8_FLAG, file_method,
+                                         dos_time, dos_date, 0, 0, 0, len(name), len(extra)))
+            zipf.write(name)
+            zipf.write(extra)
+
+            crc = 0
+            sha256 = hashlib.sha256()
+            written = 0
+            compressed_size = 0
+            failed = False
+            files_done += 1
+            for _ in piece_offsets(size) or [0]:
+                try:
+                    data, compressed = next(results).result()
+                except OSError as e:
+                    if not failed:
+                        print(e)
+                        print(f"Error writing file: {path}")
+                    failed = True
+                    continue
+                crc = zlib.crc32(data, crc)
+                sha256.update(data)
+                written += len(data)
+                compressed_size += len(compressed)
+                zipf.write(compressed)
+                done += len(data)
+                if progress is not None:
+                    progress.update(done, files_done - 1)
+            if progress is not None:
+                progress.update(done, files_done)
+            if failed:
+                # drop the partial entry
+                zipf.seek(header_offset)
+                zipf.truncate()
+                skipped.append(path)
+                continue
+            checksums[path] = sha256.hexdigest()
+
+            end = zipf.tell()
+            zipf.seek(header_offset + 14)
+            if zip64:
+                zipf.write(struct.pack("<III", crc, 0xFFFFFFFF, 0xFFFFFFFF))
+                zipf.seek(header_offset + LOCAL_HEADER.size + len(name) + 4)
+                zipf.write(struct.pack("<QQ", written, compressed_size))
+            else:
+                zipf.write(struct.pack("<III", crc, compressed_size, written))
+            zipf.seek(end)
+            central.append((name, file_method, ZIP_UTF8_FLAG, dos_time, dos_date, crc, compressed_size, written,
+                            header_offset, ZIP_FILE_ATTRIBUTES))
+
+        # folders get entries too, so empty ones survive a restore
+        for path in dirs:
+            name = path.encode("utf-8") + b"/"
+            header_offset = zipf.tell()
+            zipf.write(LOCAL_HEADER.pack(0x04034b50, 20, ZIP_UTF8_FLAG, ZIP_STORED, 0, (1 << 5) | 1, 0, 0, 0,
+                                         len(name), 0))
+            zipf.write(name)
+            central.append((name, ZIP_STORED, ZIP_UTF8_FLAG, 0, (1 << 5) | 1, 0, 0, 0, header_offset,
+                            ZIP_DIR_ATTRIBUTES))
+
+        zipf.write(_central_directory(central, zipf.tell()))
+    return {"files": checksums, "skipped": skipped}
+
+
+def _central_directory(central, start) -> bytes:
+    """The central directory and end records of an archive whose entries end at start."""
+    records = []
+    for name, method, flags, dos_time, dos_date, crc, compressed_size, size, offset, attributes in central:
+        # only the values that don't fit go into the zip64 extra field, in this order
+        zip64_values = [value for value in (size, compressed_size, offset) if value >= 0xFFFFFFFF]
+        extra = struct.pack(f"<HH{len(zip64_values)}Q", 1, 8 * len(zip64_values), *zip64_values) \
+            if zip64_values else b""
+        records.append(CENTRAL_HEADER.pack(
+            0x02014b50, (3 << 8) | 45, 45 if zip64_values else 20, flags, method, dos_time, dos_date,
+            crc, min(compressed_size, 0xFFFFFFFF), min(size, 0xFFFFFFFF), len(name), len(extra), 0, 0, 0,
+            attributes, min(offset, 0xFFFFFFFF)))
+        records.append(name)
+        records.append(extra)
+    end = start + sum(len(record) for record in records)
+    count = len(central)
+    if count >= 0xFFFF or start >= 0xFFFFFFFF or end - start >= 0xFFFFFFFF:
+        records.append(ZIP64_END_RECORD.pack(0x06064b50, 44, 45, 45, 0, 0, count, count, end - start, start))
+        records.append(ZIP64_END_LOCATOR.pack(0x07064b50, 0, end, 1))
+    records.append(END_RECORD.pack(0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                   min(end - start, 0xFFFFFFFF), min(start, 0xFFFFFFFF), 0))
+    return b"".join(records)
+
+
+class StreamedZip:
+    """A zip archive that is produced while it is sent, for downloading backups that aren't zip files.
+
+    Entries are stored as they are (most of a server is region files and jars, which are
+    compressed already), so the size and layout of the archive are known before anything is
+    read and any byte range of it can be produced on its own, which is what resumed downloads
+    ask for. A file's CRC is only known once it has been read, so it follows the file in a
+    data descriptor. The central directory needs the CRCs of all files: once a full pass has
+    computed them, memberTable() has them with each member's offset and size, and an archive
+    given that table again starts a range right at the member, and the byte, it falls in.
+    Without it, files before the requested range are read again just for their CRCs.
+    """
+
+    def __init__(self, files, dirs=(), table=None, on_table=None):
+        """files is a list of (path, size, mtime_ns, read), where read(start) yields the content of the file
+        from byte start on in blocks; dirs is a list of folder paths. table is a memberTable() of an earlier
+        download, ignored unless it is of the same archive; on_table(table) is called once the CRCs of all
+        files are known, to save it."""
+        self.files = files
+        self._crcs = {}
+        self._on_table = on_table
+        # (offset, length, kind, value): "bytes" with the bytes, "file" or "descriptor" with the file's index
+        self._parts = []
+        self._central = []
+        layout = hashlib.sha1()
+        offset = 0
+        for index, (path, size, mtime_ns, _) in enumerate(files):
+            name = path.encode("utf-8")
+            dos_time, dos_date = _dos_time(mtime_ns / 1e9)
+            zip64 = size > ZIP64_LIMIT
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+            header = LOCAL_HEADER.pack(0x04034b50, 45 if zip64 else 20, ZIP_UTF8_FLAG | ZIP_DESCRIPTOR_FLAG,
+                                       ZIP_STORED, dos_time, dos_date, 0, 0, 0, len(name), len(extra)) + name + extra
+            self._central.append((name, dos_time, dos_date, index, size, offset, ZIP_FILE_ATTRIBUTES))
+            offset = self._addPart(offset, "bytes", header, len(header))
+            offset = self._addPart(offset, "file", index, size)
+            offset = self._addPart(offset, "descriptor", index, 24 if zip64 else 16)
+            layout.update(f"{path}\0{size}\0{mtime_ns}\0".encode("utf-8"))
+        for path in dirs:
+            name = path.encode("utf-8") + b"/"
+            header = LOCAL_HEADER.pack(0x04034b50, 20, ZIP_UTF8_FLAG, ZIP_STORED, 0, (1 << 5) | 1, 0, 0, 0,
+                                       len(name), 0) + name
+            self._central.append((name, 0, (1 << 5) | 1, None, 0, offset, ZIP_DIR_ATTRIBUTES))
+            offset = self._addPart(offset, "bytes", header, len(header))
+            layout.update(f"{path}/\0".encode("utf-8"))
+        self._central_start = offset
+        # CRCs don't change the length of the central directory
+        self.size = self._addPart(offset, "central", None, len(self._centralDirectory(lambda index: 0)))
+        # the same files with the same sizes and times always give the same archive
+        self.etag = layout.hexdigest()
+        self._part_offsets = [part[0] for part in self._parts]
+        if table is not None and table.get("etag") == self.etag and len(table["members"]) == len(files):
+            members = [(offset, size) for _, _, _, _, size, offset, _ in self._central[:len(files)]]
+            if all((offset, size) == (member[0], member[2]) for (offset, size), member in
+                   zip(members, table["members"])):
+                self._crcs = {index: member[1] for index, member in enumerate(table["members"])}
+                self._on_table = None  # saved already
+
+    def memberTable(self):
+        """{"etag", "members": [[offset, crc, size]]} for every file, or None while some CRCs aren't known."""
+        if len(self._crcs) < len(self.files):
+            return None
+        return {"etag": self.etag, "members": [[offset, self._crcs[index], size] for _, _, _, index, size, offset, _
+                                               in self._central[:len(self.files)]]}
+
+    def _addPart(self, offset, kind, value, length):
+        self._parts.append((offset, length, kind, value))
+        return offset + length
+
+    def _centralDirectory(self, crc_of):
+        central = []
+        for name, dos_time, dos_date, index, size, offset, attributes in self._central:
+            if index is None:
+                central.append((name, ZIP_STORED, ZIP_UTF8_FLAG, dos_time, dos_date, 0, 0, 0, offset, attributes))
+            else:
+                central.append((name, ZIP_STORED, ZIP_UTF8_FLAG | ZIP_DESCRIPTOR_FLAG, dos_time, dos_date,
+                                crc_of(index), size, size, offset, attributes))
+        return _central_directory(central, self._central_start)
+
+    def _descriptor(self, index):
+        size = self.files[index][1]
+        if size > ZIP64_LIMIT:
+            return struct.pack("<IIQQ", 0x08074b50, self._crc(index), size, size)
+        return struct.pack("<IIII", 0x08074b50, self._crc(index), size, size)
+
+    def _crc(self, index):
+        if index not in self._crcs:
+            size = self.files[index][1]
+            for _ in self._readFile(index, size, size):
+                pass
+        return self._crcs[index]
+
+    def _readFile(self, index, begin, end):
+        """Yields bytes begin to end of a file, reading it from the start to compute its CRC unless it is known."""
+        path, size, _, read = self.files[index]
+        if index in self._crcs:
+            position = begin
+            for block in read(begin):
+                if position + len(block) > size:
+                    raise OSError(f"{path} is larger than {size} bytes now")
+                yield block[:end - position]
+                position += len(block)
+                if position >= end:
+                    return
+            if position != size:
+                raise OSError(f"{path} is smaller than {size} bytes now")
+            return
+        crc = 0
+        position = 0
+        for block in read(0):
+            block_end = position + len(block)
+            if block_end > size:
+                raise OSError(f"{path} is larger than {size} bytes now")
+            if begin < block_end and position < end:
+                yield block[max(begin - position, 0):end - position]
+            crc = zlib.crc32(block, crc)
+            position = block_end
+            if position >= end and end < size:
+                return  # the rest isn't wanted, and neither is the CRC yet
+        if position != size:
+            raise OSError(f"{path} is smaller than {size} bytes now")
+        self._crcs[index] = crc
+
+    def iterRange(self, start, stop):
+        """Yields the bytes of the archive from start up to stop."""
+        first = max(bisect.bisect_right(self._part_offsets, start) - 1, 0)
+        for offset, length, kind, value in self._parts[first:]:
+            if offset + length <= start:
+                continue
+            if offset >= stop:
+                break
+            begin = max(start - offset, 0)
+            end = min(stop - offset, length)
+            if kind == "file":
+                yield from self._readFile(value, begin, end)
+            elif kind == "descriptor":
+                yield self._descriptor(value)[begin:end]
+            elif kind == "central":
+                yield self._centralDirectory(self._crc)[begin:end]
+                if self._on_table is not None:
+                    self._on_table(self.memberTable())
+                    self._on_table = None
+            else:
+                yield value[begin:end]
@@ -0,0 +1,58 @@
+"""Backups as zip files for download.
+
+Every download has a size, an ETag and iterRange(start, stop), so the route can answer
+Range requests without knowing the backup's format. Zip backups are sent from disk as they
+are; dedup and snapshot backups become a backup_compression.StreamedZip, zipped while they
+are sent, so nothing is written to disk or held in memory whatever the size of the backup.
+table and on_table are passed on to StreamedZip, to keep its member table for resumed downloads.
+"""
+import os
+
+import backup_compression
+from backup_store import scan
+
+READ_BLOCK = 1024 * 1024
+
+
+class FileDownload:
+    """A file on disk, such as a zip backup."""
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.etag = f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+    def iterRange(self, start, stop):
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                block = file.read(min(READ_BLOCK, remaining))
+                if not block:
+                    raise OSError(f"{self.path} got shorter while it was sent")
+                remaining -= len(block)
+                yield block
+
+
+def manifest_zip(store, manifest, table=None, on_table=None) -> backup_compression.StreamedZip:
+    """A zip of a dedup backup, read from the chunk store as it is sent."""
+    files = [(entry["path"], entry["size"], entry["mtime_ns"],
+              lambda start, entry=entry: store.iterFile(entry, start)) for entry in manifest["files"]]
+    return backup_compression.StreamedZip(files, manifest["dirs"], table, on_table)
+
+
+def snapshot_zip(folder, table=None, on_table=None) -> backup_compression.StreamedZip:
+    """A zip of a snapshot folder, read as it is sent."""
+    files, dirs = scan(folder)
+
+    def reader(path):
+        def read(start):
+            with open(os.path.join(folder, *path.split("/")), "rb") as file:
+                file.seek(start)
+                while block := file.read(READ_BLOCK):
+                    yield block
+        return read
+
+    return backup_compression.StreamedZip([(path, size, mtime_ns, reader(path)) for path, size, mtime_ns in files],
+                                          dirs, table, on_table)
@@ -0,0 +1,109 @@
+"""Progress of a running backup or restore, as reported by /backup/progress.
+
+The rates are measured from what was actually done, so they show the effective throughput
+with any throttling (see backup_throttle) included."""
+import collections
+import threading
+import time
+
+# the current rate is measured over this many seconds, so it follows slow and fast stretches
+RATE_WINDOW = 5.0
+
+
+class Progress:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.running = False
+            self.bytes_done = 0
+            self.bytes_total = 0
+            self.files_done = 0
+            self.files_total = 0
+            self.failed = False
+            self.error = None
+            self.started = None
+            self.finished = None
+            self.throttle = None
+            self._samples = collections.deque()
+
+    def start(self, bytes_total=0, files_total=0, throttle=None):
+        """throttle is the backup_throttle.BackupThrottle of the work, if any, for its limits in toJson()."""
+        self.reset()
+        with self._lock:
+            self.throttle = throttle
+            self.running = True
+            self.bytes_total = bytes_total
+            self.files_total = files_total
+            self.started = time.monotonic()
+            self._samples.append((self.started, 0))
+
+    def setTotal(self, bytes_total, files_total):
+        """For work whose size is only known once it started, like the scan of a backup."""
+        with self._lock:
+            self.bytes_total = bytes_total
+            self.files_total = files_total
+
+    def update(self, bytes_done, files_done):
+        now = time.monotonic()
+        with self._lock:
+            self.bytes_done = bytes_done
+            self.files_done = files_done
+            self._samples.append((now, bytes_done))
+            while len(self._samples) > 2 and now - self._samples[1][0] > RATE_WINDOW:
+                self._samples.popleft()
+
+    def fail(self, error):
+        with self._lock:
+            self.running = False
+            self.failed = True
+            self.error = str(error)
+            self.finished = time.monotonic()
+
+    def finish(self):
+        with self._lock:
+            self.running = False
+            self.finished = time.monotonic()
+
+    def percentage(self) -> float:
+        with self._lock:
+            if not self.running:
+                return 0
+            return 100 * self.bytes_done / self.bytes_total if self.bytes_total else 0
+
+    def bytesPerSecond(self) -> float:
+        """The current rate while running, the average over the whole run once finished."""
+        with self._lock:
+            if self.started is None:
+                return 0.0
+            if not self.running:
+                elapsed = (self.finished or self.started) - self.started
+                return self.bytes_done / elapsed if elapsed > 0 else 0.0
+            if len(self._samples) < 2:
+                return 0.0
+            first_time, first_bytes = self._samples[0]
+            elapsed = time.monotonic() - first_time
+            return (self.bytes_done - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def toJson(self):
+        rate = self.bytesPerSecond()
+        throttle = self.throttle.toJson() if self.throttle is not None else None
+        remaining = max(self.bytes_total - self.bytes_done, 0)
+        with self._lock:
+            end = self.finished if self.finished is not None else time.monotonic()
+            return {
+                "running": self.running,
+                "bytesDone": self.bytes_done,
+                "bytesTotal": self.bytes_total,
+                "filesDone": self.files_done,
+                "filesTotal": self.files_total,
+                "mbPerSecond": round(rate / (1024 * 1024), 2),
+                "etaSeconds": round(remaining / rate) if self.running and rate > 0 else None,
+                "elapsedSeconds": round(end - self.started, 1) if self.started is not None else 0,
+                "failed": self.failed,
+                "error": self.error,
+                # {"limitMbPerSecond", "lagging", "lagWarnings", "throttledSeconds"}, or None if not throttled
+                "throttle": throttle,
+            }
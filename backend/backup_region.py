@@ -0,0 +1,83 @@
+"""Minecraft region files, split into their chunks for backups.
+
+A region file (.mca, .mcr before 1.2) starts with two 4 KiB tables for its 32x32 chunks:
+where each chunk's data is (offset and length in 4 KiB sectors) and when it was last saved.
+Chunk data follows, each starting with its 4-byte length and compression type. Backing up
+the chunks separately means a region file where a player changed a few chunks only costs
+those chunks, and chunks whose hash is the one in the previous backup aren't even looked up.
+
+Restoring rebuilds the file from the tables and chunks: every chunk goes back to the same
+sectors, so the file reads exactly as before. Unused bytes between chunks come back as zeros.
+"""
+import struct
+
+SECTOR = 4096
+HEADER_SIZE = 2 * SECTOR
+CHUNKS = 1024
+REGION_EXTENSIONS = (".mca", ".mcr")
+
+
+class RegionError(ValueError):
+    pass
+
+
+def is_region_file(path) -> bool:
+    return path.lower().endswith(REGION_EXTENSIONS)
+
+
+def parse(data):
+    """Splits the content of a region file into its header and chunks.
+    Returns (header, chunks) with chunks as (index, offset, sectors, timestamp, payload), the payload
+    being the chunk's bytes from its length field on. Raises RegionError if the file isn't a valid
+    region file (truncated, overlapping chunks, ...), which should then be backed up as it is."""
+    if len(data) < HEADER_SIZE:
+        raise RegionError("too short for a region file")
+    header = data[:HEADER_SIZE]
+    locations = struct.unpack(">1024I", header[:SECTOR])
+    timestamps = struct.unpack(">1024I", header[SECTOR:])
+    chunks = []
+    for index, location in enumerate(locations):
+        if location == 0:
+            continue
+        offset, sectors = location >> 8, location & 0xFF
+        start = offset * SECTOR
+        if offset < 2 or sectors == 0 or start + 5 > len(data):
+            raise RegionError(f"chunk {index} is outside the file")
+        length = int.from_bytes(data[start:start + 4], "big")
+        if length == 0 or length + 4 > sectors * SECTOR or start + 4 + length > len(data):
+            raise RegionError(f"chunk {index} has an invalid length")
+        chunks.append((index, offset, sectors, timestamps[index], data[start:start + 4 + length]))
+    chunks.sort(key=lambda chunk: chunk[1])
+    for previous, chunk in zip(chunks, chunks[1:]):
+        if previous[1] + previous[2] > chunk[1]:
+            raise RegionError(f"chunks {previous[0]} and {chunk[0]} overlap")
+    return header, chunks
+
+
+def rebuild(header, chunks, size, read, start=0):
+    """Yields the content of a region file of size bytes from byte start on, from its header and
+    (offset, sectors, key) for every chunk, in any order. read(key) returns a chunk's payload; chunks
+    that end before start aren't read."""
+    if start < len(header):
+        yield header[start:]
+    position = len(header)
+    for offset, sectors, key in sorted(chunks, key=lambda chunk: chunk[0]):
+        chunk_start = offset * SECTOR
+        if chunk_start > max(position, start):
+            yield bytes(chunk_start - max(position, start))
+        # the last chunk's sectors may run past the end of a file that was never padded
+        sectors_end = min(chunk_start + sectors * SECTOR, size)
+        if sectors_end <= start:
+            # parse() made sure the payload fits in its sectors
+            position = sectors_end
+            continue
+        payload = read(key)
+        if chunk_start + len(payload) > start:
+            yield payload[max(start - chunk_start, 0):]
+        end = max(sectors_end, chunk_start + len(payload))
+        padding_start = max(chunk_start + len(payload), start)
+        if end > padding_start:
+            yield bytes(end - padding_start)
+        position = end
+    if size > max(position, start):
+        yield bytes(size - max(position, start))
@@ -0,0 +1,282 @@
+"""Restoring backups, in full or in part.
+
+Every backup format (dedup manifest, snapshot folder, zip) is read through a small class
+with the same interface, so restoring works the same for all of them: the selected files
+are written by a pool of threads into a staging folder next to the server folder and then
+swapped in. A full restore renames the staging folder into place; a partial restore (one
+dimension, a range of region files, one player's data) replaces just those files, without
+unpacking anything else.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import backup_compression
+from backup_store import scan
+
+REGION_FOLDERS = ("region", "entities", "poi")
+REGION_FILE_PATTERN = re.compile(r"r\.(-?\d+)\.(-?\d+)\.mca$")
+COPY_BUFFER = 1024 * 1024
+
+
+class RestoreError(Exception):
+    pass
+
+
+def _is_safe(path) -> bool:
+    """Rejects paths that would end up outside the server folder."""
+    parts = path.split("/")
+    return bool(path) and not path.startswith("/") and ".." not in parts and ":" not in parts[0]
+
+
+class ManifestBackup:
+    def __init__(self, store, manifest):
+        self.store = store
+        self.entries = {entry["path"]: entry for entry in manifest["files"]}
+        self.dirs = manifest["dirs"]
+
+    def files(self):
+        return [(path, entry["size"]) for path, entry in self.entries.items()]
+
+    def extract(self, path, target):
+        entry = self.entries[path]
+        with open(target, "wb") as file:
+            for data in self.store.iterFile(entry):
+                file.write(data)
+        os.utime(target, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+
+class SnapshotBackup:
+    def __init__(self, folder):
+        self.folder = folder
+        files, self.dirs = scan(folder)
+        self._files = [(path, size) for path, size, _ in files]
+
+    def files(self):
+        return self._files
+
+    def extract(self, path, target):
+        # always a copy: the snapshot's files are shared with other snapshots
+        shutil.copy2(os.path.join(self.folder, *path.split("/")), target)
+
+
+class ZipBackup:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with zipfile.ZipFile(path) as zipf:
+            infos = zipf.infolist()
+        self.dirs = [info.filename.rstrip("/") for info in infos if info.is_dir()]
+        self._infos = {info.filename.replace("\\", "/"): info for info in infos if not info.is_dir()}
+
+    def files(self):
+        return [(path, info.file_size) for path, info in self._infos.items()]
+
+    def extract(self, path, target):
+        # every thread reads through its own handle
+        zipf = getattr(self._local, "zipf", None)
+        if zipf is None:
+            zipf = self._local.zipf = zipfile.ZipFile(self.path)
+        info = self._infos[path]
+        with zipf.open(info) as source, open(target, "wb") as file:
+            shutil.copyfileobj(source, file, COPY_BUFFER)
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(target, (mtime, mtime))
+
+
+class Selection:
+    """The part of a backup to restore: files at or below any of prefixes, optionally only region
+    files within a range. With replace_missing, files in the selection that the backup doesn't
+    have are deleted, so the selected part ends up exactly as it was backed up."""
+
+    def __init__(self, prefixes, region_range=None, replace_missing=True):
+        self.prefixes = [prefix.strip("/") for prefix in prefixes]
+        self.region_range = region_range  # ((min_x, max_x), (min_z, max_z)) in region coordinates
+        self.replace_missing = replace_missing
+
+    def matches(self, path) -> bool:
+        if not any(path == prefix or path.startswith(prefix + "/") for prefix in self.prefixes):
+            return False
+        if self.region_range is None:
+            return True
+        match = REGION_FILE_PATTERN.search(path)
+        if match is None:
+            return False
+        (min_x, max_x), (min_z, max_z) = self.region_range
+        return min_x <= int(match.group(1)) <= max_x and min_z <= int(match.group(2)) <= max_z
+
+
+def dimension_folder(files, level_name, dimension):
+    """Returns the folder (relative to the server folder) holding a dimension's data.
+    Spigot/Paper keep the nether and end in separate world folders; that is detected from the backup."""
+    paths = [path for path, _ in files]
+
+    def has(folder):
+        return any(path.startswith(folder + "/") for path in paths)
+
+    if dimension in ("overworld", "minecraft:overworld"):
+        return level_name
+    if dimension in ("nether", "the_nether", "minecraft:the_nether"):
+        separate = f"{level_name}_nether/DIM-1"
+        return separate if has(separate) else f"{level_name}/DIM-1"
+    if dimension in ("end", "the_end", "minecraft:the_end"):
+        separate = f"{level_name}_the_end/DIM1"
+        return separate if has(separate) else f"{level_name}/DIM1"
+    if ":" in dimension:
+        namespace, name = dimension.split(":", 1)
+        return f"{level_name}/dimensions/{namespace}/{name}"
+    raise ValueError(f"Unknown dimension \"{dimension}\". Use overworld, nether, end or a namespaced id.")
+
+
+def dimension_selection(files, level_name, dimension, region_range=None):
+    folder = dimension_folder(files, level_name, dimension)
+    return Selection([f"{folder}/{region_folder}" for region_folder in REGION_FOLDERS], region_range)
+
+
+def player_selection(server_folder, level_name, player):
+    """Selects one player's data, the player given by UUID or by a name found in usercache.json."""
+    uuid = player
+    if not re.fullmatch(r"[0-9a-fA-F-]{32,36}", player):
+        try:
+            with open(os.path.join(server_folder, "usercache.json"), "r", encoding="utf-8") as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            cache = []
+        uuid = next((entry["uuid"] for entry in cache if entry.get("name", "").lower() == player.lower()), None)
+        if uuid is None:
+            raise ValueError(f"Unknown player \"{player}\". Use their UUID instead.")
+    return Selection([f"{level_name}/playerdata/{uuid}.dat", f"{level_name}/playerdata/{uuid}.dat_old",
+                      f"{level_name}/stats/{uuid}.json", f"{level_name}/advancements/{uuid}.json"],
+                     replace_missing=False)
+
+
+def restore(backup, server_folder, selection=None, threads=None, progress=None):
+    """Restores the backup into server_folder: all of it, or only what selection matches.
+    The server must not be running. progress (a backup_progress.Progress) is updated after every file.
+    Returns the number of files restored."""
+    server_folder = os.path.abspath(server_folder)
+    files = [(path, size) for path, size in backup.files()
+             if _is_safe(path) and (selection is None or selection.matches(path))]
+    if selection is not None and not files and not selection.replace_missing:
+        raise RestoreError("The backup has nothing matching the selection.")
+    if progress is not None:
+        progress.setTotal(sum(size for _, size in files), len(files))
+
+    staging = server_folder + ".restoring"
+    done = 0
+    files_done = 0
+    lock = threading.Lock()
+
+    def extract(path, size):
+        nonlocal done, files_done
+        target = os.path.join(staging, *path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        backup.extract(path, target)
+        if progress is not None:
+            with lock:
+                done += size
+                files_done += 1
+                progress.update(done, files_done)
+
+    try:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)  # left behind by an interrupted restore
+        os.makedirs(staging)
+        if selection is None:
+            for path in backup.dirs:
+                if _is_safe(path):
+                    os.makedirs(os.path.join(staging, *path.split("/")), exist_ok=True)
+        with ThreadPoolExecutor(threads or backup_compression.default_threads()) as executor:
+            for future in [executor.submit(extract, path, size) for path, size in files]:
+                future.result()
+    except (OSError, KeyError, zipfile.BadZipFile, ValueError) as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise RestoreError(f"Could not extract the backup: {e}")
+
+    try:
+        if selection is None:
+            _swap(staging, server_folder)
+        else:
+            _replace_selected(staging, server_folder, selection, {path for path, _ in files})
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return len(files)
+
+
+def _swap(staging, server_folder):
+    """Puts the staging folder in place of the server folder. Both renames are on the same
+    filesystem, so the server folder is never half restored."""
+    old = server_folder + ".old"
+    try:
+        if os.path.exists(old):
+            shutil.rmtree(old)
+        if os.path.exists(server_folder):
+            os.replace(server_folder, old)
+    except OSError as e:
+        raise RestoreError(f"Could not move the server folder aside: {e}")
+    try:
+        os.replace(staging, server_folder)
+    except OSError as e:
+        if os.path.exists(old):
+            os.replace(old, server_folder)
+        raise RestoreError(f"Could not swap in the restored folder: {e}")
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _replace_selected(staging, server_folder, selection, restored):
+    """Moves the restored files into the server folder. The files they replace, and with replace_missing
+    the selected files the backup doesn't have, are moved aside first and put back if anything fails,
+    so the server folder is never left half restored."""
+    aside = server_folder + ".old"
+    done = []  # (path, whether it was moved aside, whether the restored file was moved in), to undo
+
+    def move(source_root, target_root, path):
+        target = os.path.join(target_root, *path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(os.path.join(source_root, *path.split("/")), target)
+
+    try:
+        if os.path.exists(aside):
+            shutil.rmtree(aside)
+        removed = []
+        if selection.replace_missing:
+            for prefix in selection.prefixes:
+                folder = os.path.join(server_folder, *prefix.split("/"))
+                if os.path.isfile(folder):
+                    current = [prefix]
+                elif os.path.isdir(folder):
+                    current = [f"{prefix}/{path}" for path, _, _ in scan(folder)[0]]
+                else:
+                    current = []
+                removed += [path for path in current if path not in restored and selection.matches(path)]
+        for path in removed:
+            move(server_folder, aside, path)
+            done.append((path, True, False))
+        for path in restored:
+            existed = os.path.isfile(os.path.join(server_folder, *path.split("/")))
+            if existed:
+                move(server_folder, aside, path)
+            done.append((path, existed, False))
+            move(staging, server_folder, path)
+            done[-1] = (path, existed, True)
+    except OSError as e:
+        undone = True
+        for path, moved_aside, moved_in in reversed(done):
+            try:
+                if moved_in:
+                    os.remove(os.path.join(server_folder, *path.split("/")))
+                if moved_aside:
+                    move(aside, server_folder, path)
+            except OSError as undo_error:
+                print(undo_error)
+                print(f"Could not put {path} back after a failed restore. It is still in {aside}.")
+                undone = False
+        if undone:
+            shutil.rmtree(aside, ignore_errors=True)
+        raise RestoreError(f"Could not move the restored files into place: {e}")
+    shutil.rmtree(aside, ignore_errors=True)
@@ -0,0 +1,182 @@
+"""Scheduled backups and grandfather-father-son retention.
+
+Configured per server in servers.json, inside "backup_settings":
+
+    "schedule": {"cron": "0 */6 * * *", "only_if_players": true}   or   {"interval_minutes": 60}
+    "retention": {"hourly": 24, "daily": 7, "weekly": 4, "monthly": 6}
+
+One thread checks every server's schedule and runs due backups one after another, so
+backups of different servers never hit the disk at the same time; manual backups and
+pruning take the same DISK_LOCK. After a server's backups the scheduler prunes the ones
+its retention policy no longer keeps.
+"""
+import datetime
+import threading
+import time
+
+CHECK_INTERVAL = 30
+# held while a backup or pruning reads or writes the backup disk
+DISK_LOCK = threading.Lock()
+
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+RETENTION_PERIODS = {
+    "hourly": "%Y-%m-%d %H",
+    "daily": "%Y-%m-%d",
+    "weekly": "%G-%V",
+    "monthly": "%Y-%m",
+}
+
+
+class CronSchedule:
+    """A five-field cron expression (minute hour day-of-month month day-of-week) supporting
+    *, lists, ranges and steps. Day of week 0 and 7 are Sunday."""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression \"{expression}\" must have 5 fields.")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parseField(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS))
+        if 7 in self.weekdays:
+            self.weekdays.add(0)
+        # like cron, a restricted day of month and day of week match when either does
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parseField(field, low, high):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/", 1)
+                step = int(step)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
+            else:
+                start = end = int(part)
+            if start < low or end > (7 if high == 6 else high) or step < 1:
+                raise ValueError(f"Cron field \"{field}\" is out of range.")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _dayMatches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def nextAfter(self, moment):
+        """Returns the first matching minute after moment."""
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months or not self._dayMatches(moment):
+                moment = (moment + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + datetime.timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression \"{self.expression}\" never matches.")
+
+
+def next_backup_time(schedule, last_backup):
+    """When the next scheduled backup is due, given the time of the last one (None if there is none)."""
+    if last_backup is None:
+        return datetime.datetime.now()
+    if "cron" in schedule:
+        return CronSchedule(schedule["cron"]).nextAfter(last_backup)
+    return last_backup + datetime.timedelta(minutes=float(schedule["interval_minutes"]))
+
+
+def validate_settings(backup_settings):
+    """Raises ValueError if the schedule or retention in backup_settings can't be used."""
+    schedule = backup_settings.get("schedule")
+    if schedule:
+        if "cron" in schedule:
+            CronSchedule(schedule["cron"]).nextAfter(datetime.datetime.now())
+        elif float(schedule.get("interval_minutes", 0)) <= 0:
+            raise ValueError("A backup schedule needs \"cron\" or a positive \"interval_minutes\".")
+    for period, count in (backup_settings.get("retention") or {}).items():
+        if period not in RETENTION_PERIODS:
+            raise ValueError(f"Invalid retention \"{period}\": {count}. Use {', '.join(RETENTION_PERIODS)}.")
+        if int(count) < 1:
+            raise ValueError(f"Invalid retention \"{period}\": {count}. Keep at least 1, or leave the period out.")
+
+
+def backups_to_keep(backups, retention):
+    """Grandfather-father-son: for every period keeps the newest backup of each of the last N hours,
+    days, weeks and months that have one. backups is a list of (name, datetime).
+    Returns the names to keep; with no retention configured everything is kept. The newest backup
+    is always kept, whatever the policy says."""
+    if not retention:
+        return {name for name, _ in backups}
+    newest_first = sorted(backups, key=lambda backup: backup[1], reverse=True)
+    keep = {newest_first[0][0]} if newest_first else set()
+    for period, count in retention.items():
+        seen = set()
+        for name, moment in newest_first:
+            if len(seen) >= int(count):
+                break
+            bucket = moment.strftime(RETENTION_PERIODS[period])
+            if bucket not in seen:
+                seen.add(bucket)
+                keep.add(name)
+    return keep
+
+
+class BackupScheduler:
+    def __init__(self, get_servers):
+        self.get_servers = get_servers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            for server in list(self.get_servers()):
+                try:
+                    self.runDue(server)
+                except Exception as e:
+                    print(e)
+                    print(f"Scheduled backup of {server.name} failed.")
+            time.sleep(CHECK_INTERVAL)
+
+    def runDue(self, server):
+        settings = server.backup_settings
+        schedule = settings.get("schedule")
+        if schedule:
+            backups = server.getBackupTimes()
+            last_backup = backups[0][1] if backups else None
+            if datetime.datetime.now() >= next_backup_time(schedule, last_backup) \
+                    and not server.getBackupProgress()[0] and not server.getRestoreProgress()[0]:
+                if schedule.get("only_if_players") and last_backup is not None \
+                        and not server.had_players_since_backup and not server.players:
+                    pass  # nothing can have changed
+                else:
+                    print(f"Starting scheduled backup of {server.name}.")
+                    # waiting for it here keeps backups of different servers from overlapping
+                    server.startBackup(trigger="schedule").join()
+        if settings.get("retention"):
+            server.pruneBackups()
+
+
+_scheduler = None
+
+
+def start(get_servers):
+    """Starts the scheduler thread once. get_servers returns the current list of servers."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = BackupScheduler(get_servers)
+        _scheduler.start()
+    return _scheduler
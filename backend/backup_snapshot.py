@@ -0,0 +1,154 @@
+"""Hardlink snapshot backups.
+
+A snapshot is a plain copy of the server folder, but every file that didn't change since
+the previous snapshot is a hardlink to that snapshot's file instead of a new copy (like
+rsync --link-dest). A snapshot of a mostly idle server therefore takes seconds and almost
+no space, while each snapshot can still be browsed and restored on its own.
+
+Snapshot files must never be modified in place, since they are shared with other
+snapshots, so restoring always copies them. That includes their mtime: a file the server
+touched without changing it is linked with its old mtime, and the snapshot's checksums
+record the mtime it had in the server folder ("mtimes"), which the next snapshot compares against.
+"""
+import hashlib
+import os
+import shutil
+
+import backup_verify
+from backup_store import scan
+
+COMPARE_BLOCK = 1024 * 1024
+
+
+def _same_content(path_a, path_b) -> bool:
+    with open(path_a, "rb") as file_a, open(path_b, "rb") as file_b:
+        while True:
+            block = file_a.read(COMPARE_BLOCK)
+            if block != file_b.read(COMPARE_BLOCK):
+                return False
+            if not block:
+                return True
+
+
+def _copy_hashed(source_path, target_path, throttle=None) -> str:
+    """Copies a file with its metadata. Returns the SHA-256 of what was copied."""
+    sha256 = hashlib.sha256()
+    with open(source_path, "rb") as source_file, open(target_path, "wb") as target_file:
+        while block := source_file.read(COMPARE_BLOCK):
+            if throttle is not None:
+                throttle.consume(len(block))
+            sha256.update(block)
+            target_file.write(block)
+    shutil.copystat(source_path, target_path)
+    return sha256.hexdigest()
+
+
+def create_snapshot(source, target, previous=None, progress=None, scanned=None, previous_checksums=None,
+                    throttle=None):
+    """Snapshots the source folder into target, hardlinking unchanged files from the previous
+    snapshot folder. The snapshot is built under target + ".tmp" and renamed when complete.
+    progress (a backup_progress.Progress) is updated after every file. scanned is what scan(source)
+    returned, if the caller already has it. previous_checksums are the previous snapshot's checksums,
+    reused for the files linked to it. throttle (a backup_throttle.BackupThrottle) limits the reads of copied
+    files and lowers the priority of the calling thread.
+    Returns {"size", "copied", "linked", "checksums"}: bytes in the snapshot, bytes copied, files linked
+    and the checksums of the snapshot (see backup_verify), with the "mtimes" of linked files whose mtime in
+    the server folder is not their own."""
+    files, dirs = scanned or scan(source)
+    if progress is not None:
+        progress.setTotal(sum(size for _, size, _ in files), len(files))
+    if throttle is not None:
+        throttle.initWorker()
+    temp_target = target + ".tmp"
+    if os.path.exists(temp_target):
+        shutil.rmtree(temp_target)  # left behind by an interrupted snapshot
+    os.makedirs(temp_target)
+    for path in dirs:
+        os.makedirs(os.path.join(temp_target, *path.split("/")), exist_ok=True)
+
+    previous_files = previous_checksums["files"] if previous_checksums else {}
+    previous_mtimes = previous_checksums.get("mtimes", {}) if previous_checksums else {}
+    checksums = {}
+    mtimes = {}
+    skipped = []
+    done = 0
+    copied = 0
+    linked = 0
+    for files_done, (path, size, mtime_ns) in enumerate(files, 1):
+        parts = path.split("/")
+        source_path = os.path.join(source, *parts)
+        target_path = os.path.join(temp_target, *parts)
+        linked_mtime_ns = None
+        if previous is not None:
+            linked_mtime_ns = _link_unchanged(os.path.join(previous, *parts), source_path, target_path, size,
+                                              mtime_ns, previous_mtimes.get(path))
+        if linked_mtime_ns is not None:
+            linked += 1
+            if linked_mtime_ns != mtime_ns:
+                mtimes[path] = mtime_ns
+            checksum = previous_files.get(path)
+            checksums[path] = checksum if checksum is not None else backup_verify.hash_file(target_path)
+        elif previous is not None and not os.path.exists(source_path) \
+                and is_unchanged(previous, path, size, mtime_ns, previous_mtimes):
+            # left out of a hot backup's staging folder as unchanged, but it couldn't be linked (EXDEV, EPERM,
+            # no hardlinks): the previous snapshot's file has the content the link would have had. Not skipped
+            # on errors, the snapshot would silently miss a file the server has.
+            checksums[path] = _copy_hashed(os.path.join(previous, *parts), target_path, throttle)
+            copied += size
+        else:
+            try:
+                checksums[path] = _copy_hashed(source_path, target_path, throttle)
+            except OSError as e:
+                print(e)
+                print(f"Could not back up {path}. Skipping.")
+                skipped.append(path)
+                continue
+            copied += size
+        done += size
+        if progress is not None:
+            progress.update(done, files_done)
+
+    os.replace(temp_target, target)
+    return {"size": done, "copied": copied, "linked": linked,
+            "checksums": {"files": checksums, "skipped": skipped, "mtimes": mtimes}}
+
+
+def is_unchanged(previous, path, size, mtime_ns, previous_mtimes=None) -> bool:
+    """Whether the previous snapshot folder has this file with the same size and mtime. previous_mtimes
+    are the "mtimes" in the previous snapshot's checksums."""
+    try:
+        stat = os.stat(os.path.join(previous, *path.split("/")))
+    except OSError:
+        return False
+    return stat.st_size == size and mtime_ns in (stat.st_mtime_ns, (previous_mtimes or {}).get(path))
+
+
+def _link_unchanged(previous_path, source_path, target_path, size, mtime_ns, recorded_mtime_ns=None):
+    """Hardlinks the previous snapshot's file if the source file is the same. recorded_mtime_ns is the mtime
+    the previous snapshot recorded for a file linked with an older one. Returns the linked file's mtime,
+    or None if it wasn't linked."""
+    try:
+        stat = os.stat(previous_path)
+        if stat.st_size != size:
+            return None
+        if mtime_ns not in (stat.st_mtime_ns, recorded_mtime_ns):
+            # touched but maybe not changed (the server rewrites some files on every save). The shared
+            # file's mtime stays as it is, the caller records the new one.
+            if not _same_content(previous_path, source_path):
+                return None
+        os.link(previous_path, target_path)
+        return stat.st_mtime_ns
+    except OSError:
+        # missing in the previous snapshot, unreadable, or links not supported here: copy instead
+        return None
+
+
+def restore_snapshot(snapshot, target):
+    """Copies a snapshot into target (which should be empty)."""
+    files, dirs = scan(snapshot)
+    os.makedirs(target, exist_ok=True)
+    for path in dirs:
+        os.makedirs(os.path.join(target, *path.split("/")), exist_ok=True)
+    for path, _, _ in files:
+        parts = path.split("/")
+        shutil.copy2(os.path.join(snapshot, *parts), os.path.join(target, *parts))
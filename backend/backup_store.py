@@ -0,0 +1,361 @@
+"""Content-addressed, deduplicating backup storage.
+
+Files are split into fixed-size chunks and every chunk is stored once, named after the
+SHA-256 of its content. The store is shared by every server whose backup folder lives in
+the same parent folder (normally <backups_folder>/.store), so identical mod jars and
+libraries are only kept once on the whole host.
+
+A backup is a manifest in the server's backup folder listing the chunks of every file.
+Files whose size and modification time match the previous backup are not read again, so
+a backup costs time and space in proportion to what changed since the last one. Region
+files are split along their own chunks instead (see backup_region), so a region file
+where only a few chunks were saved costs just those chunks.
+
+    <backups_folder>/.store/chunks/ab/abcdef...   one chunk, prefixed with its codec byte
+    <backups_folder>/<server>/<backup>.manifest.json
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backup_compression
+import backup_region
+
+STORE_FOLDER = ".store"
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 2
+# chunks are the pieces the compression pool works on
+CHUNK_SIZE = backup_compression.PIECE_SIZE
+
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _run(method, args):
+    return method(*args)
+
+
+def write_manifest(path, manifest):
+    """Writes the manifest under a temporary name first, so a half-written backup never shows up."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def scan(folder):
+    """Lists every file under folder in one pass.
+    Returns (files, dirs): files as (relative path, size, mtime_ns), dirs as relative paths.
+    Relative paths always use "/" so manifests are portable between platforms."""
+    files = []
+    dirs = []
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        try:
+            entries = list(os.scandir(os.path.join(folder, relative)))
+        except OSError as e:
+            print(e)
+            print(f"Could not list {relative or folder}. Skipping.")
+            continue
+        for entry in entries:
+            path = f"{relative}/{entry.name}" if relative else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(path)
+                    stack.append(path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((path, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                continue
+    return files, dirs
+
+
+class BackupStore:
+    def __init__(self, root):
+        self.root = root
+        self.chunks_folder = os.path.join(root, "chunks")
+        os.makedirs(self.chunks_folder, exist_ok=True)
+        # garbage collection waits until no backup is adding chunks
+        self._writers = 0
+        self._idle = threading.Condition()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        with self._idle:
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._writers -= 1
+                self._idle.notify_all()
+
+    def _chunkPath(self, digest):
+        return os.path.join(self.chunks_folder, digest[:2], digest)
+
+    def backup(self, source, manifest_path, previous=None, progress=None, codec=backup_compression.DEFLATE,
+               level=None, threads=None, scanned=None, split_regions=True, throttle=None):
+        """Backs up the source folder and writes the backup's manifest to manifest_path.
+        previous is the manifest of an earlier backup of the same folder; its files are reused
+        when their size and mtime didn't change. New chunks are hashed and compressed with codec
+        on a pool of threads. progress (a backup_progress.Progress) is updated after every chunk.
+        scanned is what scan(source) returned, if the caller already has it. With split_regions, region
+        files are stored chunk by chunk. throttle (a backup_throttle.BackupThrottle) limits reads and sets up
+        the worker threads. Returns the manifest."""
+        started = time.time()
+        files, dirs = scanned or scan(source)
+        if progress is not None:
+            progress.setTotal(sum(size for _, size, _ in files), len(files))
+        if level is None:
+            level = codec.default_level
+        threads = threads or backup_compression.default_threads()
+        initializer = throttle.initWorker if throttle is not None else None
+        with self._writing(), ThreadPoolExecutor(threads, initializer=initializer) as executor:
+            previous_files = {}
+            if previous is not None:
+                previous_files = {entry["path"]: entry for entry in previous["files"]}
+            # None for files that have to be read, the previous entry for those that didn't change
+            plan = []
+            for path, size, mtime_ns in files:
+                entry = previous_files.get(path)
+                if entry is not None and (entry["size"] != size or entry["mtime_ns"] != mtime_ns):
+                    entry = None
+                plan.append(entry)
+
+            def is_region(path):
+                return split_regions and backup_region.is_region_file(path)
+
+            def tasks():
+                for (path, size, _), entry in zip(files, plan):
+                    if entry is None:
+                        full_path = os.path.join(source, *path.split("/"))
+                        if is_region(path):
+                            # one task per region file, which reuses the chunks the previous backup has
+                            yield self._storeRegion, (full_path, previous_files.get(path), codec, level, throttle)
+                            continue
+                        file_codec = backup_compression.STORED if backup_compression.is_compressed_file(path) \
+                            else codec
+                        for offset in backup_compression.piece_offsets(size):
+                            yield self._storePiece, (full_path, offset, file_codec, level, throttle)
+
+            results = backup_compression.ordered_map(executor, _run, tasks(), threads * 4)
+            entries = []
+            skipped = []
+            done = 0
+            files_done = 0
+            stored = 0
+            for (path, size, mtime_ns), entry in zip(files, plan):
+                files_done += 1
+                if entry is None and is_region(path):
+                    try:
+                        chunks, region, read, written = next(results).result()
+                    except OSError as e:
+                        print(e)
+                        print(f"Could not back up {path}. Skipping.")
+                        skipped.append(path)
+                        continue
+                    entry = {"path": path, "size": read, "mtime_ns": mtime_ns, "chunks": chunks}
+                    if region is not None:
+                        entry["region"] = region
+                    stored += written
+                    done += size
+                elif entry is None:
+                    chunks = []
+                    read = 0
+                    failed = False
+                    for _ in backup_compression.piece_offsets(size):
+                        try:
+                            digest, length, written = next(results).result()
+                        except OSError as e:
+                            if not failed:
+                                print(e)
+                                print(f"Could not back up {path}. Skipping.")
+                            failed = True
+                            continue
+                        if length:
+                            chunks.append(digest)
+                            read += length
+                            stored += written
+                        done += length
+                        if progress is not None:
+                            progress.update(done, files_done - 1)
+                    if failed:
+                        skipped.append(path)
+                        continue
+                    entry = {"path": path, "size": read, "mtime_ns": mtime_ns, "chunks": chunks}
+                else:
+                    done += size
+                entries.append(entry)
+                if progress is not None:
+                    progress.update(done, files_done)
+
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "created": started,
+                "size": sum(entry["size"] for entry in entries),
+                "stored": stored,
+                "dirs": dirs,
+                "files": entries,
+                # files that couldn't be read; verification flags the backup as incomplete
+                "skipped": skipped,
+            }
+            write_manifest(manifest_path, manifest)
+        return manifest
+
+    def _storePiece(self, path, offset, codec, level, throttle=None):
+        """Reads one chunk of a file and stores it. Returns (digest, bytes read, bytes newly stored)."""
+        data = backup_compression.read_piece(path, offset, CHUNK_SIZE)
+        if not data:
+            return None, 0, 0  # the file got shorter since it was scanned
+        if throttle is not None:
+            throttle.consume(len(data))
+        digest, written = self._put(data, codec, level)
+        return digest, len(data), written
+
+    def _storeRegion(self, path, previous, codec, level, throttle=None):
+        """Reads a region file and stores its header and the chunks that changed since the previous backup
+        (previous is the file's entry in it, if any); unchanged chunks keep their id without a lookup. Returns (chunks, region, bytes read, bytes newly
+        stored); region is None if the file isn't a valid region file and was stored in plain chunks."""
+        with open(path, "rb") as file:
+            data = file.read()
+        if throttle is not None:
+            throttle.consume(len(data))
+        try:
+            header, region_chunks = backup_region.parse(data)
+        except backup_region.RegionError:
+            chunks = []
+            written = 0
+            for offset in range(0, len(data), CHUNK_SIZE):
+                digest, stored = self._put(data[offset:offset + CHUNK_SIZE], backup_compression.STORED)
+                chunks.append(digest)
+                written += stored
+            return chunks, None, len(data), written
+
+        # chunk index -> chunk id of every chunk in the previous backup of this file
+        known = {}
+        if previous is not None and "region" in previous:
+            for (index, _, _, _, _), digest in zip(previous["region"], previous["chunks"][1:]):
+                known[index] = digest
+        digest, written = self._put(header, codec, level)
+        chunks = [digest]
+        region = []
+        for index, offset, sectors, timestamp, payload in region_chunks:
+            # hashed even when its timestamp didn't change: a chunk saved twice within a second keeps it
+            digest = hashlib.sha256(payload).hexdigest()
+            if digest != known.get(index):
+                # chunk data is already compressed by the game
+                digest, stored = self._put(payload, backup_compression.STORED, digest=digest)
+                written += stored
+            chunks.append(digest)
+            region.append([index, offset, sectors, timestamp, len(payload)])
+        return chunks, region, len(data), written
+
+    def _put(self, data, codec=backup_compression.DEFLATE, level=None, digest=None):
+        """Stores one chunk unless it is already there. digest is the data's SHA-256, if the caller has it.
+        Returns (digest, bytes written)."""
+        if digest is None:
+            digest = hashlib.sha256(data).hexdigest()
+        path = self._chunkPath(digest)
+        if os.path.exists(path):
+            return digest, 0
+        payload = codec.compress(data, codec.default_level if level is None else level)
+        if len(payload) >= len(data):
+            # didn't compress: keep it as it is
+            codec, payload = backup_compression.STORED, data
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(bytes((codec.id,)))
+            file.write(payload)
+        os.replace(temp_path, path)
+        return digest, len(payload) + 1
+
+    def readChunk(self, digest) -> bytes:
+        with open(self._chunkPath(digest), "rb") as file:
+            data = file.read()
+        return backup_compression.CODECS_BY_ID[data[0]].decompress(data[1:])
+
+    def iterFile(self, entry, start=0):
+        """Yields the content of a manifest file entry chunk by chunk, from byte start on. Chunks before
+        start aren't read."""
+        if "region" in entry:
+            chunks = [(offset, sectors, digest)
+                      for (_, offset, sectors, _, _), digest in zip(entry["region"], entry["chunks"][1:])]
+            yield from backup_region.rebuild(self.readChunk(entry["chunks"][0]), chunks, entry["size"],
+                                             self.readChunk, start)
+            return
+        # every chunk but the last is CHUNK_SIZE bytes
+        first = start // CHUNK_SIZE
+        for number, digest in enumerate(entry["chunks"][first:], first):
+            data = self.readChunk(digest)
+            yield data[start - number * CHUNK_SIZE:] if number == first and start else data
+
+    def restore(self, manifest, target):
+        """Recreates the backed up folder inside target (which should be empty)."""
+        for path in manifest["dirs"]:
+            os.makedirs(os.path.join(target, *path.split("/")), exist_ok=True)
+        for entry in manifest["files"]:
+            path = os.path.join(target, *entry["path"].split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                for data in self.iterFile(entry):
+                    file.write(data)
+            # keep the original mtime so the next backup recognizes the file as unchanged
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+    def manifestPaths(self):
+        """Every manifest that may refer to this store: those in the folders next to it."""
+        parent = os.path.dirname(self.root)
+        paths = []
+        for folder in os.scandir(parent):
+            if not folder.is_dir() or folder.path == self.root:
+                continue
+            try:
+                paths.extend(entry.path for entry in os.scandir(folder.path)
+                             if entry.name.endswith(MANIFEST_SUFFIX) and entry.is_file())
+            except OSError:
+                continue
+        return paths
+
+    def collect(self):
+        """Deletes chunks that no manifest refers to anymore. Returns (chunks deleted, bytes freed)."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._writers == 0)
+            live = set()
+            for path in self.manifestPaths():
+                # a manifest that can't be read might still need its chunks, so don't delete anything
+                for entry in load_manifest(path)["files"]:
+                    live.update(entry["chunks"])
+            deleted = 0
+            freed = 0
+            for folder in os.scandir(self.chunks_folder):
+                if not folder.is_dir():
+                    continue
+                for chunk in os.scandir(folder.path):
+                    if chunk.name in live:
+                        continue
+                    freed += chunk.stat().st_size
+                    os.remove(chunk.path)
+                    deleted += 1
+        return deleted, freed
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(root) -> BackupStore:
+    """Returns the store at root, shared by every server backing up into it."""
+    root = os.path.abspath(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = BackupStore(root)
+        return _stores[root]
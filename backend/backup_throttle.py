@@ -0,0 +1,174 @@
+"""Limits on what backups take from the server they back up.
+
+Backups read the whole server folder while the server is running, and the disk and CPU time
+they take show up as lag. A BackupThrottle is handed to the backup writers like a progress
+object: every piece they read first takes its size from a token bucket, so reads stay under
+"max_mb_per_second" from the backup settings, and their worker threads run with the lowest
+CPU and I/O priority. When the server prints "Can't keep up!", the backup slows down to
+LAG_MB_PER_SECOND (or pauses, with "on_lag": "pause") until the server has not complained
+for LAG_COOLDOWN seconds.
+"""
+import math
+import os
+import threading
+import time
+
+import psutil
+
+BURST_SECONDS = 1.0
+LAG_COOLDOWN = 30
+LAG_MB_PER_SECOND = 4
+# a backup never waits longer than this in total for a lagging server, so it can't hold up the others forever
+MAX_PAUSE_SECONDS = 600
+PAUSE_STEP = 0.5
+ON_LAG = ("slow", "pause", "ignore")
+
+
+class TokenBucket:
+    """Lets at most bytes_per_second through on average, with bursts of up to BURST_SECONDS worth.
+    Safe to share between threads; each consume() waits for its own share."""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.tokens = bytes_per_second * BURST_SECONDS
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        capacity = self.bytes_per_second * BURST_SECONDS
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.bytes_per_second)
+        self.updated = now
+
+    def setRate(self, bytes_per_second):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.bytes_per_second = bytes_per_second
+
+    def consume(self, amount) -> float:
+        """Takes amount tokens, waiting until they are there. Returns the seconds waited."""
+        with self._lock:
+            self._refill(time.monotonic())
+            # tokens may go negative: this caller waits for them, the next one waits behind it
+            self.tokens -= amount
+            wait = -self.tokens / self.bytes_per_second if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+def lower_priority():
+    """Gives the calling thread the lowest CPU priority and the lowest best-effort I/O priority.
+    Linux sets both per thread; elsewhere this does nothing."""
+    thread_id = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, thread_id, 19)
+    except (AttributeError, OSError):
+        pass
+    if hasattr(psutil, "IOPRIO_CLASS_BE"):
+        try:
+            psutil.Process(thread_id).ionice(psutil.IOPRIO_CLASS_BE, 7)
+        except (psutil.Error, OSError, ValueError):
+            pass
+
+
+def mb_per_second(backup_settings, key, default=None):
+    """A rate setting as a float (default if it isn't set). Raises ValueError if it isn't a number or is negative."""
+    value = backup_settings.get(key)
+    if value is None:
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"\"{key}\" must be a number of MB per second, not {value!r}.")
+    if value < 0:
+        raise ValueError(f"\"{key}\" can't be negative.")
+    return value
+
+
+def validate_settings(backup_settings):
+    """Raises ValueError if the throttling settings in backup_settings can't be used.
+    Rates given as strings ("20") are converted to numbers in place."""
+    for key in ("max_mb_per_second", "verify_mb_per_second"):
+        if backup_settings.get(key) is not None:
+            backup_settings[key] = mb_per_second(backup_settings, key)
+    if not isinstance(backup_settings.get("low_priority", True), bool):
+        raise ValueError("\"low_priority\" must be true or false.")
+    if backup_settings.get("on_lag", "slow") not in ON_LAG:
+        raise ValueError(f"Invalid \"on_lag\": {backup_settings['on_lag']}. Use {', '.join(ON_LAG)}.")
+
+
+class BackupThrottle:
+    def __init__(self, bytes_per_second=None, low_priority=True, on_lag="slow"):
+        """bytes_per_second of None or 0 doesn't limit reads, unless the server lags."""
+        self.bytes_per_second = bytes_per_second or None
+        self.low_priority = low_priority
+        self.on_lag = on_lag
+        self.lagged_at = None
+        self.lag_warnings = 0
+        self.waited = 0.0
+        self.paused = 0.0
+        self._bucket = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fromSettings(cls, backup_settings):
+        max_mb_per_second = mb_per_second(backup_settings, "max_mb_per_second")
+        return cls(max_mb_per_second * 1024 * 1024 if max_mb_per_second else None,
+                   backup_settings.get("low_priority", True), backup_settings.get("on_lag", "slow"))
+
+    def initWorker(self):
+        """Run on every thread that reads for the backup (as a thread pool initializer)."""
+        if self.low_priority:
+            lower_priority()
+
+    def serverLagging(self):
+        """Called when the server prints "Can't keep up!"."""
+        if self.on_lag == "ignore":
+            return
+        with self._lock:
+            if not self.isLagging():
+                print(f"Server can't keep up, {'pausing' if self.on_lag == 'pause' else 'slowing down'} the backup.")
+            self.lagged_at = time.monotonic()
+            self.lag_warnings += 1
+
+    def isLagging(self) -> bool:
+        return self.lagged_at is not None and time.monotonic() - self.lagged_at < LAG_COOLDOWN
+
+    def limit(self):
+        """The current read limit in bytes per second: None for none, 0 while paused."""
+        if not self.isLagging():
+            return self.bytes_per_second
+        if self.on_lag == "pause" and self.paused < MAX_PAUSE_SECONDS:
+            return 0
+        lag_rate = LAG_MB_PER_SECOND * 1024 * 1024
+        return min(self.bytes_per_second or math.inf, lag_rate)
+
+    def consume(self, amount):
+        """Waits until amount bytes may be read."""
+        limit = self.limit()
+        while limit == 0:
+            time.sleep(PAUSE_STEP)
+            with self._lock:
+                self.paused += PAUSE_STEP
+                self.waited += PAUSE_STEP
+            limit = self.limit()
+        if limit is None:
+            return
+        with self._lock:
+            if self._bucket is None:
+                self._bucket = TokenBucket(limit)
+            elif self._bucket.bytes_per_second != limit:
+                self._bucket.setRate(limit)
+            bucket = self._bucket
+        waited = bucket.consume(amount)
+        with self._lock:
+            self.waited += waited
+
+    def toJson(self):
+        limit = self.limit()
+        return {
+            "limitMbPerSecond": round(limit / (1024 * 1024), 2) if limit is not None else None,
+            "lagging": self.isLagging(),
+            "lagWarnings": self.lag_warnings,
+            "throttledSeconds": round(self.waited, 1),
+        }
@@ -0,0 +1,171 @@
+"""Checking that backups can still be read, long before anyone needs to restore one.
+
+Every backup carries checksums: a dedup manifest names every chunk by its SHA-256, and zip
+and snapshot backups get a checksum file with the SHA-256 of every file, written in
+<backup folder>/.checksums. A background thread re-reads each new backup (and every backup
+again after REVERIFY_DAYS) at a limited rate and with the lowest CPU and I/O priority, checks the
+zip CRCs and the hashes, and records the result with the backup in the backup catalogue:
+its status ("ok", "corrupt", "incomplete" or "unverified"), when it was checked, how many bytes
+were read and the error.
+
+"incomplete" means the backup is readable but some files couldn't be read while it was made;
+"unverified" means there is nothing to check against (a snapshot made before checksums existed).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+
+import backup_throttle
+
+CHECKSUMS_FOLDER = ".checksums"
+READ_BLOCK = 1024 * 1024
+CHECK_INTERVAL = 60
+REVERIFY_DAYS = 7
+# default read rate of the verifier, so it doesn't slow down the servers
+DEFAULT_MB_PER_SECOND = 25
+
+
+class VerifyError(Exception):
+    pass
+
+
+def checksums_path(backup_folder, backup_name):
+    return os.path.join(backup_folder, CHECKSUMS_FOLDER, backup_name + ".json")
+
+
+def write_checksums(backup_folder, backup_name, checksums):
+    """Writes {"files": {path: SHA-256}, "skipped": [paths]} for a zip or snapshot backup. Snapshots add
+    "mtimes" (see backup_snapshot)."""
+    path = checksums_path(backup_folder, backup_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(checksums, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def load_checksums(backup_folder, backup_name):
+    """Returns the checksums of a backup, or None if it has none."""
+    try:
+        with open(checksums_path(backup_folder, backup_name), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def hash_file(path, throttle=None) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(READ_BLOCK):
+            sha256.update(block)
+            if throttle is not None:
+                throttle.consume(len(block))
+    return sha256.hexdigest()
+
+
+def verify_manifest(store, manifest, throttle=None) -> int:
+    """Reads every chunk a dedup manifest refers to and checks its hash. Returns the bytes checked."""
+    checked = set()
+    total = 0
+    for entry in manifest["files"]:
+        for digest in entry["chunks"]:
+            if digest in checked:
+                continue
+            try:
+                data = store.readChunk(digest)
+            except OSError as e:
+                raise VerifyError(f"{entry['path']}: chunk {digest} can't be read ({e})")
+            except Exception as e:
+                # whatever the codec raises for damaged data
+                raise VerifyError(f"{entry['path']}: chunk {digest} can't be decompressed ({e})")
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise VerifyError(f"{entry['path']}: chunk {digest} is damaged")
+            checked.add(digest)
+            total += len(data)
+            if throttle is not None:
+                throttle.consume(len(data))
+    return total
+
+
+def verify_zip(path, checksums=None, throttle=None) -> int:
+    """Reads every file in a zip backup, which checks its CRC, and compares it with the checksums
+    if there are any. Returns the bytes checked."""
+    total = 0
+    expected = dict(checksums["files"]) if checksums is not None else None
+    try:
+        with zipfile.ZipFile(path) as zipf:
+            for info in zipf.infolist():
+                if info.is_dir():
+                    continue
+                sha256 = hashlib.sha256()
+                # zipfile checks the CRC when the entry has been read to the end
+                with zipf.open(info) as source:
+                    while block := source.read(READ_BLOCK):
+                        sha256.update(block)
+                        total += len(block)
+                        if throttle is not None:
+                            throttle.consume(len(block))
+                if expected is not None:
+                    name = info.filename.replace("\\", "/")
+                    if name in expected and expected.pop(name) != sha256.hexdigest():
+                        raise VerifyError(f"{name} doesn't match its checksum")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, OSError) as e:
+        raise VerifyError(str(e))
+    if expected:
+        raise VerifyError(f"{len(expected)} files are missing, like {next(iter(expected))}")
+    return total
+
+
+def verify_snapshot(folder, checksums, throttle=None) -> int:
+    """Hashes every file of a snapshot and compares it with the checksums. Returns the bytes checked."""
+    total = 0
+    for path, checksum in checksums["files"].items():
+        full_path = os.path.join(folder, *path.split("/"))
+        try:
+            if hash_file(full_path, throttle) != checksum:
+                raise VerifyError(f"{path} doesn't match its checksum")
+            total += os.path.getsize(full_path)
+        except OSError as e:
+            raise VerifyError(f"{path} can't be read ({e})")
+    return total
+
+
+class BackupVerifier:
+    def __init__(self, get_servers):
+        self.get_servers = get_servers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="backup-verifier")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        backup_throttle.lower_priority()
+        while True:
+            for server in list(self.get_servers()):
+                try:
+                    self.verifyDue(server)
+                except Exception as e:
+                    print(e)
+                    print(f"Could not verify the backups of {server.name}.")
+            time.sleep(CHECK_INTERVAL)
+
+    def verifyDue(self, server):
+        """Verifies the backups of a server that were never verified or not for REVERIFY_DAYS, newest first."""
+        for name in server.getBackupsToVerify(time.time() - REVERIFY_DAYS * 24 * 3600):
+            server.verifyBackup(name)
+
+
+_verifier = None
+
+
+def start(get_servers):
+    """Starts the verifier thread once. get_servers returns the current list of servers."""
+    global _verifier
+    if _verifier is None:
+        _verifier = BackupVerifier(get_servers)
+        _verifier.start()
+    return _verifier
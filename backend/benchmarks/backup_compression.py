@@ -0,0 +1,185 @@
+"""Measures backup throughput per codec and thread count.
+
+Generates a synthetic server folder (region files with zlib-compressed chunks, gzipped
+player data, mod jars, plus logs, configs and stats that compress well) and backs it up
+with the old serial zipfile writer, then as a zip and into a fresh dedup store for every
+available codec and thread count.
+Pass --world to use a real server folder instead.
+
+Usage: python backend/benchmarks/backup_compression.py [--size-mb 512] [--threads 1,2,4,8] [--world path]
+"""
+import argparse
+import gzip
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup_compression
+import backup_store
+
+SECTOR = 4096
+WORDS = ["minecraft:stone", "minecraft:dirt", "minecraft:oak_log", "Palette", "BlockStates", "Heightmaps",
+         "Status", "full", "xPos", "zPos", "LastUpdate", "InhabitedTime", "sections", "biomes"]
+
+
+def nbt_like(rng, size):
+    """Text that compresses about as well as real chunk NBT (5-10x)."""
+    parts = []
+    length = 0
+    while length < size:
+        part = f"{rng.choice(WORDS)}:{rng.randint(0, 4096)};"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts).encode()[:size]
+
+
+def write_region(path, rng, chunks):
+    header = bytearray(2 * SECTOR)
+    body = bytearray()
+    for index in range(chunks):
+        data = zlib.compress(nbt_like(rng, rng.randint(20000, 60000)))
+        payload = len(data).to_bytes(4, "big") + b"\x02" + data
+        sectors = -(-len(payload) // SECTOR)
+        offset = 2 + len(body) // SECTOR
+        header[index * 4:index * 4 + 4] = ((offset << 8) | sectors).to_bytes(4, "big")
+        body += payload + bytes(sectors * SECTOR - len(payload))
+    with open(path, "wb") as file:
+        file.write(header + body)
+
+
+def generate_world(folder, size_mb):
+    rng = random.Random(1)
+    budget = size_mb * 1024 * 1024
+    region_folder = os.path.join(folder, "world", "region")
+    os.makedirs(region_folder)
+    os.makedirs(os.path.join(folder, "world", "playerdata"))
+    os.makedirs(os.path.join(folder, "world", "stats"))
+    os.makedirs(os.path.join(folder, "mods"))
+    os.makedirs(os.path.join(folder, "logs"))
+    os.makedirs(os.path.join(folder, "config"))
+
+    written = 0
+    index = 0
+    # ~60% region files
+    while written < budget * 0.6:
+        path = os.path.join(region_folder, f"r.{index % 32}.{index // 32}.mca")
+        write_region(path, rng, rng.randint(100, 400))
+        written += os.path.getsize(path)
+        index += 1
+    # ~15% mod jars
+    index = 0
+    while written < budget * 0.75:
+        path = os.path.join(folder, "mods", f"mod-{index}.jar")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as jar:
+            for entry in range(50):
+                jar.writestr(f"assets/mod{index}/textures/{entry}.png", rng.randbytes(rng.randint(1000, 60000)))
+                jar.writestr(f"com/example/mod{index}/Class{entry}.class", nbt_like(rng, 8000))
+        written += os.path.getsize(path)
+        index += 1
+    # the rest compresses well: logs, configs, stats, player data
+    index = 0
+    while written < budget:
+        kind = index % 4
+        if kind == 0:
+            path = os.path.join(folder, "logs", f"debug-{index}.log")
+            data = "".join(f"[12:00:{i % 60:02}] [Server thread/INFO]: Preparing spawn area: {i % 100}%\n"
+                           for i in range(40000)).encode()
+        elif kind == 1:
+            path = os.path.join(folder, "config", f"mod{index}-common.toml")
+            data = "".join(f"# option {i}\noption{i} = {rng.randint(0, 100)}\n" for i in range(20000)).encode()
+        elif kind == 2:
+            path = os.path.join(folder, "world", "stats", f"{index:08x}.json")
+            data = ("{" + ",".join(f'"minecraft:{rng.choice(WORDS)}{i}":{rng.randint(0, 9999)}'
+                                   for i in range(30000)) + "}").encode()
+        else:
+            path = os.path.join(folder, "world", "playerdata", f"{index:08x}.dat")
+            data = gzip.compress(nbt_like(rng, 200000))
+        with open(path, "wb") as file:
+            file.write(data)
+        written += len(data)
+        index += 1
+    return written
+
+
+def run_legacy_zip(source, files, scratch):
+    # the serial zipfile writer backups used before, which deflated everything
+    path = os.path.join(scratch, "backup.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for relative, _, _ in files:
+            zipf.write(os.path.join(source, relative), relative)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+def run_zip(source, files, codec, threads, scratch):
+    path = os.path.join(scratch, "backup.zip")
+    backup_compression.write_zip(path, source, files, codec=codec, threads=threads)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+def run_dedup(source, codec, threads, scratch):
+    store_root = os.path.join(scratch, backup_store.STORE_FOLDER)
+    os.makedirs(os.path.join(scratch, "server"))
+    store = backup_store.BackupStore(store_root)
+    manifest = store.backup(source, os.path.join(scratch, "server", "backup" + backup_store.MANIFEST_SUFFIX),
+                            codec=codec, threads=threads)
+    shutil.rmtree(store_root)
+    shutil.rmtree(os.path.join(scratch, "server"))
+    return manifest["stored"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--threads", default=",".join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    parser.add_argument("--world", help="back up this server folder instead of a synthetic one")
+    args = parser.parse_args()
+    thread_counts = [int(n) for n in args.threads.split(",")]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        source = args.world
+        if source is None:
+            source = os.path.join(scratch, "world")
+            print(f"Generating a {args.size_mb} MB synthetic server folder...")
+            generate_world(source, args.size_mb)
+        files, _ = backup_store.scan(source)
+        total = sum(size for _, size, _ in files)
+        print(f"{len(files)} files, {total / (1024 * 1024):.0f} MB "
+              f"(codecs available: {', '.join(backup_compression.available_codecs())})\n")
+        print(f"{'mode':<6} {'codec':<8} {'threads':>7} {'MB/s':>8} {'output MB':>10} {'ratio':>6}")
+
+        runs = [("legacy", backup_compression.DEFLATE),
+                ("zip", backup_compression.STORED), ("zip", backup_compression.DEFLATE)]
+        runs += [("dedup", backup_compression.get_codec(name)) for name in backup_compression.available_codecs()]
+        for mode, codec in runs:
+            for threads in thread_counts:
+                output = os.path.join(scratch, "output")
+                os.makedirs(output)
+                started = time.perf_counter()
+                if mode == "legacy":
+                    if threads != 1:
+                        shutil.rmtree(output)
+                        continue
+                    size = run_legacy_zip(source, files, output)
+                elif mode == "zip":
+                    size = run_zip(source, files, codec, threads, output)
+                else:
+                    size = run_dedup(source, codec, threads, output)
+                elapsed = time.perf_counter() - started
+                shutil.rmtree(output)
+                print(f"{mode:<6} {codec.name:<8} {threads:>7} {total / (1024 * 1024) / elapsed:>8.1f} "
+                      f"{size / (1024 * 1024):>10.1f} {total / size:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Measures how fast the backend ingests a server that floods its console.
+
+Starts a fake server that writes N log lines to stdout as fast as it can, and times how
+long it takes until every line has been parsed and stored in a ConsoleBuffer.
+Run with --legacy to compare against the old readline thread + Queue + spin loop, which
+parsed and stored one line per loop iteration.
+
+Usage: python backend/benchmarks/ingest_throughput.py [--lines 500000] [--legacy]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from queue import Queue, Empty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_parser
+import reactor
+from console_buffer import ConsoleBuffer
+
+FLOODING_SERVER = (
+    "import sys\n"
+    "count = int(sys.argv[1])\n"
+    "lines = [\n"
+    "    '[12:00:00] [Server thread/INFO] [minecraft/MinecraftServer]: <Player{}> anyone got iron?\\n',\n"
+    "    '[12:00:00] [Worker-Main-3/INFO] [minecraft/LoggingChunkStatusListener]: Preparing spawn area: {}%\\n',\n"
+    "    '[12:00:00] [main/WARN] [mixin/]: Reference map \\'mod{}.refmap.json\\' could not be read\\n',\n"
+    "    '\\tat net.minecraft.server.MinecraftServer.tick(MinecraftServer.java:{})\\n',\n"
+    "]\n"
+    "out = sys.stdout\n"
+    "for i in range(count):\n"
+    "    out.write(lines[i % 4].format(i))\n"
+    "out.flush()\n"
+)
+
+
+def spawn(count):
+    return subprocess.Popen([sys.executable, "-c", FLOODING_SERVER, str(count)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def run_reactor(process, console):
+    def on_lines(lines):
+        console.extend([log_parser.parse_line(line).line for line in lines if line])
+
+    channel = reactor.get_reactor().register(process, on_lines)
+    channel.wait_closed()
+
+
+def run_legacy(process, console):
+    # the per-server reader thread + spin loop the reactor replaced
+    def server_read_lines(process, queue):
+        while True:
+            line = process.stdout.readline()
+            if not line and process.poll() is not None:
+                break
+            queue.put(line.decode('utf-8', errors='replace'))
+        queue.put(None)
+
+    qs = Queue()
+    ts = threading.Thread(target=server_read_lines, args=(process, qs))
+    ts.daemon = True
+    ts.start()
+    command_queue = Queue()
+    while True:
+        try:
+            command_queue.get_nowait()
+        except Empty:
+            pass
+        try:
+            line = qs.get_nowait()
+        except Empty:
+            continue
+        if line is None:
+            break
+        line = line.strip()
+        if line:
+            console.append(log_parser.parse_line(line).line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=500000)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    console = ConsoleBuffer()
+    started = time.perf_counter()
+    cpu_before = time.process_time()
+    process = spawn(args.lines)
+    if args.legacy:
+        run_legacy(process, console)
+    else:
+        run_reactor(process, console)
+    process.wait()
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+
+    mode = "legacy readline loop" if args.legacy else "chunked reactor"
+    print(f"{mode}: {console.next_seq} of {args.lines} lines in {wall:.2f}s "
+          f"({console.next_seq / wall:,.0f} lines/s, CPU {cpu:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compares console line parsing throughput before and after log_parser.
+
+Runs the old util.py pipeline (getConsoleTags, getTextAfterTags, didPlayerJoin/Leave/
+GotAchivement, hideIPIfPlayerJoined) and log_parser.parse_line over the same corpus.
+
+By default a corpus resembling a modded server startup plus some play time is generated.
+Pass a recorded log (latest.log or a .log.gz from a server's logs folder) to use that instead.
+
+Usage: python backend/benchmarks/log_parse_throughput.py [--log path/to/latest.log] [--lines 200000]
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_parser
+from util import (getConsoleTags, getTextAfterTags, didPlayerJoin, didPlayerLeave, didPlayerGotAchivement,
+                  hideIPIfPlayerJoined)
+
+
+def generate_corpus(count):
+    random.seed(1)
+    players = [f"Player{i}" for i in range(20)]
+    templates = [
+        "[12:00:{s:02}] [modloading-worker-0/INFO] [net.minecraftforge.common.ForgeMod/FORGE]: Loading mod {n} "
+        "from jar file mods/mod-{n}-1.20.1.jar",
+        "[12:00:{s:02}] [main/INFO] [net.minecraftforge.fml.loading.ModSorter/LOADING]: Found {n} mod requirements",
+        "[12:00:{s:02}] [Worker-Main-{n}/INFO] [minecraft/LoggingChunkStatusListener]: Preparing spawn area: {n}%",
+        "[12:00:{s:02}] [main/WARN] [mixin/]: Reference map 'mod{n}.refmap.json' could not be read",
+        "\tat net.minecraft.server.MinecraftServer.tick(MinecraftServer.java:{n})",
+        "[12:00:{s:02}] [Server thread/INFO] [minecraft/MinecraftServer]: <{p}> anyone got iron? {n}",
+        "[12:00:{s:02}] [Server thread/INFO] [minecraft/MinecraftServer]: {p} joined the game",
+        "[12:00:{s:02}] [Server thread/INFO] [minecraft/MinecraftServer]: {p} left the game",
+        "[12:00:{s:02}] [Server thread/INFO] [minecraft/PlayerList]: {p}[/10.0.{n8}.{n8}:5{n4}] logged in with "
+        "entity id {n} at (1.5, 64.0, -3.5)",
+        "[12:00:{s:02}] [Server thread/INFO] [minecraft/MinecraftServer]: {p} has made the advancement [Stone Age]",
+    ]
+    weights = [40, 10, 20, 15, 10, 3, 1, 1, 1, 1]
+    lines = []
+    for template in random.choices(templates, weights, k=count):
+        lines.append(template.format(s=random.randrange(60), n=random.randrange(1000), n8=random.randrange(256),
+                                     n4=random.randrange(1000, 9999), p=random.choice(players)))
+    return lines
+
+
+def load_log(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as log:
+        return [line.rstrip("\r\n") for line in log]
+
+
+def legacy_parse(line):
+    # what startServerBlocking did for every line before log_parser
+    if "Server thread/INFO" in getConsoleTags(line):
+        text_after_tags = getTextAfterTags(line)
+        if didPlayerJoin(text_after_tags):
+            didPlayerJoin(text_after_tags)
+            didPlayerJoin(text_after_tags)
+        if didPlayerLeave(text_after_tags):
+            didPlayerLeave(text_after_tags)
+            didPlayerLeave(text_after_tags)
+        if didPlayerGotAchivement(text_after_tags) is not None:
+            didPlayerGotAchivement(text_after_tags)
+    return hideIPIfPlayerJoined(line)
+
+
+def measure(name, func, lines):
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+    elapsed = time.perf_counter() - start
+    rate = len(lines) / elapsed
+    print(f"{name:>10}: {len(lines)} lines in {elapsed:.3f}s = {rate:,.0f} lines/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", help="recorded log file to use as the corpus")
+    parser.add_argument("--lines", type=int, default=200000)
+    args = parser.parse_args()
+
+    lines = load_log(args.log) if args.log else generate_corpus(args.lines)
+    before = measure("util.py", legacy_parse, lines)
+    after = measure("log_parser", log_parser.parse_line, lines)
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Measures reading the metadata of a mod pack whose jars the mod cache has never seen.
+
+Generates a pack of Forge, NeoForge, Fabric, Quilt, Bukkit and Paper jars with as many class files as
+real mods have, then reads all of them with 1, 2, 4 and 8 worker processes (whatever
+mod_cache.POOL_THRESHOLD says, to see where the pool starts to pay off) and finally lists them
+through a cold ModCache, as the first GET /mods/list after installing the pack does.
+
+Usage: python backend/benchmarks/mod_extract.py [--jars 400] [--workers 1,2,4,8]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mod_cache
+
+FORGE_TOML = """modLoader="javafml"
+loaderVersion="[47,)"
+license="MIT"
+[[mods]]
+modId="{id}"
+version="${{file.jarVersion}}"
+displayName="{name}"
+authors="{author}"
+description='''
+A generated mod.
+'''
+[[dependencies.{id}]]
+modId="forge"
+mandatory=true
+versionRange="[47,)"
+ordering="NONE"
+side="BOTH"
+[[dependencies.{id}]]
+modId="minecraft"
+mandatory=true
+versionRange="[1.20.1,1.21)"
+ordering="NONE"
+side="BOTH"
+"""
+NEOFORGE_TOML = FORGE_TOML.replace("mandatory=true", 'type="required"').replace('"forge"', '"neoforge"')
+PLUGIN_YML = """name: {name}
+version: '1.{index}'
+main: com.example.{id}.Main
+api-version: '1.20'
+authors: [{author}, helper]
+depend: [Vault]
+softdepend:
+  - LuckPerms
+  - PlaceholderAPI
+commands:
+  {id}:
+    description: Does things
+    usage: /{id}
+"""
+PAPER_PLUGIN_YML = """name: {name}
+version: '1.{index}'
+main: com.example.{id}.Main
+api-version: '1.20'
+authors: [{author}]
+dependencies:
+  server:
+    Vault:
+      load: BEFORE
+      required: true
+"""
+
+
+def metadata(kind, index):
+    mod_id = f"{kind}mod{index}"
+    values = {"id": mod_id, "name": f"Generated {kind.title()} Mod {index}", "author": f"author{index % 37}",
+              "index": index}
+    if kind == "forge":
+        return {"META-INF/mods.toml": FORGE_TOML.format(**values),
+                "META-INF/MANIFEST.MF": f"Manifest-Version: 1.0\nImplementation-Version: 1.{index}.0\n"}
+    if kind == "neoforge":
+        return {"META-INF/neoforge.mods.toml": NEOFORGE_TOML.format(**values),
+                "META-INF/MANIFEST.MF": f"Manifest-Version: 1.0\nImplementation-Version: 1.{index}.0\n"}
+    if kind == "fabric":
+        return {"fabric.mod.json": json.dumps({
+            "schemaVersion": 1, "id": mod_id, "version": f"1.{index}.0", "name": values["name"],
+            "authors": [values["author"], {"name": "helper"}], "environment": "*",
+            "entrypoints": {"main": [f"com.example.{mod_id}.Main"]},
+            "depends": {"fabricloader": ">=0.14", "minecraft": "~1.20.1", "fabric-api": "*"},
+            "suggests": {"modmenu": "*"}}, indent=2)}
+    if kind == "quilt":
+        return {"quilt.mod.json": json.dumps({
+            "schema_version": 1, "quilt_loader": {
+                "group": "com.example", "id": mod_id, "version": f"1.{index}.0",
+                "metadata": {"name": values["name"], "contributors": {values["author"]: "Owner"}},
+                "depends": ["quilt_loader", {"id": "minecraft", "versions": ">=1.20"}]}}, indent=2)}
+    if kind == "paper":
+        return {"paper-plugin.yml": PAPER_PLUGIN_YML.format(**values)}
+    return {"plugin.yml": PLUGIN_YML.format(**values)}
+
+
+def write_jar(path, kind, index, rng):
+    """A jar with its metadata and a few hundred to a few thousand class files, like real mods.
+    As in jars built by Gradle, the manifest comes first and the metadata after the classes."""
+    files = metadata(kind, index)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as jar:
+        if "META-INF/MANIFEST.MF" in files:
+            jar.writestr("META-INF/MANIFEST.MF", files.pop("META-INF/MANIFEST.MF"))
+        package = f"com/example/{kind}mod{index}"
+        for class_index in range(int(rng.lognormvariate(6, 0.8))):
+            jar.writestr(f"{package}/sub{class_index % 23}/Class{class_index}.class",
+                         rng.randbytes(rng.randint(200, 3000)))
+        for asset_index in range(rng.randint(5, 60)):
+            jar.writestr(f"assets/{kind}mod{index}/textures/item/item{asset_index}.png", rng.randbytes(300))
+        for name, data in files.items():
+            jar.writestr(name, data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jars", type=int, default=400)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        mods_folder = os.path.join(scratch, "mods")
+        os.makedirs(mods_folder)
+        print(f"Generating {args.jars} jars...")
+        kinds = ("forge", "neoforge", "fabric", "quilt", "bukkit", "paper")
+        for index in range(args.jars):
+            kind = kinds[index % len(kinds)]
+            write_jar(os.path.join(mods_folder, f"{kind}-{index}.jar"), kind, index, rng)
+        paths = sorted(os.path.join(mods_folder, name) for name in os.listdir(mods_folder))
+        size = sum(os.path.getsize(path) for path in paths)
+        print(f"{size / (1024 * 1024):.0f} MB of jars, {os.cpu_count()} cores\n")
+
+        print(f"{'workers':>7} {'start s':>8} {'read s':>7} {'jars/s':>8}")
+        threshold = mod_cache.POOL_THRESHOLD
+        mod_cache.POOL_THRESHOLD = 0
+        for workers in [int(value) for value in args.workers.split(",")]:
+            # starting the pool is paid once per process lifetime, so it is timed on its own
+            started = time.perf_counter()
+            if workers > 1:
+                mod_cache._get_pool(workers).submit(int).result()
+            start_time = time.perf_counter() - started
+            started = time.perf_counter()
+            infos = list(mod_cache.read_infos(paths, workers))
+            elapsed = time.perf_counter() - started
+            print(f"{workers:>7} {start_time:>8.2f} {elapsed:>7.2f} {len(infos) / elapsed:>8.0f}")
+        mod_cache.POOL_THRESHOLD = threshold
+
+        # what a user waits for: the first listing, including starting the pool
+        if mod_cache._pool is not None:
+            mod_cache._pool.shutdown()
+            mod_cache._pool = None
+        cache = mod_cache.ModCache(os.path.join(scratch, "cache.json"))
+        started = time.perf_counter()
+        listed = cache.list(mods_folder)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        cache.list(mods_folder)
+        warm = time.perf_counter() - started
+        named = sum(1 for name, info in listed if info["name"] != name)
+        workers = mod_cache.default_workers() if len(listed) >= threshold else 1
+        print(f"\nCold listing with {workers} workers: {cold:.2f} s, "
+              f"then {warm * 1000:.1f} ms from the cache. {named} of {len(listed)} jars named from their metadata.")
+
+
+if __name__ == '__main__':
+    main()
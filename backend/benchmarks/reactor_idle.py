@@ -0,0 +1,98 @@
+"""Measures the CPU the backend burns while N idle servers are running.
+
+Starts N fake servers that print a line now and then and otherwise wait on stdin,
+and reports the CPU time used by this process over the measurement window.
+Run with --legacy to compare against the old readline thread + busy loop per server.
+
+Usage: python backend/benchmarks/reactor_idle.py [--servers 12] [--seconds 10] [--legacy]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from queue import Queue, Empty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reactor
+
+FAKE_SERVER = (
+    "import sys, time\n"
+    "print('[00:00:00] [Server thread/INFO]: Done (1.0s)! For help, type \"help\"', flush=True)\n"
+    "while True:\n"
+    "    time.sleep(2)\n"
+    "    print('[00:00:00] [Server thread/INFO]: tick', flush=True)\n"
+)
+
+
+def spawn():
+    return subprocess.Popen([sys.executable, "-c", FAKE_SERVER],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def legacy_loop(process, console):
+    # the per-server reader thread + spin loop this reactor replaced
+    def server_read_lines(process, queue):
+        while True:
+            line = process.stdout.readline()
+            if not line and process.poll() is not None:
+                break
+            queue.put(line.decode('utf-8', errors='replace'))
+
+    qs = Queue()
+    ts = threading.Thread(target=server_read_lines, args=(process, qs))
+    ts.daemon = True
+    ts.start()
+    command_queue = Queue()
+    while process.poll() is None:
+        try:
+            command_queue.get_nowait()
+        except Empty:
+            pass
+        try:
+            line = qs.get_nowait()
+        except Empty:
+            pass
+        else:
+            console.append(line.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", type=int, default=12)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    console = []
+    processes = [spawn() for _ in range(args.servers)]
+    if args.legacy:
+        for process in processes:
+            thread = threading.Thread(target=legacy_loop, args=(process, console))
+            thread.daemon = True
+            thread.start()
+    else:
+        io = reactor.get_reactor()
+        for process in processes:
+            io.register(process, console.extend)
+
+    time.sleep(1)  # let everything settle
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+    time.sleep(args.seconds)
+    cpu = time.process_time() - cpu_before
+    wall = time.perf_counter() - wall_before
+
+    for process in processes:
+        process.kill()
+        process.wait()
+
+    mode = "legacy spin loop" if args.legacy else "shared reactor"
+    print(f"{mode}: {args.servers} servers, {len(console)} lines, "
+          f"CPU {cpu:.3f}s over {wall:.1f}s wall ({100 * cpu / wall:.1f}% of one core)")
+
+
+if __name__ == '__main__':
+    main()
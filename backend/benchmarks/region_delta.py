@@ -0,0 +1,132 @@
+"""Measures incremental backups of a world where players changed a few chunks.
+
+Generates region files full of zlib-compressed chunks, backs them up once, then rewrites
+a few chunks in some of the region files (as the game does when players walk around) and
+backs up again: as a full zip, into the dedup store in plain 1 MiB chunks, and into the
+dedup store split along the region files' own chunks.
+
+Usage: python backend/benchmarks/region_delta.py [--regions 64] [--touched 0.25] [--chunks 16]
+"""
+import argparse
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup_compression
+import backup_region
+import backup_store
+
+SECTOR = backup_region.SECTOR
+# compressing every chunk separately makes generating the world take minutes, so chunks are drawn
+# from a pool of compressed NBT-like blobs and made unique by a random tail
+PALETTE = b";".join(f"minecraft:block_{i % 97}|Palette|BlockStates|Heightmaps".encode() for i in range(400))
+POOL = [zlib.compress(random.Random(seed).randbytes(1500 + seed * 20) + PALETTE) for seed in range(256)]
+
+
+def chunk_payload(rng):
+    compressed = rng.choice(POOL) + rng.randbytes(16)
+    return struct.pack(">IB", len(compressed) + 1, 2) + compressed
+
+
+def write_region(path, rng, timestamp):
+    locations = [0] * backup_region.CHUNKS
+    body = bytearray()
+    for index in range(backup_region.CHUNKS):
+        payload = chunk_payload(rng)
+        sectors = -(-len(payload) // SECTOR)
+        locations[index] = ((2 + len(body) // SECTOR) << 8) | sectors
+        body += payload + bytes(sectors * SECTOR - len(payload))
+    with open(path, "wb") as file:
+        file.write(struct.pack(">1024I", *locations))
+        file.write(struct.pack(">1024I", *[timestamp] * backup_region.CHUNKS))
+        file.write(body)
+
+
+def touch_chunks(path, rng, count, timestamp):
+    """Saves count chunks again like the game: in place if the new data fits, else at the end of the file."""
+    with open(path, "r+b") as file:
+        header = bytearray(file.read(backup_region.HEADER_SIZE))
+        file.seek(0, os.SEEK_END)
+        end_sector = file.tell() // SECTOR
+        for index in rng.sample(range(backup_region.CHUNKS), count):
+            payload = chunk_payload(rng)
+            sectors = -(-len(payload) // SECTOR)
+            offset, old_sectors = struct.unpack_from(">I", header, index * 4)[0] >> 8, header[index * 4 + 3]
+            if sectors > old_sectors:
+                offset = end_sector
+                end_sector += sectors
+            file.seek(offset * SECTOR)
+            file.write(payload + bytes(sectors * SECTOR - len(payload)))
+            struct.pack_into(">I", header, index * 4, (offset << 8) | sectors)
+            struct.pack_into(">I", header, SECTOR + index * 4, timestamp)
+        file.seek(0)
+        file.write(header)
+
+
+def backup(mode, source, scratch, name, previous):
+    started = time.perf_counter()
+    if mode == "zip":
+        path = os.path.join(scratch, name + ".zip")
+        backup_compression.write_zip(path, source, backup_store.scan(source)[0])
+        return time.perf_counter() - started, os.path.getsize(path), None
+    store = backup_store.BackupStore(os.path.join(scratch, mode, backup_store.STORE_FOLDER))
+    os.makedirs(os.path.join(scratch, mode, "server"), exist_ok=True)
+    manifest = store.backup(source, os.path.join(scratch, mode, "server", name + backup_store.MANIFEST_SUFFIX),
+                            previous=previous, split_regions=mode == "regions")
+    return time.perf_counter() - started, manifest["stored"], manifest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regions", type=int, default=64)
+    parser.add_argument("--touched", type=float, default=0.25, help="share of region files players visited")
+    parser.add_argument("--chunks", type=int, default=16, help="chunks saved again in each visited region file")
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        source = os.path.join(scratch, "world")
+        region_folder = os.path.join(source, "world", "region")
+        os.makedirs(region_folder)
+        print(f"Generating {args.regions} region files...")
+        for index in range(args.regions):
+            write_region(os.path.join(region_folder, f"r.{index % 8}.{index // 8}.mca"), rng, 1700000000)
+        total = sum(size for _, size, _ in backup_store.scan(source)[0])
+        print(f"{total / (1024 * 1024):.0f} MB of region files\n")
+
+        first = {mode: backup(mode, source, scratch, "first", None) for mode in ("zip", "plain", "regions")}
+        visited = rng.sample(os.listdir(region_folder), max(1, int(args.regions * args.touched)))
+        for name in visited:
+            touch_chunks(os.path.join(region_folder, name), rng, args.chunks, 1700003600)
+        print(f"Saved {args.chunks} chunks again in {len(visited)} region files.\n")
+
+        print(f"{'mode':<8} {'full s':>7} {'full MB':>8} {'delta s':>8} {'delta MB':>9}")
+        for mode, (elapsed, size, manifest) in first.items():
+            delta_elapsed, delta_size, _ = backup(mode, source, scratch, "second", manifest)
+            print(f"{mode:<8} {elapsed:>7.2f} {size / (1024 * 1024):>8.1f} {delta_elapsed:>8.2f} "
+                  f"{delta_size / (1024 * 1024):>9.2f}")
+
+        # the region-aware store must give back the world as it is now: the same tables and chunk data
+        # (the sectors chunks moved out of are zeros instead of stale data)
+        store = backup_store.BackupStore(os.path.join(scratch, "regions", backup_store.STORE_FOLDER))
+        restored = os.path.join(scratch, "restored")
+        store.restore(backup_store.load_manifest(os.path.join(scratch, "regions", "server", "second"
+                                                              + backup_store.MANIFEST_SUFFIX)), restored)
+        for path, size, _ in backup_store.scan(source)[0]:
+            with open(os.path.join(source, path), "rb") as a, open(os.path.join(restored, path), "rb") as b:
+                original, copy = a.read(), b.read()
+            assert len(copy) == size and backup_region.parse(original) == backup_region.parse(copy), \
+                f"{path} was not restored correctly"
+        print("\nRestored region files hold the same chunks as the originals.")
+        shutil.rmtree(restored)
+
+
+if __name__ == '__main__':
+    main()
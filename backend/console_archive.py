@@ -0,0 +1,219 @@
+"""Persistent, segmented history of a server's console.
+
+Lines are appended to numbered segment files through a buffered writer. Each segment has a
+sparse index (one entry every INDEX_INTERVAL lines: sequence number, time, byte offset), so
+a page of history can be found by seeking instead of reading whole segments.
+
+Full segments are compressed in the background. Every indexed block is compressed as its
+own gzip member, so the index keeps working on the compressed file: a block is found by its
+compressed offset and decompressed on its own.
+
+Files in the archive folder, named after the first sequence number they hold:
+    0000000000000000.log  segment being written (plain text)
+    0000000000000000.gz   compressed segment
+    0000000000000000.idx  sparse index of either
+Each line is stored as "seq<TAB>time<TAB>text".
+"""
+import gzip
+import os
+import threading
+import time
+
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+MAX_SEGMENTS = 64
+INDEX_INTERVAL = 256
+FLUSH_INTERVAL = 1.0
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class ConsoleArchive:
+    def __init__(self, folder, segment_max_bytes=SEGMENT_MAX_BYTES, max_segments=MAX_SEGMENTS):
+        self.folder = folder
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._file = None
+        self._index_file = None
+        self._segment = None  # first sequence number of the segment being written
+        self._index = []  # sparse index of the segment being written: [seq, time, offset]
+        self._offset = 0
+        self._lines_since_index = 0
+        self._last_flush = time.monotonic()
+        os.makedirs(folder, exist_ok=True)
+        self.next_seq = self._recover()
+
+    def append(self, seq, line, timestamp=None):
+        """Appends one line. Writes are buffered and flushed at most every FLUSH_INTERVAL seconds."""
+        self.extend(seq, [line], timestamp)
+
+    def extend(self, first_seq, lines, timestamp=None):
+        """Appends consecutive lines starting at first_seq."""
+        if not lines:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if self._file is None or self._offset >= self.segment_max_bytes:
+                self._rotate(first_seq)
+            for i, line in enumerate(lines):
+                seq = first_seq + i
+                if self._lines_since_index == 0:
+                    self._index.append([seq, timestamp, self._offset])
+                    self._index_file.write(f"{seq} {timestamp:.3f} {self._offset}\n".encode("utf-8"))
+                data = f"{seq}\t{timestamp:.3f}\t{line}\n".encode("utf-8", errors="replace")
+                self._file.write(data)
+                self._offset += len(data)
+                self._lines_since_index = (self._lines_since_index + 1) % INDEX_INTERVAL
+            self.next_seq = first_seq + len(lines)
+            if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index_file.flush()
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._index_file.close()
+                self._file = None
+                self._index_file = None
+
+    def _rotate(self, first_seq):
+        previous = self._segment
+        self.close()
+        self._segment = first_seq
+        self._index = []
+        self._offset = 0
+        self._lines_since_index = 0
+        self._file = open(self._path(first_seq, ".log"), "ab", buffering=WRITE_BUFFER_SIZE)
+        self._index_file = open(self._path(first_seq, ".idx"), "ab")
+        if previous is not None:
+            thread = threading.Thread(target=self._compress, args=(previous,))
+            thread.daemon = True
+            thread.start()
+        self._prune()
+
+    def _prune(self):
+        segments = self._segments()
+        for first_seq, _ in segments[:max(len(segments) - self.max_segments, 0)]:
+            for ext in (".log", ".gz", ".idx"):
+                try:
+                    os.remove(self._path(first_seq, ext))
+                except FileNotFoundError:
+                    pass
+
+    def _compress(self, first_seq):
+        """Compresses a finished segment block by block and swaps it in for the plain file."""
+        try:
+            index = self._readIndex(first_seq)
+            log_path = self._path(first_seq, ".log")
+            size = os.path.getsize(log_path)
+            new_index = []
+            with open(log_path, "rb") as source, open(self._path(first_seq, ".gz.tmp"), "wb") as target:
+                for i, (seq, timestamp, offset) in enumerate(index):
+                    end = index[i + 1][2] if i + 1 < len(index) else size
+                    source.seek(offset)
+                    new_index.append(f"{seq} {timestamp:.3f} {target.tell()}\n")
+                    target.write(gzip.compress(source.read(end - offset), compresslevel=6))
+            with open(self._path(first_seq, ".idx.tmp"), "w", encoding="utf-8") as index_file:
+                index_file.writelines(new_index)
+            with self._lock:
+                os.replace(self._path(first_seq, ".gz.tmp"), self._path(first_seq, ".gz"))
+                os.replace(self._path(first_seq, ".idx.tmp"), self._path(first_seq, ".idx"))
+                os.remove(log_path)
+        except OSError as e:
+            print(e)
+            print(f"Failed to compress console segment {first_seq}. Leaving it uncompressed.")
+
+    def read(self, before_seq=None, before_time=None, limit=100):
+        """Returns up to limit (seq, time, line) tuples, oldest first, that come right before
+        before_seq and/or before_time. Without either, returns the newest lines."""
+        result = []
+        with self._lock:
+            self.flush()
+            for first_seq, ext in reversed(self._segments()):
+                if before_seq is not None and first_seq >= before_seq:
+                    continue
+                index = self._index if first_seq == self._segment else self._readIndex(first_seq)
+                if before_time is not None and index and index[0][1] >= before_time:
+                    continue
+                for block in range(len(index) - 1, -1, -1):
+                    seq, timestamp, _ = index[block]
+                    if before_seq is not None and seq >= before_seq:
+                        continue
+                    if before_time is not None and timestamp >= before_time:
+                        continue
+                    lines = [entry for entry in self._readBlock(first_seq, ext, index, block)
+                             if (before_seq is None or entry[0] < before_seq)
+                             and (before_time is None or entry[1] < before_time)]
+                    result = lines + result
+                    if len(result) >= limit:
+                        return result[-limit:]
+        return result
+
+    def _readBlock(self, first_seq, ext, index, block):
+        offset = index[block][2]
+        with open(self._path(first_seq, ext), "rb") as segment:
+            segment.seek(offset)
+            if block + 1 < len(index):
+                data = segment.read(index[block + 1][2] - offset)
+            else:
+                data = segment.read()
+        if ext == ".gz":
+            data = gzip.decompress(data)
+        entries = []
+        for raw in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                seq, timestamp, line = raw.split("\t", 2)
+                entries.append((int(seq), float(timestamp), line))
+            except ValueError:
+                pass  # torn last line after a crash
+        return entries
+
+    def _readIndex(self, first_seq):
+        index = []
+        try:
+            with open(self._path(first_seq, ".idx"), "r", encoding="utf-8") as index_file:
+                for entry in index_file:
+                    seq, timestamp, offset = entry.split()
+                    index.append([int(seq), float(timestamp), int(offset)])
+        except FileNotFoundError:
+            pass
+        return index
+
+    def _segments(self):
+        """Returns [(first_seq, ext)] for every segment on disk, oldest first."""
+        segments = []
+        for file in os.listdir(self.folder):
+            name, ext = os.path.splitext(file)
+            if ext in (".log", ".gz") and name.isdigit():
+                segments.append((int(name), ext))
+        return sorted(segments)
+
+    def _path(self, first_seq, ext):
+        return os.path.join(self.folder, f"{first_seq:016d}{ext}")
+
+    def _recover(self):
+        """Finds the next sequence number from the newest segment and compresses the
+        segments a previous run left uncompressed. Returns the next sequence number."""
+        segments = self._segments()
+        next_seq = 0
+        if segments:
+            first_seq, ext = segments[-1]
+            index = self._readIndex(first_seq)
+            next_seq = first_seq
+            if index:
+                entries = self._readBlock(first_seq, ext, index, len(index) - 1)
+                next_seq = entries[-1][0] + 1 if entries else index[-1][0]
+        # appending always starts a new segment, so every plain segment on disk is finished
+        for first_seq, ext in segments:
+            if ext == ".log":
+                thread = threading.Thread(target=self._compress, args=(first_seq,))
+                thread.daemon = True
+                thread.start()
+        return next_seq
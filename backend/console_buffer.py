@@ -0,0 +1,100 @@
+"""Fixed-capacity ring buffer for captured server console output."""
+import threading
+
+DEFAULT_CAPACITY = 2000
+DEFAULT_MAX_LINE_LENGTH = 4096
+
+
+class ConsoleBuffer:
+    """Keeps the most recent console lines, each tagged with a sequence number.
+
+    Sequence numbers increase monotonically (clearing the buffer does not reset them, and
+    start_seq lets them continue from the console archive), so clients can ask for
+    everything after the last line they saw.
+    Memory is hard capped at capacity * max_line_length characters; longer lines are cut.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_line_length=DEFAULT_MAX_LINE_LENGTH, start_seq=0):
+        if capacity < 1:
+            raise ValueError("Console capacity must be at least 1.")
+        self.capacity = capacity
+        self.max_line_length = max_line_length
+        self._lines = [None] * capacity
+        self._first_seq = start_seq  # oldest sequence number still held
+        self._next_seq = start_seq  # sequence number the next appended line gets
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+
+    def append(self, line) -> int:
+        """Adds a line and returns its sequence number."""
+        if len(line) > self.max_line_length:
+            line = line[:self.max_line_length]
+        with self._lock:
+            seq = self._next_seq
+            self._lines[seq % self.capacity] = line
+            self._next_seq += 1
+            if self._next_seq - self._first_seq > self.capacity:
+                self._first_seq = self._next_seq - self.capacity
+            self._appended.notify_all()
+            return seq
+
+    def extend(self, lines) -> int:
+        """Adds lines under a single lock and returns the sequence number of the first one."""
+        max_length = self.max_line_length
+        with self._lock:
+            start = self._next_seq
+            for line in lines:
+                if len(line) > max_length:
+                    line = line[:max_length]
+                self._lines[self._next_seq % self.capacity] = line
+                self._next_seq += 1
+            if self._next_seq - self._first_seq > self.capacity:
+                self._first_seq = self._next_seq - self.capacity
+            self._appended.notify_all()
+            return start
+
+    def clear(self):
+        """Drops every line. Sequence numbers keep counting from where they were."""
+        with self._lock:
+            self._lines = [None] * self.capacity
+            self._first_seq = self._next_seq
+
+    def get(self, since=None, limit=None):
+        """Returns (start_seq, lines, next_seq).
+
+        With since, returns lines with a sequence number >= since (oldest first).
+        Without it, returns the newest lines. limit caps the number of lines returned.
+        If since is older than the oldest line still held, start_seq tells the caller where
+        the returned lines actually begin.
+        """
+        with self._lock:
+            if since is None:
+                start = self._first_seq
+                if limit is not None:
+                    start = max(start, self._next_seq - limit)
+            else:
+                start = min(max(since, self._first_seq), self._next_seq)
+            end = self._next_seq
+            if limit is not None:
+                end = min(end, start + max(limit, 0))
+            lines = [self._lines[seq % self.capacity] for seq in range(start, end)]
+            return start, lines, end
+
+    def wait(self, seq, timeout=None) -> bool:
+        """Waits until a line with sequence number seq (or later) has been appended."""
+        with self._appended:
+            return self._appended.wait_for(lambda: self._next_seq > seq, timeout)
+
+    @property
+    def first_seq(self):
+        return self._first_seq
+
+    @property
+    def next_seq(self):
+        return self._next_seq
+
+    def __len__(self):
+        return self._next_seq - self._first_seq
+
+    def __iter__(self):
+        return iter(self.get()[1])
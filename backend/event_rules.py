@@ -0,0 +1,132 @@
+"""User-defined console event rules, compiled into a single matcher.
+
+A rule maps a regex over the message part of a console line to a named event. Named
+groups in the pattern become the event's fields. Rules are configured per server in
+servers.json under "event_rules":
+
+    "event_rules": [
+        {"name": "boss_killed", "pattern": "(?P<player>\\w+) defeated the (?P<boss>.+)", "notify": true}
+    ]
+
+All rules (plus the built-in ones) are joined into one alternation, so a line is scanned
+once no matter how many rules there are. Numbered backreferences (\\1) are rejected, as
+they would point at another rule's group there; use named groups and (?P=name) instead. Global flags at the start of a pattern,
+like (?i), only apply to that rule.
+"""
+import re
+import threading
+import time
+from collections import Counter, deque
+
+# vanilla death messages all start with the player's name followed by one of these
+DEATH_PATTERN = (
+    r"^(?P<player>\w{3,16}) (?:was |drowned|died|fell |hit the ground|burned|blew up|starved|suffocated|"
+    r"experienced kinetic energy|tried to swim in lava|walked into|went (?:up in flames|off with a bang)|"
+    r"withered away|froze to death|discovered the floor was lava|didn't want to live|left the confines)"
+)
+
+BUILTIN_RULES = [
+    {"name": "player_death", "pattern": DEATH_PATTERN, "notify": True},
+]
+
+GROUP_NAME_PATTERN = re.compile(r"\(\?P<(\w+)>")
+GROUP_REFERENCE_PATTERN = re.compile(r"\(\?P=(\w+)\)")
+GROUP_CONDITION_PATTERN = re.compile(r"\(\?\(([A-Za-z_]\w*)\)")
+GLOBAL_FLAGS_PATTERN = re.compile(r"\(\?([aiLmsux]+)\)")
+# \1 (after an even number of backslashes) or (?(1)...): group numbers change once rules are joined
+NUMBERED_REFERENCE_PATTERN = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(\d+\)")
+HISTORY_SIZE = 1000
+
+
+class EventRule:
+    def __init__(self, name, pattern, notify=False):
+        self.name = name
+        self.pattern = pattern
+        self.notify = notify
+        try:
+            self.fields = list(re.compile(scope_global_flags(pattern)).groupindex)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern for event rule \"{name}\": {e}")
+        if NUMBERED_REFERENCE_PATTERN.search(pattern):
+            raise ValueError(f"Invalid pattern for event rule \"{name}\": numbered backreferences aren't "
+                             f"supported, use a named group and (?P=name)")
+
+    def to_json(self):
+        return {"name": self.name, "pattern": self.pattern, "notify": self.notify}
+
+
+class EventMatcher:
+    """Matches a message against every rule in one regex search."""
+
+    def __init__(self, rules):
+        self.rules = [rule if isinstance(rule, EventRule) else EventRule(**rule) for rule in rules]
+        self._by_group = {}
+        alternatives = []
+        for i, rule in enumerate(self.rules):
+            # give every rule's named groups a unique prefix so they can share one pattern
+            pattern = GROUP_NAME_PATTERN.sub(lambda m: f"(?P<r{i}_{m.group(1)}>", scope_global_flags(rule.pattern))
+            pattern = GROUP_REFERENCE_PATTERN.sub(lambda m: f"(?P=r{i}_{m.group(1)})", pattern)
+            pattern = GROUP_CONDITION_PATTERN.sub(lambda m: f"(?(r{i}_{m.group(1)})", pattern)
+            alternatives.append(f"(?P<rule{i}>{pattern})")
+        try:
+            self._pattern = re.compile("|".join(alternatives)) if alternatives else None
+        except re.error as e:
+            # find the rule that can't be part of the alternation
+            for rule, alternative in zip(self.rules, alternatives):
+                try:
+                    re.compile(alternative)
+                except re.error as rule_error:
+                    raise ValueError(f"Invalid pattern for event rule \"{rule.name}\": {rule_error}")
+            raise ValueError(f"Invalid event rules: {e}")
+        if self._pattern is not None:
+            for i, rule in enumerate(self.rules):
+                self._by_group[self._pattern.groupindex[f"rule{i}"]] = (i, rule)
+
+    def match(self, message):
+        """Returns (rule, fields) for the first rule matching the message, or None."""
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(message)
+        if match is None:
+            return None
+        # the rule's outer group always closes last, so it is the last matched group
+        i, rule = self._by_group[match.lastindex]
+        return rule, {field: match.group(f"r{i}_{field}") for field in rule.fields}
+
+
+def scope_global_flags(pattern):
+    """Turns global flags at the start of a pattern, (?i)joined, into a group, (?i:joined),
+    which is allowed in the middle of the joined pattern."""
+    flags = ""
+    while match := GLOBAL_FLAGS_PATTERN.match(pattern):
+        flags += match.group(1)
+        pattern = pattern[match.end():]
+    if not flags:
+        return pattern
+    # in verbose mode a comment at the end would hide the closing parenthesis
+    return f"(?{flags}:{pattern}{chr(10) if 'x' in flags else ''})"
+
+
+class EventHistory:
+    """Bounded history of matched events, with counts per event name."""
+
+    def __init__(self, size=HISTORY_SIZE):
+        self._events = deque(maxlen=size)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def add(self, name, fields, line):
+        with self._lock:
+            event = {"id": self._next_id, "time": time.time(), "name": name, "fields": fields, "line": line}
+            self._events.append(event)
+            self._next_id += 1
+            self.counts[name] += 1
+            return event
+
+    def get(self, since=None, name=None, limit=100):
+        """Returns events with an id >= since (oldest first), or the newest ones without since."""
+        with self._lock:
+            events = [event for event in self._events
+                      if (since is None or event["id"] >= since) and (name is None or event["name"] == name)]
+        return events[:limit] if since is not None else events[-limit:]
@@ -0,0 +1,80 @@
+"""Fan-out of server events to Server-Sent Events subscribers."""
+import json
+import threading
+from collections import deque
+
+DEFAULT_MAX_PENDING = 256
+
+# sent to a subscriber that fell too far behind; the client should refetch state over REST
+RESYNC = b"event: resync\ndata: {}\n\n"
+KEEPALIVE = b": keepalive\n\n"
+
+
+def format_event(event, data) -> bytes:
+    """Serializes an event once into its SSE wire format."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    """One connected client. Holds a bounded queue of already-serialized events."""
+
+    def __init__(self, topics, max_pending=DEFAULT_MAX_PENDING):
+        self.topics = set(topics)
+        self.max_pending = max_pending
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._overflowed = False
+
+    def offer(self, payload):
+        """Never blocks. A subscriber that can't keep up loses its queue and is told to resync."""
+        with self._cond:
+            if self._overflowed:
+                return
+            if len(self._queue) >= self.max_pending:
+                self._queue.clear()
+                self._overflowed = True
+            else:
+                self._queue.append(payload)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the next payload, or None if nothing arrived before the timeout."""
+        with self._cond:
+            if not self._queue and not self._overflowed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return RESYNC
+            if self._queue:
+                return self._queue.popleft()
+            return None
+
+
+class EventBroadcaster:
+    """Publishes events for one server to every subscriber interested in the topic."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics, max_pending=DEFAULT_MAX_PENDING) -> Subscriber:
+        subscriber = Subscriber(topics, max_pending)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+
+    def hasSubscribers(self, topic) -> bool:
+        return any(topic in s.topics for s in self._subscribers)
+
+    def publish(self, topic, data):
+        # the subscriber list is copy-on-write, so it can be read without the lock
+        subscribers = [s for s in self._subscribers if topic in s.topics]
+        if not subscribers:
+            return
+        payload = format_event(topic, data)
+        for subscriber in subscribers:
+            subscriber.offer(payload)
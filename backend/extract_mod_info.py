@@ -1,19 +1,27 @@
-import zipfile
 import os
 import json
 import toml
 import mod_helper
 import difflib
+from jar_reader import JarReader
+
+
+# in order of priority for jars that have several; each loader's own file wins over one it also reads
+METADATA_FILES = ['mcmod.info', 'quilt.mod.json', 'fabric.mod.json', 'META-INF/neoforge.mods.toml',
+                  'META-INF/mods.toml', "paper-plugin.yml", "plugin.yml"]
+# the loader each metadata file belongs to
+LOADERS = {'mcmod.info': "forge", 'fabric.mod.json': "fabric", 'quilt.mod.json': "quilt", 'META-INF/mods.toml': "forge",
+           'META-INF/neoforge.mods.toml': "neoforge", "paper-plugin.yml": "paper", "plugin.yml": "bukkit"}
+# looked up once per central directory record
+METADATA_PRIORITIES = {file.encode(): priority for priority, file in enumerate(METADATA_FILES)}
+MANIFEST_PRIORITIES = {b'META-INF/MANIFEST.MF': 0}
 
 
 def extract_mod_metadata(jar_path):
-    metadata_files = ['mcmod.info', 'fabric.mod.json', 'META-INF/mods.toml', "plugin.yml"]
-    
-    with zipfile.ZipFile(jar_path, 'r') as jar:
-        for file in metadata_files:
-            if file in jar.namelist():
-                with jar.open(file) as meta_file:
-                    return [file, meta_file.read()]
+    with JarReader(jar_path) as jar:
+        entry = jar.find(METADATA_PRIORITIES)
+        if entry is not None:
+            return [entry.name.decode(), jar.read(entry)]
     return None
 
 def read_fabric_json(data):
@@ -44,6 +52,149 @@ def read_plugin_yml(data):
         if line.startswith("name:"):
             return line.removeprefix("name:").strip()
 
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return list(value)
+
+def read_fabric_info(data):
+    parsed_json = json.loads(data, strict=False)
+    authors = [author["name"] if isinstance(author, dict) else author for author in parsed_json.get('authors', [])]
+    dependencies = [{"id": mod_id, "required": True} for mod_id in parsed_json.get('depends', {})]
+    for key in ('recommends', 'suggests'):
+        dependencies += [{"id": mod_id, "required": False} for mod_id in parsed_json.get(key, {})]
+    return {"name": parsed_json.get('name'), "id": parsed_json.get('id'), "version": parsed_json.get('version'),
+            "authors": authors, "dependencies": dependencies}
+
+def read_forge_info(data):
+    parsed_toml = toml.loads(data)
+    mod = parsed_toml["mods"][0]
+    dependencies = []
+    for dependency in parsed_toml.get("dependencies", {}).get(mod.get("modId"), []):
+        # "mandatory" before Forge 1.20.5, "type" since, and in NeoForge
+        required = dependency.get("mandatory", dependency.get("type", "required") == "required")
+        dependencies.append({"id": dependency.get("modId"), "required": bool(required)})
+    return {"name": mod.get("displayName"), "id": mod.get("modId"), "version": mod.get("version"),
+            "authors": _as_list(mod.get("authors")), "dependencies": dependencies}
+
+def read_mcmod_info(data):
+    parsed_json = json.loads(data, strict=False)
+    # a list of mods, or {"modList": [...]} in version 2 of the format
+    mods = parsed_json.get("modList", []) if isinstance(parsed_json, dict) else parsed_json
+    mod = mods[0]
+    dependencies = [{"id": mod_id, "required": True} for mod_id in mod.get("requiredMods", [])]
+    dependencies += [{"id": mod_id, "required": False} for mod_id in mod.get("dependencies", [])
+                     if mod_id not in mod.get("requiredMods", [])]
+    return {"name": mod.get("name"), "id": mod.get("modid"), "version": mod.get("version"),
+            "authors": _as_list(mod.get("authorList", mod.get("authors"))), "dependencies": dependencies}
+
+def read_quilt_info(data):
+    parsed_json = json.loads(data, strict=False)
+    loader = parsed_json.get('quilt_loader', {})
+    metadata = loader.get('metadata', {})
+    # contributors maps names to roles
+    authors = list(metadata.get('contributors', {}))
+    dependencies = []
+    for dependency in loader.get('depends', []):
+        if isinstance(dependency, str):
+            dependencies.append({"id": dependency, "required": True})
+        elif isinstance(dependency, dict):
+            dependencies.append({"id": dependency.get('id'), "required": not dependency.get('optional', False)})
+    return {"name": metadata.get('name'), "id": loader.get('id'), "version": loader.get('version'),
+            "authors": authors, "dependencies": dependencies}
+
+def _yml_scalar(value):
+    if value[:1] in ("'", '"') and value.find(value[0], 1) > 0:
+        return value[1:value.find(value[0], 1)]
+    if " #" in value:
+        value = value.split(" #", 1)[0].rstrip()
+    if value.startswith("[") and value.endswith("]"):
+        return [_yml_scalar(item.strip()) for item in value[1:-1].split(",") if item.strip()]
+    if value in ("true", "false"):
+        return value == "true"
+    return value.strip("'\"")
+
+def read_yml(data):
+    """Reads the part of YAML that plugin.yml and paper-plugin.yml use: nested maps of scalars,
+    lists of scalars and [inline, lists]. Block scalars (description: |) are skipped."""
+    root = {}
+    stack = [(-1, root)]  # (indent of the key that opened the container, container)
+    pending = None  # (indent, map, key) of a key whose value is on the next lines
+    skip_indent = None
+    for line in data.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if skip_indent is not None:
+            if indent > skip_indent:
+                continue
+            skip_indent = None
+        item = stripped == "-" or stripped.startswith("- ")
+        if pending is not None and (indent > pending[0] or (item and indent == pending[0])):
+            container = [] if item else {}
+            pending[1][pending[2]] = container
+            stack.append((pending[0], container))
+        pending = None
+        # a list item may sit at the indent of its key; anything else at that indent closes the container
+        while indent < stack[-1][0] or (indent == stack[-1][0] and not item):
+            stack.pop()
+        container = stack[-1][1]
+        if item:
+            if isinstance(container, list):
+                container.append(_yml_scalar(stripped[1:].strip()))
+            continue
+        if ":" not in stripped or not isinstance(container, dict):
+            continue
+        key, value = stripped.split(":", 1)
+        key, value = key.strip().strip("'\""), value.strip()
+        if value == "":
+            container[key] = None
+            pending = (indent, container, key)
+        elif value[0] in "|>":
+            container[key] = None
+            skip_indent = indent
+        else:
+            container[key] = _yml_scalar(value)
+    return root
+
+def read_plugin_info(data):
+    values = read_yml(data)
+    authors = _as_list(values.get("authors")) or _as_list(values.get("author"))
+    dependencies = [{"id": name, "required": True} for name in _as_list(values.get("depend"))]
+    dependencies += [{"id": name, "required": False} for name in _as_list(values.get("softdepend"))]
+    return {"name": values.get("name"), "id": values.get("name"), "version": values.get("version"),
+            "authors": authors, "dependencies": dependencies}
+
+def read_paper_plugin_info(data):
+    info = read_plugin_info(data)
+    # dependencies: {server: {Name: {load, required}}, bootstrap: {...}}, required unless it says otherwise
+    dependencies = read_yml(data).get("dependencies")
+    if isinstance(dependencies, dict):
+        for section in ("server", "bootstrap"):
+            plugins = dependencies.get(section)
+            if not isinstance(plugins, dict):
+                continue
+            for name, options in plugins.items():
+                required = options.get("required", True) if isinstance(options, dict) else True
+                if all(dependency["id"] != name for dependency in info["dependencies"]):
+                    info["dependencies"].append({"id": name, "required": bool(required)})
+    return info
+
+METADATA_READERS = {'mcmod.info': read_mcmod_info, 'fabric.mod.json': read_fabric_info,
+                    'quilt.mod.json': read_quilt_info, 'META-INF/mods.toml': read_forge_info,
+                    'META-INF/neoforge.mods.toml': read_forge_info, "paper-plugin.yml": read_paper_plugin_info,
+                    "plugin.yml": read_plugin_info}
+
+def read_manifest_version(data):
+    """The Implementation-Version of a META-INF/MANIFEST.MF, which "${file.jarVersion}" in mods.toml refers to."""
+    for line in data.splitlines():
+        if line.startswith("Implementation-Version:"):
+            return line.removeprefix("Implementation-Version:").strip()
+    return None
+
 def match(display_name, authors):
     mods = mod_helper.search_curseforge_mods(display_name, limit=50)
     mod_strings = [mod.name for mod in mods]
@@ -73,24 +224,33 @@ def match(display_name, authors):
 
     return bestMatch
 
+def get_mod_info(filepath):
+    """Extracts what the jar's metadata says about the mod:
+    {"name", "id", "version", "authors", "loader", "dependencies": [{"id", "required"}]}.
+    Values the metadata doesn't have are None; the name falls back to the file name."""
+    info = {"name": None, "id": None, "version": None, "authors": [], "loader": None, "dependencies": []}
+    with JarReader(filepath) as jar:
+        entry = jar.find(METADATA_PRIORITIES)
+        if entry is not None:
+            file = entry.name.decode()
+            info.update(METADATA_READERS[file](jar.read(entry).decode('utf-8', errors='replace')))
+            info["loader"] = LOADERS[file]
+            # NeoForge before 1.20.5 read META-INF/mods.toml too
+            if file == 'META-INF/mods.toml' and any(dependency["id"] == "neoforge"
+                                                    for dependency in info["dependencies"]):
+                info["loader"] = "neoforge"
+            if info["version"] and "${" in info["version"]:
+                manifest = jar.find(MANIFEST_PRIORITIES)
+                if manifest is not None:
+                    info["version"] = read_manifest_version(
+                        jar.read(manifest).decode('utf-8', errors='replace')) or info["version"]
+    if not info["name"]:
+        info["name"] = os.path.split(filepath)[1]
+    return info
+
 def get_mod_name(filepath):
     """Extracts mod name from jar file by looking for mod metadata files."""
-    name = os.path.split(filepath)[1]
-    metadata = extract_mod_metadata(filepath)
-    if metadata is None:
-        return name
-    file_read = os.path.split(metadata[0])[1]
-    if file_read == "mods.toml":
-        data = metadata[1].decode('utf-8')
-        name = read_forge_toml(data)[0]
-        return name
-    elif file_read == 'fabric.mod.json':
-        data = metadata[1].decode('utf-8')
-        name = read_fabric_json(data)[0]
-    elif file_read == "plugin.yml":
-        data = metadata[1].decode('utf-8')
-        name = read_plugin_yml(data)
-    return name
+    return get_mod_info(filepath)["name"]
 
 if __name__ == '__main__':
     SERVER_FOLDER = "J:\\MinecraftServers\\Test\\mods\\dungeonsweaponry-1.16.2-1.20.1.jar"
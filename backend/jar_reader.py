@@ -0,0 +1,179 @@
+"""Reads single entries of a jar without loading its whole listing.
+
+zipfile.ZipFile builds a ZipInfo object for every entry of the central directory before
+anything can be read, which for mods with tens of thousands of classes is most of the
+time spent reading their metadata. JarReader only finds the end of central directory
+record (zip64 included), walks the central directory records in place, looking each name up
+once in a dict of the wanted names and their priority, and reads and inflates the one entry
+that wins. The file is memory-mapped where possible and read with seeks otherwise.
+"""
+import mmap
+import struct
+import zipfile
+import zlib
+
+END_RECORD = struct.Struct("<IHHHHIIH")
+ZIP64_END_LOCATOR = struct.Struct("<IIQI")
+ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+END_SIGNATURE = b"PK\x05\x06"
+ZIP64_END_SIGNATURE = b"PK\x06\x06"
+CENTRAL_SIGNATURE = 0x02014b50
+# the end record is followed by a comment of at most 65535 bytes
+MAX_TAIL = END_RECORD.size + 0xFFFF
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+
+class JarEntry:
+    __slots__ = ("name", "method", "flags", "compressed_size", "size", "offset")
+
+    def __init__(self, name, method, flags, compressed_size, size, offset):
+        self.name = name
+        self.method = method
+        self.flags = flags
+        self.compressed_size = compressed_size
+        self.size = size
+        self.offset = offset
+
+
+class JarReader:
+    """An open jar. Raises zipfile.BadZipFile for files that aren't zips or are cut short."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._map = None  # an empty file, or a filesystem that can't map
+        try:
+            self._size = self._file.seek(0, 2)
+            self._findCentralDirectory()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _read(self, offset, length) -> bytes:
+        if offset < 0 or length < 0 or offset + length > self._size:
+            raise zipfile.BadZipFile(f"{self.path}: record outside the file")
+        if self._map is not None:
+            return self._map[offset:offset + length]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def _findCentralDirectory(self):
+        tail_start = max(self._size - MAX_TAIL, 0)
+        tail = self._read(tail_start, self._size - tail_start)
+        end = tail.rfind(END_SIGNATURE)
+        if end < 0 or end + END_RECORD.size > len(tail):
+            raise zipfile.BadZipFile(f"{self.path} is not a zip file")
+        _, _, _, _, count, cd_size, cd_offset, _ = END_RECORD.unpack_from(tail, end)
+        # the central directory ends where the end record, or the zip64 end record, starts
+        directory_end = tail_start + end
+        locator = end - ZIP64_END_LOCATOR.size
+        if locator >= 0 and tail[locator:locator + 4] == b"PK\x06\x07":
+            _, _, directory_end, _ = ZIP64_END_LOCATOR.unpack_from(tail, locator)
+            if not self._isZip64EndRecord(directory_end):
+                # data prepended to the archive moved it: it is the last one before the locator
+                # (not necessarily right before it, the record may have an extensible data sector)
+                directory_end = tail_start + tail.rfind(ZIP64_END_SIGNATURE, 0, locator)
+                if not self._isZip64EndRecord(directory_end):
+                    raise zipfile.BadZipFile(f"{self.path}: bad zip64 end record")
+            record = ZIP64_END_RECORD.unpack(self._read(directory_end, ZIP64_END_RECORD.size))
+            count, cd_size, cd_offset = record[7], record[8], record[9]
+        # data prepended to the archive (self-extracting jars) shifts every offset by the same amount
+        self._shift = directory_end - cd_size - cd_offset
+        if self._shift < 0:
+            raise zipfile.BadZipFile(f"{self.path}: bad central directory offset")
+        self._cd_offset = cd_offset + self._shift
+        self._cd_size = cd_size
+        self.count = count
+
+    def _isZip64EndRecord(self, offset) -> bool:
+        return 0 <= offset <= self._size - ZIP64_END_RECORD.size \
+            and self._read(offset, 4) == ZIP64_END_SIGNATURE
+
+    def find(self, priorities):
+        """Returns the entry whose name comes first in priorities, a dict of names (bytes) to their
+        priority (0 first), or None if the jar has none of them. The central directory is walked to
+        the end unless an entry with priority 0 turns up."""
+        if self._cd_offset + self._cd_size > self._size:
+            raise zipfile.BadZipFile(f"{self.path}: central directory outside the file")
+        if self._map is not None:
+            # records are unpacked from the map in place, only names are copied
+            directory, position = self._map, self._cd_offset
+        else:
+            directory, position = self._read(self._cd_offset, self._cd_size), 0
+        stop = position + self._cd_size
+        header_size = CENTRAL_HEADER.size
+        best = None
+        best_priority = None
+        while position + header_size <= stop:
+            (signature, _, _, flags, method, _, _, _, compressed_size, size, name_length, extra_length,
+             comment_length, _, _, _, offset) = CENTRAL_HEADER.unpack_from(directory, position)
+            if signature != CENTRAL_SIGNATURE:
+                raise zipfile.BadZipFile(f"{self.path}: bad central directory")
+            name_start = position + header_size
+            name = directory[name_start:name_start + name_length]
+            priority = priorities.get(name)
+            if priority is not None and (best is None or priority < best_priority):
+                extra = directory[name_start + name_length:name_start + name_length + extra_length]
+                compressed_size, size, offset = _zip64_values(extra, compressed_size, size, offset)
+                best = JarEntry(name, method, flags, compressed_size, size, offset + self._shift)
+                best_priority = priority
+                if priority == 0:
+                    break
+            position = name_start + name_length + extra_length + comment_length
+        return best
+
+    def read(self, entry) -> bytes:
+        """Reads and inflates an entry found by find()."""
+        if entry.flags & 0x1:
+            raise zipfile.BadZipFile(f"{self.path}: {entry.name.decode('utf-8', 'replace')} is encrypted")
+        header = self._read(entry.offset, LOCAL_HEADER.size)
+        signature, _, _, _, _, _, _, _, _, name_length, extra_length = LOCAL_HEADER.unpack(header)
+        if signature != 0x04034b50:
+            raise zipfile.BadZipFile(f"{self.path}: bad local header")
+        data = self._read(entry.offset + LOCAL_HEADER.size + name_length + extra_length, entry.compressed_size)
+        if entry.method == ZIP_STORED:
+            return data
+        if entry.method == ZIP_DEFLATED:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+        # bzip2, lzma: rare enough in jars to leave to zipfile
+        with zipfile.ZipFile(self.path) as jar:
+            return jar.read(entry.name.decode("utf-8"))
+
+
+def _zip64_values(extra, compressed_size, size, offset):
+    """Takes the sizes and offset that don't fit in 32 bits from the zip64 extra field."""
+    if 0xFFFFFFFF not in (compressed_size, size, offset):
+        return compressed_size, size, offset
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, position)
+        if header_id == 1:
+            values = list(struct.unpack_from(f"<{length // 8}Q", extra, position + 4))
+            # only the values that didn't fit are there, in this order
+            if size == 0xFFFFFFFF and values:
+                size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF and values:
+                compressed_size = values.pop(0)
+            if offset == 0xFFFFFFFF and values:
+                offset = values.pop(0)
+            break
+        position += 4 + length
+    return compressed_size, size, offset
@@ -0,0 +1,138 @@
+"""Single-pass parser for Minecraft server console lines.
+
+Each line is tokenized once into a LogRecord and classified against one combined
+precompiled pattern, instead of scanning it again for every kind of event.
+
+Handles the header formats of the servers ProtonMC installs:
+    Vanilla/Spigot  [12:34:56] [Server thread/INFO]: message
+    Paper           [12:34:56 INFO]: message
+    Forge           [12:34:56] [Server thread/INFO] [minecraft/DedicatedServer]: message
+    NeoForge        [18Oct2026 12:34:56.789] [Server thread/INFO] [net.minecraft.server.MinecraftServer/]: message
+    Fabric          [12:34:56] [Server thread/INFO] (Minecraft) message
+"""
+import re
+
+from util import IPV4_PATTERN, hideIPAddresses
+
+PLAYER_JOIN = "player_join"
+PLAYER_LEAVE = "player_leave"
+PLAYER_ACHIEVEMENT = "player_achievement"
+PLAYER_LOGIN = "player_login"
+
+LINE_PATTERN = re.compile(
+    r'\[(?P<timestamp>[^\]]+?)(?: (?P<short_level>[A-Z]+))?\]'
+    r'(?: \[(?P<thread>[^\]]*)/(?P<level>[A-Z]+)\])?'
+    r'(?: \[(?P<logger>[^\]]*)\]| \((?P<paren_logger>[^)]*)\))?'
+    r':? (?P<message>.*)'
+)
+
+EVENT_PATTERN = re.compile(
+    r'(?P<join>\S+) joined the game$'
+    r'|(?P<leave>\S+) left the game$'
+    r'|(?P<achiever>\S+) (?:has made the advancement|has completed the challenge|has reached the goal) '
+    r'\[(?P<advancement>.*)\]$'
+    r'|(?P<login>\S*)\[/' + IPV4_PATTERN + r':\d+\] logged in'
+)
+
+PLAYER_LOG_PATTERN = re.compile(r'\S*\[/' + IPV4_PATTERN + r':.{5}\]')
+
+# "Can't keep up! Is the server overloaded? Running 2034ms or 40 ticks behind", worded differently before 1.13
+OVERLOADED_MESSAGE = re.compile(r"Can't keep up!")
+
+# the answer to a command the server doesn't know, in all its wordings since 1.12
+UNKNOWN_COMMAND_MESSAGE = re.compile(r"Unknown (?:or incomplete )?command")
+
+STARTUP_DONE_MESSAGE = re.compile(r'Done \(\d+(?:[.,]\d+)?s\)! For help, type "help"')
+
+
+class LogRecord:
+    """One parsed console line. Fields that aren't present in the line are None."""
+
+    __slots__ = ("line", "timestamp", "thread", "level", "logger", "message", "event", "event_args")
+
+    def __init__(self, line, timestamp=None, thread=None, level=None, logger=None, message=None,
+                 event=None, event_args=()):
+        self.line = line
+        self.timestamp = timestamp
+        self.thread = thread
+        self.level = level
+        self.logger = logger
+        self.message = line if message is None else message
+        self.event = event
+        self.event_args = event_args
+
+    def __repr__(self):
+        return (f"LogRecord({self.timestamp!r}, {self.thread!r}, {self.level!r}, {self.logger!r}, "
+                f"{self.message!r}, event={self.event!r})")
+
+
+def classify(message):
+    """Returns (event, args) for a server thread message, or (None, ()) if it isn't a known event."""
+    match = EVENT_PATTERN.match(message)
+    if match is None:
+        return None, ()
+    group = match.lastgroup
+    if group == "join":
+        return PLAYER_JOIN, (match.group("join"),)
+    if group == "leave":
+        return PLAYER_LEAVE, (match.group("leave"),)
+    if group == "advancement":
+        return PLAYER_ACHIEVEMENT, (match.group("achiever"), match.group("advancement"))
+    return PLAYER_LOGIN, (match.group("login"),)
+
+
+def split_command_output(lines, marker, count):
+    """Splits the console lines printed after count commands were sent, each followed by the unknown command
+    marker, into the lines of each command. The marker's own error lines are left out, and so is anything
+    after the last one. Returns None if the markers can't be told apart from the output."""
+    echoed = [i for i, line in enumerate(lines) if marker in line]
+    if len(echoed) == count:
+        # "Unknown or incomplete command, see below for error", then the marker followed by "<--[HERE]"
+        boundaries = [(i - 1 if i > 0 and UNKNOWN_COMMAND_MESSAGE.match(parse_line(lines[i - 1]).message) else i, i)
+                      for i in echoed]
+    else:
+        # servers that don't echo unknown commands (Spigot, before 1.13): their error line marks the
+        # boundary, as long as none of the commands printed one too
+        unknown = [i for i, line in enumerate(lines) if UNKNOWN_COMMAND_MESSAGE.match(parse_line(line).message)]
+        if len(unknown) != count:
+            return None
+        boundaries = [(i, i) for i in unknown]
+    outputs = []
+    start = 0
+    for first, last in boundaries:
+        outputs.append(lines[start:first])
+        start = last + 1
+    return outputs
+
+
+def is_server_info(record) -> bool:
+    """True if the record is an INFO line of the server thread, where game events are logged."""
+    return record.level == "INFO" and record.thread in (None, "Server thread")
+
+
+def is_startup_done(record) -> bool:
+    """True if the record is the line a server prints once startup has finished. The logger isn't checked:
+    loaders and their versions name it differently, and a player can't make the server thread log this."""
+    return is_server_info(record) and STARTUP_DONE_MESSAGE.match(record.message) is not None
+
+
+def is_overloaded(record) -> bool:
+    """True if the record is the server's warning that it is falling behind on ticks."""
+    return record.level == "WARN" and OVERLOADED_MESSAGE.match(record.message) is not None
+
+
+def parse_line(line) -> LogRecord:
+    """Parses a console line (without the trailing newline).
+    record.line is the line as it should be shown, with the IP of a logging in player hidden."""
+    match = LINE_PATTERN.match(line)
+    if match is None:
+        record = LogRecord(line)
+    else:
+        timestamp, short_level, thread, level, logger, paren_logger, message = match.groups()
+        record = LogRecord(line, timestamp, thread, level or short_level, logger or paren_logger, message)
+        if is_server_info(record):
+            record.event, record.event_args = classify(message)
+
+    if "[/" in line and len(PLAYER_LOG_PATTERN.findall(line)) == 1:
+        record.line = hideIPAddresses(line)
+    return record
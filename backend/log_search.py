@@ -0,0 +1,289 @@
+"""Searchable index over a server's Minecraft log files.
+
+Lines from logs/*.log.gz and logs/latest.log are parsed with log_parser and stored in a
+per-server SQLite database together with an inverted index (term -> line ids). Archives
+are indexed once; latest.log is indexed from where the previous update stopped. When
+latest.log is rotated into an archive, the lines already indexed are re-attributed to the
+archive instead of being indexed twice. Indexing runs on a background thread that searches
+start, and every archive is committed on its own, so a search never waits for months of
+archives and finds lines as soon as their archive is done.
+"""
+import contextlib
+import datetime
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import log_parser
+
+TERM_PATTERN = re.compile(r"[a-z0-9_]{2,}")
+CHAT_PATTERN = re.compile(r"(?:\[Not Secure\] )?<(\w+)> ")
+ARCHIVE_NAME_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})-\d+\.log\.gz$")
+TIME_OF_DAY_PATTERN = re.compile(r"(?:(\d{2}[A-Za-z]{3}\d{4}) )?(\d{2}):(\d{2}):(\d{2})")
+FINGERPRINT_SIZE = 4096
+LATEST_LOG = "latest.log"
+INSERT_BATCH = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    offset INTEGER,
+    fingerprint TEXT,
+    day TEXT,
+    last_time_of_day INTEGER
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    file TEXT,
+    time REAL,
+    level TEXT,
+    thread TEXT,
+    player TEXT COLLATE NOCASE,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS lines_time ON lines (time);
+CREATE INDEX IF NOT EXISTS lines_player ON lines (player, time);
+CREATE INDEX IF NOT EXISTS lines_file ON lines (file);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT,
+    line_id INTEGER,
+    PRIMARY KEY (term, line_id)
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text):
+    return set(TERM_PATTERN.findall(text.lower()))
+
+
+def get_player(record):
+    if record.event is not None:
+        return record.event_args[0]
+    match = CHAT_PATTERN.match(record.message)
+    if match:
+        return match.group(1)
+    return None
+
+
+class LogSearchIndex:
+    def __init__(self, logs_folder, index_path):
+        self.logs_folder = logs_folder
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._updating = False
+        self._update_again = False
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Yields a connection inside a transaction and closes it afterwards."""
+        db = sqlite3.connect(self.index_path)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def requestUpdate(self):
+        """Starts update() on a background thread and returns right away. If an update is already running,
+        another one follows it, so lines written in the meantime get indexed too."""
+        with self._state_lock:
+            if self._updating:
+                self._update_again = True
+                return
+            self._updating = True
+        thread = threading.Thread(target=self._updateInBackground, name="log-index")
+        thread.daemon = True
+        thread.start()
+
+    def isUpdating(self) -> bool:
+        return self._updating
+
+    def _updateInBackground(self):
+        while True:
+            try:
+                self.update()
+            except Exception as e:
+                # the next search tries again
+                print(e)
+                print("Could not index the server logs.")
+            with self._state_lock:
+                if not self._update_again:
+                    self._updating = False
+                    return
+                self._update_again = False
+
+    def update(self):
+        """Indexes archives that are new and lines appended to latest.log since the last update.
+        Each archive is its own transaction, so searches see it as soon as it is indexed."""
+        if not os.path.isdir(self.logs_folder):
+            return
+        with self._lock:
+            with self._connect() as db:
+                known = {row[0] for row in db.execute("SELECT name FROM files")}
+            archives = sorted(file for file in os.listdir(self.logs_folder)
+                              if ARCHIVE_NAME_PATTERN.match(file) and file not in known)
+            for archive in archives:
+                with self._connect() as db:
+                    self._indexArchive(db, archive)
+            with self._connect() as db:
+                self._indexLatest(db)
+
+    def _indexArchive(self, db, name):
+        path = os.path.join(self.logs_folder, name)
+        year, month, day = ARCHIVE_NAME_PATTERN.match(name).groups()
+        try:
+            with gzip.open(path, "rb") as log:
+                data = log.read()
+        except (OSError, EOFError) as e:
+            print(e)
+            print(f"Could not read log archive {name}. Skipping.")
+            return
+
+        start = 0
+        start_day = datetime.date(int(year), int(month), int(day))
+        last_time_of_day = -1
+        latest = db.execute("SELECT offset, fingerprint, day, last_time_of_day FROM files WHERE name = ?",
+                            (LATEST_LOG,)).fetchone()
+        if latest is not None and latest[1] == self._fingerprint(data):
+            # this archive is the latest.log we were indexing: keep those lines, index the rest
+            db.execute("UPDATE lines SET file = ? WHERE file = ?", (name, LATEST_LOG))
+            db.execute("DELETE FROM files WHERE name = ?", (LATEST_LOG,))
+            start, start_day, last_time_of_day = latest[0], datetime.date.fromisoformat(latest[2]), latest[3]
+
+        day, last_time_of_day = self._insertLines(db, name, data[start:], start_day, last_time_of_day)
+        db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                   (name, len(data), len(data), self._fingerprint(data), day.isoformat(), last_time_of_day))
+
+    def _indexLatest(self, db):
+        path = os.path.join(self.logs_folder, LATEST_LOG)
+        try:
+            size = os.path.getsize(path)
+            with open(path, "rb") as log:
+                fingerprint = self._fingerprint(log.read(FINGERPRINT_SIZE))
+                if fingerprint is None:
+                    return
+                row = db.execute("SELECT offset, fingerprint, day, last_time_of_day FROM files WHERE name = ?",
+                                 (LATEST_LOG,)).fetchone()
+                if row is not None and (row[1] != fingerprint or size < row[0]):
+                    # rotated, and the archive it became isn't there yet: park the old lines under their own name
+                    db.execute("UPDATE lines SET file = ? WHERE file = ?", (f"{LATEST_LOG}@{row[1]}", LATEST_LOG))
+                    row = None
+                if row is None:
+                    offset, last_time_of_day = 0, -1
+                    day = datetime.date.fromtimestamp(os.path.getmtime(path))
+                    log.seek(0)
+                    data = log.read()
+                    day -= datetime.timedelta(days=self._countDayRollovers(data))
+                else:
+                    offset, day, last_time_of_day = row[0], datetime.date.fromisoformat(row[2]), row[3]
+                    log.seek(offset)
+                    data = log.read(size - offset)
+        except FileNotFoundError:
+            return
+
+        # only index whole lines; a partly written last line is picked up next time
+        end = data.rfind(b"\n") + 1
+        day, last_time_of_day = self._insertLines(db, LATEST_LOG, data[:end], day, last_time_of_day)
+        db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                   (LATEST_LOG, size, offset + end, fingerprint, day.isoformat(), last_time_of_day))
+
+    def _insertLines(self, db, file, data, day, last_time_of_day):
+        """Parses and inserts lines. Times only carry hh:mm:ss, so the day is advanced whenever
+        the time of day goes backwards. Returns the day and time of day after the last line."""
+        next_id = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM lines").fetchone()[0]
+        rows = []
+        postings = []
+        current_time = None
+        for raw in data.decode("utf-8", errors="replace").splitlines():
+            record = log_parser.parse_line(raw)
+            match = TIME_OF_DAY_PATTERN.match(record.timestamp or "")
+            if match:
+                full_date, hour, minute, second = match.groups()
+                time_of_day = int(hour) * 3600 + int(minute) * 60 + int(second)
+                if full_date:
+                    day = datetime.datetime.strptime(full_date, "%d%b%Y").date()
+                elif time_of_day < last_time_of_day:
+                    day += datetime.timedelta(days=1)
+                last_time_of_day = time_of_day
+                current_time = datetime.datetime.combine(day, datetime.time()).timestamp() + time_of_day
+            # lines without a timestamp (stack traces) take the time of the line before them
+            rows.append((next_id, file, current_time, record.level, record.thread, get_player(record), record.line))
+            postings.extend((term, next_id) for term in tokenize(record.message))
+            next_id += 1
+            if len(rows) >= INSERT_BATCH:
+                self._flush(db, rows, postings)
+        self._flush(db, rows, postings)
+        return day, last_time_of_day
+
+    @staticmethod
+    def _flush(db, rows, postings):
+        db.executemany("INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)", postings)
+        rows.clear()
+        postings.clear()
+
+    @staticmethod
+    def _countDayRollovers(data):
+        rollovers = 0
+        last_time_of_day = -1
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            match = TIME_OF_DAY_PATTERN.match(line, 1) if line.startswith("[") else None
+            if match is None:
+                continue
+            time_of_day = int(match.group(2)) * 3600 + int(match.group(3)) * 60 + int(match.group(4))
+            if time_of_day < last_time_of_day:
+                rollovers += 1
+            last_time_of_day = time_of_day
+        return rollovers
+
+    @staticmethod
+    def _fingerprint(data):
+        """Identifies a log by its first line, which starts with the time the server started.
+        Returns None until the first line has been written completely."""
+        end = data.find(b"\n", 0, FINGERPRINT_SIZE)
+        if end == -1:
+            return None
+        return hashlib.sha1(data[:end]).hexdigest()
+
+    def search(self, query=None, player=None, level=None, since=None, until=None, before_id=None, limit=100):
+        """Returns matching lines, newest first. Every term in query must appear in the line.
+        Page with before_id set to the id of the last line of the previous page. Only searches what is
+        already indexed and starts indexing anything new in the background (see isUpdating)."""
+        self.requestUpdate()
+        conditions = []
+        params = []
+        for term in tokenize(query or ""):
+            conditions.append("id IN (SELECT line_id FROM postings WHERE term = ?)")
+            params.append(term)
+        if player:
+            conditions.append("player = ?")
+            params.append(player)
+        if level:
+            conditions.append("level = ?")
+            params.append(level.upper())
+        if since is not None:
+            conditions.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("time < ?")
+            params.append(until)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        params.append(limit)
+        with self._connect() as db:
+            rows = db.execute(f"SELECT id, file, time, level, thread, player, text FROM lines {where} "
+                              f"ORDER BY id DESC LIMIT ?", params).fetchall()
+        return [{"id": row[0], "file": row[1], "time": row[2], "level": row[3], "thread": row[4],
+                 "player": row[5], "line": row[6]} for row in rows]
@@ -1,24 +1,43 @@
+import contextlib
 import datetime
 import os
 import platform
 import shutil
+import sqlite3
 import subprocess
 import threading
 import time
+import uuid
 import zipfile
 from enum import Enum
-from queue import Queue, Empty
 from threading import Thread
 
-import progressbar
 import psutil
 
-import extract_mod_info
+from mod_cache import ModCache
 from server_types import ServerType
 import mod_helper
 from notify import ServerEvent, NotifyBot
-from util import *
+import log_parser
 import jdk_installations
+import reactor
+import backup_catalogue
+import backup_store
+import backup_compression
+import backup_download
+import backup_snapshot
+import backup_restore
+import backup_scheduler
+import backup_throttle
+import backup_verify
+import hot_backup
+from backup_progress import Progress
+from rcon import RconClient, RconError
+from console_buffer import ConsoleBuffer, DEFAULT_CAPACITY
+from console_archive import ConsoleArchive
+from event_stream import EventBroadcaster
+from log_search import LogSearchIndex
+from event_rules import EventMatcher, EventHistory, EventRule, BUILTIN_RULES
 
 
 class MCserver:
@@ -28,7 +47,8 @@ class MCserver:
         RUNNING = 2
         CREATING = 3
 
-    def __init__(self, name, server_type, server_location, backup_location, notify_bot=None, game_version=None):
+    def __init__(self, name, server_type, server_location, backup_location, notify_bot=None, game_version=None,
+                 console_max_lines=None, event_rules=None, backup_settings=None):
         self.server_type = server_type
         self.game_version = game_version
         self.server_location = server_location
@@ -44,13 +64,44 @@ class MCserver:
         except FileNotFoundError:
             print(f"Could not find backup folder for server: {name}.")
         self.name = name
-        self.console = []
+        if console_max_lines is None:
+            console_max_lines = DEFAULT_CAPACITY
+        # older console lines are kept on disk; the buffer only holds the most recent ones
+        self.console_archive = ConsoleArchive(os.path.join("cache", "console", name))
+        self.console = ConsoleBuffer(console_max_lines, start_seq=self.console_archive.next_seq)
         self.subprocess = None
         self.backup_thread = None
-        self.backup_progress = 0
-        self.command_queue = Queue()
+        self.backup_progress = Progress()
+        # limits of the running backup, told when the server lags
+        self.backup_throttle = None
+        self.restore_thread = None
+        self.restore_progress = Progress()
+        # {"mode": "dedup" | "snapshot" | "zip", "codec", "level", "threads", "schedule", "retention",
+        # "verify_mb_per_second", "max_mb_per_second", "low_priority", "on_lag"}, stored in servers.json
+        self.backup_settings = backup_settings or {}
+        # index of the backups and their metadata, opened on first use
+        self.catalogue = None
+        self.catalogue_lock = threading.Lock()
+        # whether anyone joined since the last backup started, for schedules with "only_if_players"
+        self.had_players_since_backup = False
+        self.io_channel = None
         self.is_operational = False
+        # time.time() at which startup finished, None while stopped or starting
+        self.operational_since = None
         self.players = []
+        # pushes console lines and status changes to streaming clients
+        self.events = EventBroadcaster()
+        self.log_index = None
+        # metadata of the jars in mods/ or plugins/, read again only when a jar changes
+        self.mod_cache = None
+        # events extracted from the console by the built-in and user-defined rules
+        self.event_history = EventHistory()
+        try:
+            self.setEventRules(event_rules or [])
+        except (ValueError, TypeError) as e:
+            print(e)
+            print(f"Ignoring the event rules of {name}.")
+            self.setEventRules([])
 
         # self.async_create_backup_directory()
 
@@ -78,132 +129,389 @@ class MCserver:
             print("Server is not running")
             return False
         print(command)
-        self.command_queue.put(command)
-        return True
+        return self.io_channel.send(command)
+
+    def runCommands(self, commands, timeout=5.0, quiet_period=0.25):
+        """Runs commands and returns the output attributed to them.
+
+        Uses RCON when it is enabled in server.properties, which gives each command exactly
+        its own output. Otherwise all commands are written to stdin in one flush, each followed
+        by a made-up command whose "unknown command" error marks where its output ends. Console
+        lines are collected until every marker has come back, or the console has been quiet
+        for quiet_period seconds before the first one, or the timeout runs out. If the markers
+        can't be found in the output, per-command output is only known for a single command
+        and "output" is every line printed meanwhile.
+
+        Returns {"method": "rcon" | "console", "results": [{"command", "output"}], "output"}
+        or None if the server is not running.
+        """
+        if not self.isServerRunning():
+            return None
+
+        rcon_settings = self.getRconSettings()
+        if rcon_settings is not None and self.isServerOperational():
+            try:
+                with RconClient(*rcon_settings, timeout=timeout) as client:
+                    responses = client.run(commands)
+                results = [{"command": command, "output": response.splitlines()}
+                           for command, response in zip(commands, responses)]
+                return {"method": "rcon", "results": results, "output": [line for result in results
+                                                                        for line in result["output"]]}
+            except (OSError, RconError) as e:
+                print(e)
+                print("RCON failed, falling back to the console.")
+
+        marker = f"protonmc-end-{uuid.uuid4().hex[:12]}"
+        start = self.console.next_seq
+        if not self.io_channel.send(*[line for command in commands for line in (command, marker)]):
+            return None
+        deadline = time.monotonic() + timeout
+        # wait for the first line of output, then until every marker is back or the console goes quiet
+        seen = start
+        wait = timeout
+        while wait > 0 and self.console.wait(seen, wait):
+            seen = self.console.next_seq
+            _, output, _ = self.console.get(since=start)
+            markers = sum(marker in line for line in output)
+            if markers == len(commands):
+                break
+            # once markers echo, the rest will too: a slow command doesn't end the wait early
+            wait = deadline - time.monotonic() if markers else min(quiet_period, deadline - time.monotonic())
+        _, output, _ = self.console.get(since=start)
+        outputs = log_parser.split_command_output(output, marker, len(commands))
+        if outputs is None:
+            results = [{"command": command, "output": output if len(commands) == 1 else None}
+                       for command in commands]
+            return {"method": "console", "results": results, "output": output}
+        results = [{"command": command, "output": lines} for command, lines in zip(commands, outputs)]
+        return {"method": "console", "results": results, "output": [line for lines in outputs for line in lines]}
+
+    def getRconSettings(self):
+        """Returns (host, port, password) if RCON is enabled in server.properties, else None."""
+        path = os.path.join(self.server_location, "server.properties")
+        properties = {}
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.startswith("#") or "=" not in line:
+                        continue
+                    key, value = line.strip().split("=", 1)
+                    properties[key] = value
+        except FileNotFoundError:
+            return None
+        if properties.get("enable-rcon") != "true" or not properties.get("rcon.password"):
+            return None
+        host = properties.get("server-ip") or "127.0.0.1"
+        return host, int(properties.get("rcon.port") or 25575), properties["rcon.password"]
 
     def getBackupProgress(self) -> list[bool, int]:
-        if self.backup_thread is None:
+        if self.backup_thread is None or not self.backup_thread.is_alive():
             return False, 0
-        if self.backup_thread.is_alive:
-            return True, self.backup_progress
-        return False, 0
-
-    def startBackup(self):
-        self.backup_thread = Thread(target=self.backupBlocking)
-        # self.backup_thread.daemon = True
-        self.backup_thread.start()
-
-    def backupBlocking(self):
-        month = datetime.datetime.now().month
-        day = datetime.datetime.now().day
-        year = datetime.datetime.now().year
-        hour = datetime.datetime.now().hour
-        minute = datetime.datetime.now().minute
-
-        a = self.server_location
-        b = f'{self.backup_location}\\{month}-{day}-{year}_{hour}-{minute}'
-        # os.mkdir(b)
+        return True, self.backup_progress.percentage()
+
+    def startBackup(self, trigger="manual") -> Thread:
+        """Backs up on a new thread. trigger ("manual" or "schedule") is recorded in the catalogue."""
+        thread = Thread(target=self.backupBlocking, args=(trigger,))
+        # thread.daemon = True
+        self.backup_thread = thread
+        thread.start()
+        return thread
 
+    def backupBlocking(self, trigger="manual"):
+        # backups of different servers take turns so they never compete for the disk
+        with backup_scheduler.DISK_LOCK:
+            self.backup_throttle = backup_throttle.BackupThrottle.fromSettings(self.backup_settings)
+            self.backup_progress.start(throttle=self.backup_throttle)
+            try:
+                # a restore may have started while this backup waited for its turn
+                if self.getRestoreProgress()[0]:
+                    raise RuntimeError("A restore is in progress, not backing up a half-restored server folder.")
+                self.backupLocked(trigger)
+            except Exception as e:
+                # reported to the frontend by /backup/progress
+                print(e)
+                print("Failed backup.")
+                self.backup_progress.fail(e)
+            else:
+                self.backup_progress.finish()
+                print("Done backup.")
+            finally:
+                self.backup_thread = None
+                self.backup_throttle = None
+
+    def backupLocked(self, trigger):
+        self.had_players_since_backup = bool(self.players)
+        now = datetime.datetime.now()
+        backup_name = f"{now.month}-{now.day}-{now.year}_{now.hour}-{now.minute}"
+        catalogue = self.getCatalogue()
+        if catalogue.has(backup_name):
+            # a second backup within the same minute
+            backup_name += f"-{now.second}"
+
+        mode = self.getBackupMode()
+        codec = None
+        if mode == "dedup":
+            codec = self.getBackupCompression()[0].name
+        elif mode == "zip":
+            # zip files only have stored and deflate
+            codec = "stored" if self.getBackupCompression()[0] is backup_compression.STORED else "deflate"
+        catalogue.start(backup_name, mode, trigger, codec=codec, game_version=self.game_version,
+                        started=now.timestamp())
         try:
-            self.zip_folder_for_backup(a, self.backup_location, f"{month}-{day}-{year}_{hour}-{minute}.zip")
-        except FileNotFoundError:
-            # TODO: backup errors like this are not communicated to the frontend
-            print("Failed backup: FileNotFoundError")
-            self.backup_thread = None
+            if mode == "zip":
+                with self.frozenServerFolder() as (source, scanned):
+                    stats = self.zip_folder_for_backup(source, self.backup_location, f"{backup_name}.zip",
+                                                       scanned=scanned)
+            elif mode == "snapshot":
+                stats = self.snapshotBackup(backup_name)
+            else:
+                stats = self.dedupBackup(backup_name)
+        except Exception as e:
+            catalogue.fail(backup_name, e)
+            raise
+        catalogue.finish(backup_name, stats["size"], stats["stored"], stats["files"])
+
+    @contextlib.contextmanager
+    def frozenServerFolder(self, is_unchanged=None):
+        """Yields (folder, scan of it) to back up from.
+
+        While the server is running, saving is turned off and the world flushed, the files the
+        backup will read (all of them, or those is_unchanged(path, size, mtime_ns) rejects) are
+        copied into a staging folder and saving is turned back on right away. The backup then
+        reads the staging folder, so saving is only paused for the copy, not the whole backup.
+        """
+        if not self.isServerOperational():
+            yield self.server_location, backup_store.scan(self.server_location)
             return
 
-        # self.copy(a, b)
-        print("Done backup.")
-        self.backup_thread = None
+        staging = os.path.join(self.backup_location, ".staging")
+        paused = time.monotonic()
+        try:
+            if not self.saveAndWait():
+                print("The server did not confirm the save in time. Backing up anyway.")
+            scanned = backup_store.scan(self.server_location)
+            copied, cloned = hot_backup.freeze(self.server_location, staging, *scanned, is_unchanged=is_unchanged)
+        finally:
+            self.runCommand("save-on")
+        print(f"Saving was paused for {time.monotonic() - paused:.1f}s to copy {copied / (1024 * 1024):.1f} MB.")
+        if not cloned and is_unchanged is None and copied > 0:
+            print("The backup folder's filesystem can't clone files, so the whole server folder was copied while "
+                  "saving was off. dedup and snapshot backups only copy the files that changed.")
+        try:
+            yield staging, scanned
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
 
-    def zip_folder_for_backup(self, folder_path, zip_dest_folder, zip_filename):
+    def saveAndWait(self, timeout=60.0) -> bool:
+        """Turns saving off, flushes the world to disk and waits until the server confirms it."""
+        seen = self.console.next_seq
+        if not self.io_channel.send("save-off", "save-all flush"):
+            return False
+        deadline = time.monotonic() + timeout
+        while True:
+            _, lines, seen = self.console.get(since=seen)
+            if any(hot_backup.SAVED_PATTERN.search(line) for line in lines):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.isServerRunning():
+                return False
+            self.console.wait(seen, remaining)
+
+    def getBackupMode(self):
+        return self.backup_settings.get("mode", "dedup")
+
+    def getBackupCompression(self):
+        """Returns (codec, level, threads) from the backup settings. level and threads may be None for defaults."""
+        try:
+            codec = backup_compression.get_codec(self.backup_settings.get("codec", "deflate"))
+        except ValueError as e:
+            print(e)
+            print("Using deflate instead.")
+            codec = backup_compression.DEFLATE
+        return codec, self.backup_settings.get("level"), self.backup_settings.get("threads")
+
+    def getBackupStore(self) -> backup_store.BackupStore:
+        """Returns the chunk store shared with every server backing up next to this one."""
+        parent = os.path.dirname(os.path.abspath(self.backup_location))
+        return backup_store.get_store(os.path.join(parent, backup_store.STORE_FOLDER))
+
+    def getManifestPath(self, backup_name):
+        return os.path.join(self.backup_location, backup_name + backup_store.MANIFEST_SUFFIX)
+
+    def dedupBackup(self, backup_name):
+        """Backs up the server folder into the shared chunk store, reusing the newest earlier backup."""
+        previous = None
+        for name in self.getBackups():
+            if os.path.isfile(self.getManifestPath(name)):
+                previous = backup_store.load_manifest(self.getManifestPath(name))
+                break
+        previous_files = {entry["path"]: entry for entry in previous["files"]} if previous else {}
+
+        def is_unchanged(path, size, mtime_ns):
+            entry = previous_files.get(path)
+            return entry is not None and entry["size"] == size and entry["mtime_ns"] == mtime_ns
+
+        codec, level, threads = self.getBackupCompression()
+        with self.frozenServerFolder(is_unchanged) as (source, scanned):
+            manifest = self.getBackupStore().backup(source, self.getManifestPath(backup_name),
+                                                    previous=previous, progress=self.backup_progress,
+                                                    codec=codec, level=level, threads=threads, scanned=scanned,
+                                                    throttle=self.backup_throttle)
+        print(f"Backed up {manifest['size'] / (1024 * 1024):.1f} MB, "
+              f"stored {manifest['stored'] / (1024 * 1024):.1f} MB of new data.")
+        return {"size": manifest["size"], "stored": manifest["stored"], "files": len(manifest["files"])}
+
+    def snapshotBackup(self, backup_name):
+        """Copies the server folder into a snapshot folder.
+        Files unchanged since the newest snapshot are hardlinked to it instead of copied."""
+        previous = None
+        previous_checksums = None
+        for name in self.getBackups():
+            if os.path.isdir(os.path.join(self.backup_location, name)):
+                previous = os.path.join(self.backup_location, name)
+                previous_checksums = backup_verify.load_checksums(self.backup_location, name)
+                break
+
+        def is_unchanged(path, size, mtime_ns):
+            return previous is not None and backup_snapshot.is_unchanged(
+                previous, path, size, mtime_ns, previous_checksums.get("mtimes") if previous_checksums else None)
+
+        with self.frozenServerFolder(is_unchanged) as (source, scanned):
+            result = backup_snapshot.create_snapshot(source, os.path.join(self.backup_location, backup_name),
+                                                     previous=previous, progress=self.backup_progress,
+                                                     scanned=scanned, previous_checksums=previous_checksums,
+                                                     throttle=self.backup_throttle)
+        backup_verify.write_checksums(self.backup_location, backup_name, result["checksums"])
+        print(f"Snapshot of {result['size'] / (1024 * 1024):.1f} MB: "
+              f"copied {result['copied'] / (1024 * 1024):.1f} MB, linked {result['linked']} unchanged files.")
+        return {"size": result["size"], "stored": result["copied"], "files": len(result["checksums"]["files"])}
+
+    def zip_folder_for_backup(self, folder_path, zip_dest_folder, zip_filename, scanned=None):
+        """Writes a zip of the folder. Returns {"size", "stored", "files"} for the catalogue."""
         # Create the full path for the zip file
         zip_file_path = os.path.join(zip_dest_folder, zip_filename)
 
-        # get total file count and folder size
-        file_count = 0
-        total_size = 0
-        for root, dirs, files in os.walk(folder_path):
-            file_count += len(files)
-            total_size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
-
-        # Convert total size to megabytes
-        total_size_mb = total_size / (1024 * 1024)
-
-        widgets = [' [',
-                   progressbar.Timer(format='Elapsed Time: %(elapsed)s'),
-                   '] ',
-                   progressbar.Bar('*'), ' (',
-                   progressbar.ETA(), ') ',
-                   ]
-        bar = progressbar.ProgressBar(max_value=total_size_mb,
-                                      widgets=widgets).start()
-
-        # Create a zip file
-        with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Walk through the directory
-            count = 0
-            size_written = 0
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    # Create the full path of the file
-                    file_path = os.path.join(root, file)
-
-                    count += 1
-                    # get the size of the file
-                    file_size = os.path.getsize(file_path)
-                    # update the size written
-                    size_written += file_size
-                    # convert size written to megabytes
-                    size_written_mb = size_written / (1024 * 1024)
-                    # update the progressbar
-                    try:
-                        bar.update(size_written_mb)
-                    except ValueError:
-                        print("Error updating progress bar. Size written exceeded expected value. Ignoring...")
-
-                    self.backup_progress = bar.percentage
-
-                    # Add file to the zip file
-                    try:
-                        zipf.write(file_path, os.path.relpath(file_path, folder_path))
-                    except:
-                        print("Error writing file: " + file)
-
-        bar.finish()
-        self.backup_progress = 0
-
-    def restore(self, backup_name):
-        self.delete(self.server_location)
-        path = f"{self.backup_location}\\{backup_name}"
-        self.copy(path, self.server_location)
-
-        print("Restored backup.")
-
-    def copy(self, origin, target):
-        print("Copying {} to {}".format(origin, target))
-        files = os.listdir(origin)
-        for file_name in files:
+        # one scandir pass lists the files with their sizes; the writer reports progress from it
+        files, dirs = scanned or backup_store.scan(folder_path)
+
+        # files are compressed on a thread pool; the zip is written under a temporary name until complete
+        codec, level, threads = self.getBackupCompression()
+        checksums = backup_compression.write_zip(zip_file_path + ".tmp", folder_path, files, dirs, codec=codec,
+                                                 level=level, threads=threads, progress=self.backup_progress,
+                                                 throttle=self.backup_throttle)
+        backup_verify.write_checksums(zip_dest_folder, zip_filename.removesuffix(".zip"), checksums)
+        os.replace(zip_file_path + ".tmp", zip_file_path)
+        skipped = set(checksums["skipped"])
+        return {"size": sum(size for path, size, _ in files if path not in skipped),
+                "stored": os.path.getsize(zip_file_path), "files": len(checksums["files"])}
+
+    def openBackup(self, backup_name):
+        """Returns a reader for the backup with this name, or None if there is no such backup."""
+        if backup_name not in self.getBackups():
+            return None
+        manifest_path = self.getManifestPath(backup_name)
+        zip_path = os.path.join(self.backup_location, backup_name + ".zip")
+        folder = os.path.join(self.backup_location, backup_name)
+        if os.path.isfile(manifest_path):
+            return backup_restore.ManifestBackup(self.getBackupStore(), backup_store.load_manifest(manifest_path))
+        if os.path.isfile(zip_path):
+            return backup_restore.ZipBackup(zip_path)
+        if os.path.isdir(folder):
+            return backup_restore.SnapshotBackup(folder)
+        return None
+
+    def openDownload(self, backup_name):
+        """Returns the backup as a zip for download (see backup_download), or None if there is no such backup."""
+        if backup_name not in self.getBackups():
+            return None
+        manifest_path = self.getManifestPath(backup_name)
+        zip_path = os.path.join(self.backup_location, backup_name + ".zip")
+        folder = os.path.join(self.backup_location, backup_name)
+        catalogue = self.getCatalogue()
+
+        def save_table(table):
+            # resumed downloads of this backup start from the table instead of reading it all again
             try:
-                src = f"{origin}\\{file_name}"
-                dst = f"{target}\\{file_name}"
-                if os.path.isfile(src):
-                    shutil.copy2(src, dst)
-                elif os.path.isdir(src):
-                    os.mkdir(dst)
-                    self.copy(src, dst)
-            except PermissionError:
-                print("Permission Error...continuing")
-
-    def delete(self, target):
-        files = os.listdir(target)
-        for file_name in files:
-            file = f"{target}\\{file_name}"
-            if os.path.isfile(file):
-                os.remove(file)
-            elif os.path.isdir(file):
-                self.delete(file)
-                os.rmdir(file)
+                catalogue.setDownloadTable(backup_name, table)
+            except sqlite3.Error as e:
+                print(e)
+                print(f"Could not save the download table of {backup_name}.")
+
+        if os.path.isfile(manifest_path):
+            return backup_download.manifest_zip(self.getBackupStore(), backup_store.load_manifest(manifest_path),
+                                                catalogue.downloadTable(backup_name), save_table)
+        if os.path.isfile(zip_path):
+            return backup_download.FileDownload(zip_path)
+        if os.path.isdir(folder):
+            return backup_download.snapshot_zip(folder, catalogue.downloadTable(backup_name), save_table)
+        return None
+
+    def getBackupName(self, backup):
+        """The name of a backup given by its catalogue id or its name, or None if there is no such backup."""
+        catalogue = self.getCatalogue()
+        if backup.isdigit():
+            return catalogue.nameOf(int(backup))
+        return backup if catalogue.has(backup) else None
+
+    def getRestoreSelection(self, backup, dimension=None, region=None, player=None, paths=None):
+        """Builds what to restore from the request: a dimension (optionally only a range of region files,
+        region = {"x": [min, max], "z": [min, max]} in region coordinates), one player's data, or paths
+        relative to the server folder. Returns None to restore everything. Raises ValueError."""
+        level_name = self.getLevelName()
+        if player:
+            return backup_restore.player_selection(self.server_location, level_name, player)
+        if region:
+            region_range = ((int(region["x"][0]), int(region["x"][1])),
+                            (int(region["z"][0]), int(region["z"][1])))
+            return backup_restore.dimension_selection(backup.files(), level_name, dimension or "overworld",
+                                                      region_range)
+        if dimension:
+            return backup_restore.dimension_selection(backup.files(), level_name, dimension)
+        if paths:
+            return backup_restore.Selection(paths)
+        return None
+
+    def getLevelName(self):
+        try:
+            with open(os.path.join(self.server_location, "server.properties"), "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.startswith("level-name="):
+                        return line.strip().split("=", 1)[1] or "world"
+        except FileNotFoundError:
+            pass
+        return "world"
+
+    def getRestoreProgress(self) -> list[bool, int]:
+        if self.restore_thread is None:
+            return False, 0
+        return True, self.restore_progress.percentage()
+
+    def startRestore(self, backup, selection=None):
+        self.restore_thread = Thread(target=self.restore, args=(backup, selection))
+        self.restore_thread.start()
+
+    def restore(self, backup, selection=None):
+        """Restores a backup (a name or a reader from openBackup) into the server folder,
+        all of it or only the selected part. The server must be stopped."""
+        self.restore_progress.start()
+        try:
+            if isinstance(backup, str):
+                backup_name = backup
+                backup = self.openBackup(backup_name)
+                if backup is None:
+                    raise backup_restore.RestoreError(f"There is no backup {backup_name}.")
+            _, _, threads = self.getBackupCompression()
+            count = backup_restore.restore(backup, self.server_location, selection, threads=threads,
+                                           progress=self.restore_progress)
+            self.restore_progress.finish()
+            print(f"Restored {count} files from backup.")
+        except Exception as e:
+            # backup_restore puts the server folder back as it was; anything else fails the restore the same way
+            print(e)
+            print("Failed to restore backup.")
+            self.restore_progress.fail(e)
+        finally:
+            self.restore_thread = None
 
     def createFile(self, dir, name, content):
         path = f"{self.server_location}{dir}\\{name}"
@@ -222,30 +530,199 @@ class MCserver:
         file.close()
 
     def getBackups(self):
-
-        files = os.listdir(self.backup_location)
-
-        stripped = []
-        for file in files:
-            stripped.append(file.removesuffix('.zip'))
-
-        files = stripped
-
-        def get_datetime(entry):
-            templist = entry.split("_")
-            date = templist[0].split('-')
-            time = templist[1].split('-')
-
-            month = int(date[0])
-            day = int(date[1])
-            year = int(date[2])
-            hour = int(time[0])
-            minute = int(time[1])
-            return datetime.datetime(year, month, day, hour, minute)
-
-        sorted_backups = sorted(files, key=get_datetime, reverse=True)
-
-        return sorted_backups
+        """Names of the complete backups, newest first, from the catalogue."""
+        return self.getCatalogue().names()
+
+    def getBackupTimes(self):
+        """(name, datetime it was started) of the complete backups, newest first. Comes from the catalogue,
+        so it works for backups the panel didn't name too."""
+        return [(name, datetime.datetime.fromtimestamp(started))
+                for name, started in self.getCatalogue().startTimes()]
+
+    def getCatalogue(self) -> backup_catalogue.BackupCatalogue:
+        """Returns the catalogue of the server's backups. The first time, it is brought in line with the
+        backup folder, which adds backups made before the catalogue existed."""
+        with self.catalogue_lock:
+            if self.catalogue is None:
+                catalogue = backup_catalogue.BackupCatalogue(
+                    os.path.join(self.backup_location, backup_catalogue.CATALOGUE_FILE))
+                on_disk = {}
+                for file in os.listdir(self.backup_location):
+                    if file.endswith(".tmp") or file.startswith("."):
+                        continue  # a backup still being written, or the staging folder
+                    name = file.removesuffix('.zip').removesuffix(backup_store.MANIFEST_SUFFIX)
+                    on_disk[name] = lambda name=name: self.describeBackup(name)
+                catalogue.sync(on_disk)
+                self.catalogue = catalogue
+            return self.catalogue
+
+    def describeBackup(self, backup_name):
+        """Reads the catalogue values of a backup from the backup itself."""
+        manifest_path = self.getManifestPath(backup_name)
+        zip_path = os.path.join(self.backup_location, backup_name + ".zip")
+        folder = os.path.join(self.backup_location, backup_name)
+        try:
+            started = self.getBackupDatetime(backup_name).timestamp()
+        except (ValueError, IndexError):
+            # not named by the panel
+            path = next((path for path in (manifest_path, zip_path) if os.path.isfile(path)), folder)
+            started = os.path.getmtime(path)
+        values = {"format": "snapshot", "started": started, "size": None, "stored": None, "files": None}
+        try:
+            if os.path.isfile(manifest_path):
+                manifest = backup_store.load_manifest(manifest_path)
+                values.update(format="dedup", size=manifest["size"], stored=manifest["stored"],
+                              files=len(manifest["files"]))
+            elif os.path.isfile(zip_path):
+                values.update(format="zip", stored=os.path.getsize(zip_path))
+                with zipfile.ZipFile(zip_path) as zipf:
+                    infos = [info for info in zipf.infolist() if not info.is_dir()]
+                values.update(size=sum(info.file_size for info in infos), files=len(infos))
+            elif os.path.isdir(folder):
+                checksums = backup_verify.load_checksums(self.backup_location, backup_name)
+                if checksums is not None:
+                    values["files"] = len(checksums["files"])
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            print(e)
+            print(f"Could not read backup {backup_name} for the catalogue.")
+        return values
+
+    @staticmethod
+    def getBackupDatetime(backup_name) -> datetime.datetime:
+        templist = backup_name.split("_")
+        date = templist[0].split('-')
+        time = templist[1].split('-')
+
+        month = int(date[0])
+        day = int(date[1])
+        year = int(date[2])
+        hour = int(time[0])
+        minute = int(time[1])
+        second = int(time[2]) if len(time) > 2 else 0
+        return datetime.datetime(year, month, day, hour, minute, second)
+
+    def deleteBackup(self, backup_name, collect=True):
+        """Deletes a backup of any format. For dedup backups the chunks no other backup uses are
+        freed too, unless collect is False (to collect once after deleting several)."""
+        manifest_path = self.getManifestPath(backup_name)
+        zip_path = os.path.join(self.backup_location, backup_name + ".zip")
+        folder = os.path.join(self.backup_location, backup_name)
+        if os.path.isfile(manifest_path):
+            os.remove(manifest_path)
+            if collect:
+                self.getBackupStore().collect()
+        elif os.path.isfile(zip_path):
+            os.remove(zip_path)
+        elif os.path.isdir(folder):
+            # other snapshots keep their own links to shared files
+            shutil.rmtree(folder)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(backup_verify.checksums_path(self.backup_location, backup_name))
+        self.getCatalogue().remove(backup_name)
+
+    def getBackupList(self, limit=100, before_id=None, status=None):
+        """Returns a page of backups from the catalogue, newest first, with their metadata and the result of
+        their last verification, and the number of backups. before_id is the last id of the previous page."""
+        return self.getCatalogue().list(limit, before_id, status)
+
+    def getBackupsToVerify(self, checked_before):
+        """Returns the backups never verified or last verified before checked_before (a timestamp),
+        newest first. Verification is off when "verify_mb_per_second" is 0 in the backup settings."""
+        try:
+            if backup_throttle.mb_per_second(self.backup_settings, "verify_mb_per_second") == 0:
+                return []
+        except ValueError as e:
+            print(e)
+            return []
+        # a backup only becomes complete in the catalogue once it is written
+        return self.getCatalogue().toVerify(checked_before)
+
+    def verifyBackup(self, backup_name):
+        """Re-reads a backup and checks it against its checksums, at most as fast as "verify_mb_per_second"
+        in the backup settings. Records the result and returns it, or None if the backup is gone."""
+        mb_per_second = backup_throttle.mb_per_second(self.backup_settings, "verify_mb_per_second",
+                                                      backup_verify.DEFAULT_MB_PER_SECOND)
+        throttle = backup_throttle.TokenBucket(mb_per_second * 1024 * 1024)
+        manifest_path = self.getManifestPath(backup_name)
+        zip_path = os.path.join(self.backup_location, backup_name + ".zip")
+        folder = os.path.join(self.backup_location, backup_name)
+        result = {"status": "ok", "checked": None, "bytes": 0, "error": None}
+        skipped = []
+        try:
+            if os.path.isfile(manifest_path):
+                manifest = backup_store.load_manifest(manifest_path)
+                skipped = manifest.get("skipped", [])
+                result["bytes"] = backup_verify.verify_manifest(self.getBackupStore(), manifest, throttle)
+            elif os.path.isfile(zip_path):
+                checksums = backup_verify.load_checksums(self.backup_location, backup_name)
+                skipped = checksums["skipped"] if checksums else []
+                result["bytes"] = backup_verify.verify_zip(zip_path, checksums, throttle)
+            elif os.path.isdir(folder):
+                checksums = backup_verify.load_checksums(self.backup_location, backup_name)
+                if checksums is None:
+                    result["status"] = "unverified"
+                else:
+                    skipped = checksums["skipped"]
+                    result["bytes"] = backup_verify.verify_snapshot(folder, checksums, throttle)
+            else:
+                return None
+        except (backup_verify.VerifyError, ValueError, KeyError) as e:
+            if backup_name not in self.getBackups():
+                return None  # deleted while it was being verified
+            result["status"] = "corrupt"
+            result["error"] = str(e)
+        if result["status"] == "ok" and skipped:
+            result["status"] = "incomplete"
+            result["error"] = f"{len(skipped)} files could not be backed up, like {skipped[0]}"
+        result["checked"] = time.time()
+
+        catalogue = self.getCatalogue()
+        if not catalogue.has(backup_name):
+            return None
+        catalogue.setVerification(backup_name, result["status"], result["checked"], result["bytes"],
+                                  result["error"])
+        if result["status"] in ("corrupt", "incomplete"):
+            print(f"Backup {backup_name} of {self.name} is {result['status']}: {result['error']}")
+        return result
+
+    def pruneBackups(self) -> list:
+        """Deletes the backups the retention policy in the backup settings doesn't keep.
+        Returns their names."""
+        retention = self.backup_settings.get("retention")
+        if not retention:
+            return []
+        try:
+            # servers.json may have been edited by hand
+            backup_scheduler.validate_settings({"retention": retention})
+        except (ValueError, TypeError) as e:
+            print(e)
+            print(f"Not pruning backups of {self.name}.")
+            return []
+        with backup_scheduler.DISK_LOCK:
+            backups = self.getBackupTimes()
+            keep = backup_scheduler.backups_to_keep(backups, retention)
+            pruned = [name for name, _ in backups if name not in keep]
+            had_manifest = False
+            for name in pruned:
+                had_manifest |= os.path.isfile(self.getManifestPath(name))
+                try:
+                    self.deleteBackup(name, collect=False)
+                except OSError as e:
+                    print(e)
+                    print(f"Could not delete backup {name}.")
+            if had_manifest:
+                deleted, freed = self.getBackupStore().collect()
+                print(f"Freed {freed / (1024 * 1024):.1f} MB in {deleted} unused chunks.")
+        if pruned:
+            print(f"Pruned {len(pruned)} backups of {self.name}: {', '.join(pruned)}")
+        return pruned
+
+    def getLogIndex(self) -> LogSearchIndex:
+        """Returns the search index over the server's log files, creating it on first use."""
+        if self.log_index is None:
+            self.log_index = LogSearchIndex(os.path.join(self.server_location, "logs"),
+                                            os.path.join("cache", "log_index", f"{self.name}.sqlite3"))
+        return self.log_index
 
     def getServerProperties(self):
         path = f"{self.server_location}\\server.properties"
@@ -325,18 +802,25 @@ class MCserver:
 
     # different than isServerRunning() because it checks if the server has finished startup and can be joined
     def isServerOperational(self) -> bool:
-        if not self.isServerRunning():
-            return False
-        if self.is_operational:
-            return True
-        if self.isServerRunning():
-            for line in self.console:
-                if "[Server thread/INFO]" in line and "Done" in line:
-                    self.is_operational = True
-                    self.notify_bot.notify(ServerEvent.SERVER_STARTED, self.name)
-                    return True
-            return False
-        return False
+        return self.is_operational and self.isServerRunning()
+
+    def setOperational(self):
+        """Startup finished. Called once per run by the console pipeline when the loader's "Done" line shows up."""
+        self.is_operational = True
+        self.operational_since = time.time()
+        self.notify_bot.notify(ServerEvent.SERVER_STARTED, self.name)
+        self.publishStatus()
+
+    def getStatusSnapshot(self):
+        return {
+            "running": self.isServerRunning(),
+            "operational": self.isServerOperational(),
+            "start_time": self.getStartTime(),
+            "operational_since": self.operational_since if self.isServerOperational() else None
+        }
+
+    def publishStatus(self):
+        self.events.publish("status", self.getStatusSnapshot())
 
     def getServerStatus(self):
         running = self.isServerRunning()
@@ -382,13 +866,13 @@ class MCserver:
 
         self.notify_bot.notify(ServerEvent.SERVER_STARTING, self.name)
 
-        # clear console: this is necessary so that isServerOperational doesn't find "Done" in the console from the previous run
         self.console.clear()
 
         self.players.clear()
 
         # set operational status as false in case it was true before
         self.is_operational = False
+        self.operational_since = None
 
         java_path = jdk_installations.install_jdk_for_mc_version(self.game_version)
 
@@ -419,68 +903,90 @@ class MCserver:
                 stderr=subprocess.STDOUT
             )
 
-        def server_read_lines(process, queue):
-            while True:
-                line = process.stdout.readline()
-                if not line and process.poll() is not None:
-                    break
-                queue.put(line.decode('utf-8', errors='replace'))
-
-        qs = Queue()
-        ts = Thread(target=server_read_lines, args=(self.subprocess, qs))
-        ts.daemon = True
-        ts.start()
+        self.io_channel = reactor.get_reactor().register(self.subprocess, self.handleConsoleLines)
+        self.publishStatus()
 
         try:
-            while self.subprocess.poll() is None:
-
-                try:
-                    line = self.command_queue.get_nowait()
-                except Empty:
-                    pass
-                else:
-                    if line != None:
-                        self.subprocess.stdin.write(bytes(line + "\n", encoding="utf-8"))
-                        self.subprocess.stdin.flush()
-                try:
-                    line = qs.get_nowait()
-                except Empty:
-                    pass
-                else:
-                    if line:
-                        print(line.strip())
-                        line = line.strip()
-
-                        if "Server thread/INFO" in getConsoleTags(line):
-                            text_after_tags = getTextAfterTags(line)
-                            if didPlayerJoin(text_after_tags):
-                                self.players.append(didPlayerJoin(text_after_tags))
-
-                                self.notify_bot.notify(ServerEvent.PLAYER_JOIN, didPlayerJoin(text_after_tags))
-                                print("PLAYER JOINED:", didPlayerJoin(text_after_tags))
-                            if didPlayerLeave(text_after_tags):
-                                if didPlayerLeave(text_after_tags) in self.players:
-                                    self.players.remove(didPlayerLeave(text_after_tags))
-
-                                self.notify_bot.notify(ServerEvent.PLAYER_LEAVE, didPlayerLeave(text_after_tags))
-                                print("PLAYER LEFT:", didPlayerLeave(text_after_tags))
-
-                            if didPlayerGotAchivement(text_after_tags) is not None:
-                                self.notify_bot.notify(ServerEvent.PLAYER_ACHIEVEMENT,
-                                                       *didPlayerGotAchivement(text_after_tags))
-
-                        line = hideIPIfPlayerJoined(line)
-                        self.console.append(line.strip())
+            self.subprocess.wait()
         finally:
             self.players.clear()
-            print("Subprocess ended, joining thread.")
-            ts.join(timeout=5)  # Add timeout to ensure the thread doesn't hang
-            if ts.is_alive():
-                print("Thread did not terminate in time, forcefully terminating.")
+            print("Subprocess ended, waiting for console output to drain.")
+            # Add timeout to ensure this doesn't hang if a child process keeps the pipe open
+            if not self.io_channel.wait_closed(timeout=5):
+                print("Console output did not close in time, continuing.")
             else:
-                print("Thread joined, server blocking method exiting.")
+                print("Console closed, server blocking method exiting.")
 
+            self.console_archive.flush()
             self.notify_bot.notify(ServerEvent.SERVER_STOPPED, self.name)
+            self.events.publish("players", self.players)
+            self.publishStatus()
+
+    def handleConsoleLines(self, lines):
+        """Called by the I/O reactor with each batch of lines the server prints. Runs on the reactor thread
+        shared by all servers, so nothing in here may block: notifications are only queued."""
+        lines = [line.strip() for line in lines if line]
+        if not lines:
+            return
+        print("\n".join(lines))
+
+        lines = [self.handleConsoleRecord(log_parser.parse_line(line)) for line in lines]
+        seq = self.console.extend(lines)
+        self.console_archive.extend(seq, lines)
+        self.events.publish("console", {"start": seq, "lines": lines})
+
+    def handleConsoleRecord(self, record):
+        """Acts on the events in one parsed line. Returns the line as it should be stored."""
+        if self.backup_throttle is not None and log_parser.is_overloaded(record):
+            self.backup_throttle.serverLagging()
+        if record.event == ServerEvent.PLAYER_JOIN:
+            player = record.event_args[0]
+            self.players.append(player)
+            self.had_players_since_backup = True
+            self.events.publish("players", self.players)
+
+            self.notify_bot.notify(ServerEvent.PLAYER_JOIN, player)
+            self.recordEvent(ServerEvent.PLAYER_JOIN, {"player": player}, record.line)
+            print("PLAYER JOINED:", player)
+        elif record.event == ServerEvent.PLAYER_LEAVE:
+            player = record.event_args[0]
+            if player in self.players:
+                self.players.remove(player)
+                self.events.publish("players", self.players)
+
+            self.notify_bot.notify(ServerEvent.PLAYER_LEAVE, player)
+            self.recordEvent(ServerEvent.PLAYER_LEAVE, {"player": player}, record.line)
+            print("PLAYER LEFT:", player)
+        elif record.event == ServerEvent.PLAYER_ACHIEVEMENT:
+            self.notify_bot.notify(ServerEvent.PLAYER_ACHIEVEMENT, *record.event_args)
+            self.recordEvent(ServerEvent.PLAYER_ACHIEVEMENT,
+                             {"player": record.event_args[0], "advancement": record.event_args[1]}, record.line)
+        elif not self.is_operational and log_parser.is_startup_done(record):
+            self.setOperational()
+        elif record.event is None and log_parser.is_server_info(record):
+            # mod, startup and warning lines would set off rules meant for game messages
+            rule_match = self.event_matcher.match(record.message)
+            if rule_match is not None:
+                rule, fields = rule_match
+                if rule.notify:
+                    if rule.name == ServerEvent.PLAYER_DEATH:
+                        self.notify_bot.notify(ServerEvent.PLAYER_DEATH, record.message)
+                    else:
+                        self.notify_bot.notify(ServerEvent.CUSTOM_EVENT, rule.name, record.message)
+                self.recordEvent(rule.name, fields, record.line)
+
+        return record.line
+
+    def recordEvent(self, name, fields, line):
+        """Adds an event to the history and pushes it to streaming clients."""
+        event = self.event_history.add(str(name), fields, line)
+        self.events.publish("event", event)
+
+    def setEventRules(self, rules):
+        """Replaces the user-defined event rules. Raises ValueError if a pattern doesn't compile."""
+        rules = [rule if isinstance(rule, EventRule) else EventRule(**rule) for rule in rules]
+        self.event_matcher = EventMatcher(BUILTIN_RULES + rules)
+        self.event_rules = rules
 
     def isModded(self):
         modded = [ServerType.FORGE, ServerType.NEOFORGE, ServerType.FABRIC]
@@ -505,24 +1011,13 @@ class MCserver:
 
     def getModList(self):
         """Returns list of mods in the server's mods folder. 
-        [(file_name, mod_name), etc.] where file_name is the jarfile name,
-        and mod_name is the extracted mod name from the mod metadata"""
-
-        results = []
+        [(file_name, mod_name, info), etc.] where file_name is the jarfile name,
+        mod_name is the extracted mod name from the mod metadata and info is everything extracted
+        (see extract_mod_info.get_mod_info). Only jars that changed since the last call are read."""
         mods_folder = os.path.join(
             self.server_location,
             "mods" if self.getModType() == mod_helper.ModType.MOD else "plugins"
         )
-
-        for file in os.listdir(mods_folder):
-            path = os.path.join(mods_folder, file)
-            if os.path.isfile(path) and file.endswith(".jar"):
-                try:
-                    mod_name = extract_mod_info.get_mod_name(path)
-                except Exception as e:
-                    print(e)
-                    print("Error while extracting mod metadata.")
-                    mod_name = file
-                results.append((file, mod_name))
-
-        return results
+        if self.mod_cache is None:
+            self.mod_cache = ModCache(os.path.join("cache", "mod_info", f"{self.name}.json"))
+        return [(file, info["name"], info) for file, info in self.mod_cache.list(mods_folder)]
@@ -1,5 +1,7 @@
 import json
 import os
+import queue
+import threading
 from enum import IntFlag, StrEnum
 
 import telebot
@@ -23,12 +25,17 @@ class ServerEvent(StrEnum):
     PLAYER_LEAVE = "player_leave"
     PLAYER_ACHIEVEMENT = "player_achievement"
     PLAYER_DEATH = "player_death"
+    CUSTOM_EVENT = "custom_event"
 
 
 class NotifyMode(IntFlag):
     SERVER_EVENTS = 1
     PLAYER_CONN_EVENTS = 2
     PLAYER_OTHER_EVENTS = 4
+    CUSTOM_EVENTS = 8
+
+# messages waiting while Telegram is slow or down; newer ones are dropped beyond this
+MAX_QUEUED_MESSAGES = 100
 
 
 class NotifyBot:
@@ -39,14 +46,20 @@ class NotifyBot:
         self.chat_id = chat_id
 
         if notify_mode is None:
-            notify_mode = NotifyMode.SERVER_EVENTS + NotifyMode.PLAYER_CONN_EVENTS + NotifyMode.PLAYER_OTHER_EVENTS
+            notify_mode = (NotifyMode.SERVER_EVENTS + NotifyMode.PLAYER_CONN_EVENTS + NotifyMode.PLAYER_OTHER_EVENTS
+                           + NotifyMode.CUSTOM_EVENTS)
 
         self.notify_mode = notify_mode
+        self._queue = queue.Queue(MAX_QUEUED_MESSAGES)
+        self._thread = None
+        self._thread_lock = threading.Lock()
 
     def get_settings(self):
         return self.__token, self.chat_id,
 
     def notify(self, event, *args):
+        """Queues a message for the event. Never blocks: the console reactor calls this for every server,
+        so messages are sent from the bot's own thread."""
         if self.__token is None or self.__token == "":
             return
 
@@ -62,7 +75,28 @@ class NotifyBot:
             if self.notify_mode & NotifyMode.PLAYER_OTHER_EVENTS:
                 self.__send_message(event, *args)
 
+        elif event == ServerEvent.CUSTOM_EVENT:
+            if self.notify_mode & NotifyMode.CUSTOM_EVENTS:
+                self.__send_message(event, *args)
+
     def __send_message(self, event, *args):
+        try:
+            self._queue.put_nowait((event, args))
+        except queue.Full:
+            print("Too many Telegram messages waiting. Dropping one.")
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.__send_queued, name="notify-bot")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def __send_queued(self):
+        while True:
+            event, args = self._queue.get()
+            self.__send_now(event, *args)
+
+    def __send_now(self, event, *args):
         try:
             if self.__token is None or self.__token == "":
                 return
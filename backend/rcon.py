@@ -0,0 +1,95 @@
+"""Minimal Minecraft RCON client.
+
+Used to run console commands and get back exactly the output each command produced.
+Needs enable-rcon=true and an rcon.password in the server's server.properties.
+https://minecraft.wiki/w/RCON
+"""
+import socket
+import struct
+
+TYPE_RESPONSE = 0
+TYPE_COMMAND = 2
+TYPE_LOGIN = 3
+
+# the server answers packet types it doesn't know with a single response carrying the same id,
+# so one of these sent after a command marks the end of its (possibly split) response
+TYPE_SENTINEL = 200
+# responses longer than this are split over several packets
+MAX_FRAGMENT = 4096
+
+
+class RconError(Exception):
+    pass
+
+
+def _pack(request_id, packet_type, body):
+    payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf-8") + b"\0\0"
+    return struct.pack("<i", len(payload)) + payload
+
+
+class RconClient:
+    def __init__(self, host, port, password, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._socket = None
+        self._buffer = b""
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def connect(self):
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._socket.sendall(_pack(1, TYPE_LOGIN, self.password))
+        request_id, _, _ = self._receive()
+        if request_id == -1:
+            self.close()
+            raise RconError("RCON login failed. Check rcon.password in server.properties.")
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def run(self, commands) -> list[str]:
+        """Runs the commands in order and returns the full response text of each.
+        The vanilla server only handles one packet per read, so commands can't be pipelined;
+        each one waits for its response (a local round trip) before the next is sent."""
+        responses = []
+        for i, command in enumerate(commands):
+            request_id = i + 2
+            self._socket.sendall(_pack(request_id, TYPE_COMMAND, command))
+            _, _, body = self._receive()
+            # the limit is in bytes, so this is checked before decoding
+            if len(body) >= MAX_FRAGMENT:
+                # possibly split: read fragments until the sentinel's answer comes back
+                sentinel_id = -request_id
+                self._socket.sendall(_pack(sentinel_id, TYPE_SENTINEL, ""))
+                while True:
+                    response_id, _, part = self._receive()
+                    if response_id == sentinel_id:
+                        break
+                    body += part
+            # fragments may split a character, so they are decoded together
+            responses.append(body.decode("utf-8", errors="replace"))
+        return responses
+
+    def _receive(self):
+        length = struct.unpack("<i", self._read(4))[0]
+        data = self._read(length)
+        request_id, packet_type = struct.unpack("<ii", data[:8])
+        return request_id, packet_type, data[8:-2]
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            chunk = self._socket.recv(65536)
+            if not chunk:
+                raise RconError("RCON connection closed by the server.")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
@@ -0,0 +1,272 @@
+"""Shared I/O reactor for Minecraft server subprocesses.
+
+A single thread multiplexes the stdout and stdin pipes of every running server with
+``selectors``, so an idle server costs nothing: the reactor only wakes up when a server
+printed something or a command is waiting to be written.
+
+Windows cannot select() on pipes, so there each server gets a blocking reader thread
+instead. It still never spins.
+"""
+import os
+import platform
+import selectors
+import socket
+import threading
+from collections import deque
+
+READ_SIZE = 65536
+# upper bound on what one wakeup reads from a pipe before other servers get a turn
+MAX_DRAIN = 1024 * 1024
+
+
+class ServerChannel:
+    """Handle for one registered subprocess. Used to send commands and wait for EOF."""
+
+    def __init__(self, reactor, process, on_lines, on_close):
+        self.reactor = reactor
+        self.process = process
+        self.on_lines = on_lines
+        self.on_close = on_close
+        self.closed = threading.Event()
+        self._partial = b""
+        self._out = bytearray()
+        self._out_lock = threading.Lock()
+
+    def send(self, *commands):
+        """Queues one or more commands for the server's stdin. All of them are written in a single flush."""
+        if self.closed.is_set():
+            return False
+        data = "".join(command + "\n" for command in commands).encode("utf-8")
+        with self._out_lock:
+            self._out += data
+        self.reactor._wantWrite(self)
+        return True
+
+    def wait_closed(self, timeout=None):
+        """Waits until the reactor has read the subprocess' stdout to EOF."""
+        return self.closed.wait(timeout)
+
+    def _feed(self, data):
+        """Splits a chunk of output into lines and hands them over as one batch.
+        Only complete lines are decoded (once, together); the rest waits for the next chunk."""
+        end = data.rfind(b"\n")
+        if end == -1:
+            self._partial += data
+            return
+        chunk = self._partial + data[:end]
+        self._partial = data[end + 1:]
+        self._dispatch(chunk.decode("utf-8", errors="replace").split("\n"))
+
+    def _dispatch(self, lines):
+        try:
+            self.on_lines([line.rstrip("\r") for line in lines])
+        except Exception as e:
+            print(e)
+            print("Error while handling console output. Ignoring.")
+
+    def _close(self):
+        if self.closed.is_set():
+            return
+        if self._partial:
+            self._dispatch([self._partial.decode("utf-8", errors="replace")])
+            self._partial = b""
+        for pipe in (self.process.stdout, self.process.stdin):
+            try:
+                pipe.close()
+            except (OSError, ValueError):
+                pass
+        self.closed.set()
+        if self.on_close is not None:
+            self.on_close()
+
+
+class ServerIOReactor:
+    """Multiplexes every registered subprocess on one selector thread."""
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._pending = deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def register(self, process, on_lines, on_close=None) -> ServerChannel:
+        """Starts watching a subprocess created with stdout=PIPE and stdin=PIPE.
+        on_lines is called from the reactor thread with a list of lines for every chunk of output."""
+        channel = ServerChannel(self, process, on_lines, on_close)
+        os.set_blocking(process.stdout.fileno(), False)
+        os.set_blocking(process.stdin.fileno(), False)
+        self._call(self._register, channel)
+        self._ensureThread()
+        return channel
+
+    def _ensureThread(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="server-io-reactor")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _call(self, func, *args):
+        # the selector is only ever touched from the reactor thread
+        self._pending.append((func, args))
+        try:
+            self._wakeup_w.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            pass  # the reactor already has a wakeup pending
+
+    def _wantWrite(self, channel):
+        self._call(self._updateWriteInterest, channel)
+
+    def _register(self, channel):
+        self._selector.register(channel.process.stdout, selectors.EVENT_READ, (channel, selectors.EVENT_READ))
+        self._updateWriteInterest(channel)
+
+    def _updateWriteInterest(self, channel):
+        if channel.closed.is_set():
+            return
+        stdin = channel.process.stdin
+        with channel._out_lock:
+            wants_write = len(channel._out) > 0
+        try:
+            self._selector.get_key(stdin)
+            registered = True
+        except KeyError:
+            registered = False
+        if wants_write and not registered:
+            self._selector.register(stdin, selectors.EVENT_WRITE, (channel, selectors.EVENT_WRITE))
+        elif not wants_write and registered:
+            self._selector.unregister(stdin)
+
+    def _unregister(self, channel):
+        for pipe in (channel.process.stdout, channel.process.stdin):
+            try:
+                self._selector.unregister(pipe)
+            except (KeyError, ValueError):
+                pass
+        channel._close()
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._drainWakeups()
+                    continue
+                channel, event = key.data
+                try:
+                    if event == selectors.EVENT_READ:
+                        self._read(channel)
+                    else:
+                        self._write(channel)
+                except Exception as e:
+                    # only this server's I/O stops, the thread is shared by all of them
+                    print(e)
+                    print("Error in a server's console I/O. Closing its channel.")
+                    self._dropChannel(channel)
+
+    def _dropChannel(self, channel):
+        try:
+            self._unregister(channel)
+        except Exception as e:
+            print(e)
+            print("Error while closing a server's console channel. Ignoring.")
+
+    def _drainWakeups(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self._pending:
+            func, args = self._pending.popleft()
+            try:
+                func(*args)
+            except Exception as e:
+                # e.g. registering a pipe that closed in the meantime; the other servers keep going
+                print(e)
+                print("Error in a pending reactor call. Ignoring.")
+
+    def _read(self, channel):
+        # drain whatever the pipe holds so a burst becomes a few large batches
+        chunks = []
+        size = 0
+        eof = False
+        fd = channel.process.stdout.fileno()
+        while size < MAX_DRAIN:
+            try:
+                data = os.read(fd, READ_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                data = b""
+            if not data:
+                eof = True
+                break
+            chunks.append(data)
+            size += len(data)
+        if chunks:
+            channel._feed(b"".join(chunks))
+        if eof:
+            self._unregister(channel)
+
+    def _write(self, channel):
+        with channel._out_lock:
+            try:
+                written = os.write(channel.process.stdin.fileno(), channel._out)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # the server closed its stdin, drop whatever was queued
+                written = len(channel._out)
+            del channel._out[:written]
+        self._updateWriteInterest(channel)
+
+
+class ThreadedServerIO:
+    """Fallback for platforms where pipes can't be selected (Windows).
+    Uses one blocking reader thread per server and writes commands directly."""
+
+    def register(self, process, on_lines, on_close=None) -> ServerChannel:
+        channel = ServerChannel(self, process, on_lines, on_close)
+        thread = threading.Thread(target=self._readLines, args=(channel,))
+        thread.daemon = True
+        thread.start()
+        return channel
+
+    def _readLines(self, channel):
+        try:
+            # read1 blocks until some output is available, then returns everything buffered
+            for data in iter(lambda: channel.process.stdout.read1(READ_SIZE), b""):
+                channel._feed(data)
+        except (OSError, ValueError):
+            pass
+        channel._close()
+
+    def _wantWrite(self, channel):
+        with channel._out_lock:
+            data = bytes(channel._out)
+            channel._out.clear()
+            try:
+                channel.process.stdin.write(data)
+                channel.process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+
+def get_reactor():
+    """Returns the process-wide reactor, creating it on first use."""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            if platform.system() == "Windows":
+                _reactor = ThreadedServerIO()
+            else:
+                _reactor = ServerIOReactor()
+        return _reactor
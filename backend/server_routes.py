@@ -1,13 +1,16 @@
 """Contains routes for controlling Minecraft servers"""
 import os
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, Response, request, jsonify, send_from_directory
 import servers
 from server_types import ServerType
-from login_routes import token_required, requiresUserPermissionLevel
+from login_routes import token_required, requiresUserPermissionLevel, getUserFromRequest
 import mod_helper
 from permissions import permissions
 import mcserver_maker
 from mc import MCserver
+import event_stream
+import backup_scheduler
+import backup_throttle
 
 server_routes = Blueprint('backups', __name__)
 
@@ -143,6 +146,8 @@ def get_start_time(server):
 def start_server(server):
     """"Starts the server if it is not running. """
     server = servers.getServerByName(server)
+    if server.getRestoreProgress()[0]:
+        return jsonify({"message": "A backup is being restored."}), 409
     if not server.isServerRunning():
         server.startServerThread()
         return jsonify({"message": True}), 200
@@ -164,10 +169,100 @@ def stop_server(server):
 @requiresUserPermissionLevel(permissions["view_console"])
 @check_server_exists
 def get_console(server):
-    """Returns console lines"""
+    """Returns console lines.
+    Optional query parameters:
+    since - sequence number of the first line wanted (use "next" from the previous response)
+    limit - maximum number of lines to return; without since, the newest lines are returned
+    """
+    server = servers.getServerByName(server)
+    since = request.args.get("since", type=int)
+    limit = request.args.get("limit", type=int)
+
+    start, lines, next_seq = server.console.get(since, limit)
+    return jsonify({"start": start, "next": next_seq, "lines": lines}), 200
+
+@server_routes.route('/<server>/console/history', methods=["GET"])
+@token_required
+@requiresUserPermissionLevel(permissions["view_console"])
+@check_server_exists
+def get_console_history(server):
+    """Pages backward through the console archive, including previous runs.
+    Query parameters:
+    before - only lines with a smaller sequence number (use "before" from the previous response)
+    before_time - only lines older than this time (seconds since the epoch)
+    limit - maximum number of lines, default 200
+    """
+    server = servers.getServerByName(server)
+    before = request.args.get("before", type=int)
+    before_time = request.args.get("before_time", type=float)
+    limit = min(request.args.get("limit", 200, type=int), 5000)
+
+    lines = server.console_archive.read(before, before_time, limit)
+    return jsonify({
+        "lines": [{"seq": seq, "time": timestamp, "line": line} for seq, timestamp, line in lines],
+        "before": lines[0][0] if lines else None
+    }), 200
+
+@server_routes.route('/<server>/logs/search', methods=["GET"])
+@token_required
+@requiresUserPermissionLevel(permissions["view_console"])
+@check_server_exists
+def search_logs(server):
+    """Searches the server's log files (logs/*.log.gz and logs/latest.log), newest first.
+    Query parameters (all optional):
+    q - words that must all appear in the line
+    player - player name (joins, leaves, chat, advancements)
+    level - log level, e.g. INFO or WARN
+    since, until - time range in seconds since the epoch
+    before_id - for paging, the id of the last line of the previous page
+    limit - maximum number of lines, default 100
+    Logs are indexed in the background; "indexing" is true while that is still running, so the
+    newest lines or older archives may be missing from the results.
+    """
+    server = servers.getServerByName(server)
+    index = server.getLogIndex()
+    results = index.search(
+        query=request.args.get("q"),
+        player=request.args.get("player"),
+        level=request.args.get("level"),
+        since=request.args.get("since", type=float),
+        until=request.args.get("until", type=float),
+        before_id=request.args.get("before_id", type=int),
+        limit=min(request.args.get("limit", 100, type=int), 1000)
+    )
+    return jsonify({"data": results, "indexing": index.isUpdating()}), 200
+
+@server_routes.route('/<server>/stream', methods=["GET"])
+@token_required
+@check_server_exists
+def stream_events(server):
+    """Streams server events as Server-Sent Events.
+    Events: "status" (running, operational, start_time), "players" (list of names),
+    "console" (start sequence number and new lines, only with the view_console permission),
+    and "resync" when the client fell behind and should refetch over the REST routes.
+    Pass the token as the Authorization query parameter since EventSource can't set headers.
+    """
     server = servers.getServerByName(server)
+    topics = ["status", "players"]
+    user = getUserFromRequest(request)
+    if user is not None and user.permissions >= permissions["view_console"]:
+        topics.append("console")
 
-    return jsonify(server.console), 200
+    subscriber = server.events.subscribe(topics)
+
+    def generate():
+        try:
+            # send the current state first so clients don't need a separate request
+            yield event_stream.format_event("status", server.getStatusSnapshot())
+            yield event_stream.format_event("players", server.players)
+            while True:
+                payload = subscriber.get(timeout=15)
+                yield payload if payload is not None else event_stream.KEEPALIVE
+        finally:
+            server.events.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @server_routes.route('/<server>/console', methods=["POST"])
 @token_required
@@ -179,14 +274,93 @@ def send_command(server):
     command = server.runCommand(request.form.get("command"))
     return jsonify({"message": command}), 200
 
+@server_routes.route('/<server>/console/commands', methods=["POST"])
+@token_required
+@requiresUserPermissionLevel(permissions["send_command"])
+@check_server_exists
+def run_commands(server):
+    """Runs one or more console commands and returns the output attributed to them.
+    Takes a JSON body {"commands": [...], "timeout": seconds} or repeated "command" form fields.
+    See MCserver.runCommands for the response format.
+    """
+    server = servers.getServerByName(server)
+    body = request.get_json(silent=True) or {}
+    commands = body.get("commands") or request.form.getlist("command")
+    if not commands:
+        return jsonify({"message": "No commands given."}), 400
+    timeout = min(float(body.get("timeout") or request.form.get("timeout") or 5), 60)
+
+    result = server.runCommands(commands, timeout=timeout)
+    if result is None:
+        return jsonify({"message": "Server is not running."}), 409
+    return jsonify(result), 200
+
+@server_routes.route('/<server>/events', methods=["GET"])
+@token_required
+# every event carries its console line
+@requiresUserPermissionLevel(permissions["view_console"])
+@check_server_exists
+def get_events(server):
+    """Returns events extracted from the console (joins, leaves, advancements, deaths and
+    user-defined rules) and how often each has happened since the backend started.
+    Query parameters: since (event id), name, limit (default 100).
+    """
+    server = servers.getServerByName(server)
+    events = server.event_history.get(
+        since=request.args.get("since", type=int),
+        name=request.args.get("name"),
+        limit=min(request.args.get("limit", 100, type=int), 1000)
+    )
+    return jsonify({"events": events, "counts": server.event_history.counts}), 200
+
+@server_routes.route('/<server>/events/rules', methods=["GET"])
+@token_required
+@requiresUserPermissionLevel(permissions["view_console"])
+@check_server_exists
+def get_event_rules(server):
+    """Returns the server's user-defined event rules."""
+    server = servers.getServerByName(server)
+    return jsonify({"rules": [rule.to_json() for rule in server.event_rules]}), 200
+
+@server_routes.route('/<server>/events/rules', methods=["PUT"])
+@token_required
+@requiresUserPermissionLevel(permissions["create_server"])
+@check_server_exists
+def set_event_rules(server):
+    """Replaces the server's user-defined event rules.
+    Takes a JSON body {"rules": [{"name", "pattern", "notify"}]}.
+    """
+    server = servers.getServerByName(server)
+    body = request.get_json(silent=True) or {}
+    try:
+        server.setEventRules(body.get("rules", []))
+    except (ValueError, TypeError) as e:
+        return jsonify({"message": str(e)}), 400
+    servers.setServerInfoToJson()
+    return jsonify({"rules": [rule.to_json() for rule in server.event_rules]}), 200
+
 @server_routes.route('/<server>/backup', methods=["GET"])
 @token_required
 @check_server_exists
 def get_backups(server):
-    """Returns backup list"""
+    """Pages through the backup catalogue, newest first, without reading the backup folder.
+    Query parameters:
+    limit - maximum number of backups, default 100
+    before_id - only backups older than this one (the id of the last backup of the previous page)
+    status - only "running", "complete" or "failed" backups
+    Returns {"data": [backups], "total": number of backups matching status}. Each backup has id, name,
+    format, trigger ("manual", "schedule", or null if made before the catalogue), status, error, started,
+    finished, duration, size, stored, files, codec, game_version and
+    "verification": {"status", "checked", "bytes", "error"}. The verification status is "pending" until the
+    background verifier has read the backup, then "ok", "corrupt", "incomplete" (some files couldn't be
+    backed up) or "unverified" (nothing to check against)."""
     server = servers.getServerByName(server)
-
-    return jsonify(server.getBackups()), 200
+    backups, total = server.getBackupList(
+        limit=min(request.args.get("limit", 100, type=int), 1000),
+        before_id=request.args.get("before_id", type=int),
+        status=request.args.get("status")
+    )
+    return jsonify({"data": backups, "total": total}), 200
 
 @server_routes.route('/<server>/backup', methods=["POST"])
 @token_required
@@ -197,6 +371,9 @@ def create_backup(server):
     server = servers.getServerByName(server)
     if server.getBackupProgress()[0]:
         return jsonify({"message": "A backup for this server is already in progress."}), 200
+    if server.getRestoreProgress()[0]:
+        # it would be a backup of a half-restored server folder
+        return jsonify({"message": "A restore for this server is in progress."}), 409
     server.startBackup()
     return jsonify({"message": "Backup started."}), 200
 
@@ -204,10 +381,123 @@ def create_backup(server):
 @token_required
 @check_server_exists
 def get_backup_progress(server):
-    """Returns backup progress as percentage"""
+    """Returns backup and restore progress as percentages, plus details of the current or last one:
+    {"running", "bytesDone", "bytesTotal", "filesDone", "filesTotal", "mbPerSecond", "etaSeconds",
+    "elapsedSeconds", "failed", "error", "throttle"}. mbPerSecond is the effective rate, throttling included;
+    throttle is {"limitMbPerSecond", "lagging", "lagWarnings", "throttledSeconds"} for backups."""
     server = servers.getServerByName(server)
     backup_progress = server.getBackupProgress()
-    return jsonify({"isBackupping": backup_progress[0], "backupProgress": backup_progress[1]}), 200
+    restore_progress = server.getRestoreProgress()
+    return jsonify({"isBackupping": backup_progress[0], "backupProgress": backup_progress[1],
+                    "isRestoring": restore_progress[0], "restoreProgress": restore_progress[1],
+                    "backup": server.backup_progress.toJson(), "restore": server.restore_progress.toJson()}), 200
+
+@server_routes.route('/<server>/backup/settings', methods=["GET"])
+@token_required
+@check_server_exists
+def get_backup_settings(server):
+    """Returns the server's backup settings, including its schedule and retention policy."""
+    server = servers.getServerByName(server)
+    return jsonify(server.backup_settings), 200
+
+@server_routes.route('/<server>/backup/settings', methods=["PUT"])
+@token_required
+@requiresUserPermissionLevel(permissions["create_server"])
+@check_server_exists
+def set_backup_settings(server):
+    """Updates the server's backup settings. Takes a JSON body with any of
+    {"mode", "codec", "level", "threads", "schedule", "retention", "verify_mb_per_second", "max_mb_per_second",
+    "low_priority", "on_lag"}; null removes a setting.
+    "schedule": {"cron": "0 */6 * * *"} or {"interval_minutes": 60}, plus "only_if_players": true
+    "retention": {"hourly": 24, "daily": 7, "weekly": 4, "monthly": 6}
+    """
+    server = servers.getServerByName(server)
+    body = request.get_json(silent=True) or {}
+    settings = dict(server.backup_settings)
+    for key, value in body.items():
+        if value is None:
+            settings.pop(key, None)
+        else:
+            settings[key] = value
+    try:
+        backup_scheduler.validate_settings(settings)
+        backup_throttle.validate_settings(settings)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"message": str(e)}), 400
+    server.backup_settings = settings
+    servers.setServerInfoToJson()
+    return jsonify(server.backup_settings), 200
+
+@server_routes.route('/<server>/backup/<backup_name>/restore', methods=["POST"])
+@token_required
+# permissions.json files from before restores existed don't have this entry
+@requiresUserPermissionLevel(permissions.get("restore_backup", 4))
+@check_server_exists
+def restore_backup(server, backup_name):
+    """Restores a backup while the server is stopped. Without a body the whole server folder is
+    restored; a JSON body restores only part of it:
+    {"dimension": "nether"} - one dimension (overworld, nether, end or a namespaced id)
+    {"dimension": "overworld", "region": {"x": [-2, 1], "z": [0, 3]}} - region files in that range
+    {"player": "Steve"} - one player's data (name or UUID)
+    {"paths": ["world/data/raids.dat"]} - files or folders relative to the server folder
+    Progress is reported by /backup/progress.
+    """
+    server = servers.getServerByName(server)
+    if server.isServerRunning():
+        return jsonify({"message": "Stop the server before restoring a backup."}), 409
+    if server.getBackupProgress()[0] or server.getRestoreProgress()[0]:
+        return jsonify({"message": "A backup or restore for this server is already in progress."}), 409
+    backup = server.openBackup(backup_name)
+    if backup is None:
+        return jsonify({"message": "Backup does not exist."}), 404
+    body = request.get_json(silent=True) or {}
+    try:
+        selection = server.getRestoreSelection(backup, dimension=body.get("dimension"), region=body.get("region"),
+                                               player=body.get("player"), paths=body.get("paths"))
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        return jsonify({"message": f"Invalid restore selection: {e}"}), 400
+    server.startRestore(backup, selection)
+    return jsonify({"message": "Restore started."}), 200
+
+@server_routes.route('/<server>/backup/<backup>/download', methods=["GET"])
+@token_required
+# permissions.json files from before downloads existed don't have this entry
+@requiresUserPermissionLevel(permissions.get("download_backup", 4))
+@check_server_exists
+def download_backup(server, backup):
+    """Streams a backup as a zip file. backup is its id in the catalogue or its name.
+    Zip backups are sent from disk; dedup and snapshot backups are zipped while they are sent,
+    without a temporary file. Supports Range (one range) with If-Range for resuming, and ETag
+    with If-None-Match. Pass the token as the Authorization query parameter for plain links.
+    """
+    server = servers.getServerByName(server)
+    backup_name = server.getBackupName(backup)
+    try:
+        download = server.openDownload(backup_name) if backup_name is not None else None
+    except (OSError, ValueError) as e:
+        print(e)
+        return jsonify({"message": "Backup can't be read."}), 500
+    if download is None:
+        return jsonify({"message": "Backup does not exist."}), 404
+
+    headers = {"ETag": f'"{download.etag}"', "Accept-Ranges": "bytes"}
+    if request.if_none_match.contains(download.etag):
+        return Response(status=304, headers=headers)
+    start, stop, status = 0, download.size, 200
+    # a Range only applies to the archive the client has the beginning of
+    if request.range is not None and request.if_range.etag in (None, download.etag) and request.if_range.date is None:
+        byte_range = request.range.range_for_length(download.size)
+        if byte_range is not None:
+            start, stop = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{download.size}"
+        elif request.range.units == "bytes" and len(request.range.ranges) == 1:
+            return Response(status=416, headers={"Content-Range": f"bytes */{download.size}"})
+        # several ranges at once aren't supported: the whole archive is sent
+    headers["Content-Length"] = str(stop - start)
+    headers["Content-Disposition"] = f'attachment; filename="{backup_name}.zip"'
+    return Response(download.iterRange(start, stop), status=status, mimetype="application/zip", headers=headers,
+                    direct_passthrough=True)
 
 @server_routes.route('/<server>/mods', methods=["GET"])
 @check_server_exists
@@ -222,7 +512,9 @@ def get_mods(server):
 @server_routes.route('/<server>/mods/list', methods=["GET"])
 @check_server_exists
 def get_mods_list(server):
-    """Returns list of mod filenames and extracted mod names"""
+    """Returns list of mod filenames and extracted mod names: [[file, name, info]], where info is
+    {"name", "id", "version", "authors", "loader", "dependencies": [{"id", "required"}]}.
+    Served from the mod metadata cache; only new or changed jars are read."""
     server = servers.getServerByName(server)
 
     return jsonify({"data": server.getModList()}), 200
@@ -3,6 +3,9 @@ import os
 import shutil
 from threading import Thread
 
+import backup_scheduler
+import backup_verify
+import console_buffer
 import mc
 import mcserver_maker
 from notify import NotifyBot
@@ -80,6 +83,24 @@ def initServers():
         except KeyError:
             pass
 
+        console_max_lines = None
+        try:
+            console_max_lines = int(server_data["console_max_lines"])
+        except KeyError:
+            pass
+
+        event_rules = None
+        try:
+            event_rules = server_data["event_rules"]
+        except KeyError:
+            pass
+
+        backup_settings = None
+        try:
+            backup_settings = server_data["backup_settings"]
+        except KeyError:
+            pass
+
         notify_bot = None
         try:
             notify_bot_settings = server_data["notify_bot_settings"]
@@ -88,11 +109,17 @@ def initServers():
             pass
 
         server_info.append(mc.MCserver(server_name, server_type, server_folder,
-                                       backup_folder, notify_bot=notify_bot, game_version=game_version))
+                                       backup_folder, notify_bot=notify_bot, game_version=game_version,
+                                       console_max_lines=console_max_lines, event_rules=event_rules,
+                                       backup_settings=backup_settings))
 
     global servers
     servers = server_info
 
+    # runs scheduled backups, pruning and verification for whichever servers exist at the time
+    backup_scheduler.start(lambda: servers)
+    backup_verify.start(lambda: servers)
+
 
 def getServerByName(name) -> mc.MCserver | None:
     for server in servers:
@@ -124,6 +151,15 @@ def setServerInfoToJson():
         if notify_bot is not None:
             servers_list[server_name]["notify_bot_settings"] = notify_bot.get_settings()
 
+        if server.console.capacity != console_buffer.DEFAULT_CAPACITY:
+            servers_list[server_name]["console_max_lines"] = server.console.capacity
+
+        if server.event_rules:
+            servers_list[server_name]["event_rules"] = [rule.to_json() for rule in server.event_rules]
+
+        if server.backup_settings:
+            servers_list[server_name]["backup_settings"] = server.backup_settings
+
     servers_info = {"servers_folder": full_to_short(servers_folder, run_path_only=True),
                     "backups_folder": full_to_short(backups_folder, run_path_only=True), "servers_list": servers_list}
 
@@ -167,6 +203,13 @@ def asyncDeleteServer(name):
             print("Could not find server folder.")
         server = getServerByName(name)
         servers.remove(server)
+        server.console_archive.close()
+        shutil.rmtree(server.console_archive.folder, ignore_errors=True)
+        if server.log_index is not None:
+            try:
+                os.remove(server.log_index.index_path)
+            except FileNotFoundError:
+                pass
         try:
             if len(os.listdir(server.backup_location)) == 0:
                 shutil.rmtree(server.backup_location)
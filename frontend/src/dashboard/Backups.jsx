@@ -5,25 +5,35 @@ import API_SERVER from '../Constants';
 import { getAuthHeader } from '../AuthorizationHelper';
 import { useNotification } from '../NotificationContext';
 
+const BACKUP_PAGE_SIZE = 100;
+
 function Backups() {
 
     const [backupList, setBackupList] = useState([]);
+    const [backupTotal, setBackupTotal] = useState(0);
     const [selectedBackup, setSelectedBackup] = useState(null);
     const [backupProgress, setBackupProgress] = useState(0);
     const [backupInProgress, setBackupInProgress] = useState(false);
+    const [backupDetails, setBackupDetails] = useState(null);
 
     const { addNotification } = useNotification();
     const { serverName } = useParams();
     const navigate = useNavigate();
 
-    async function updateBackupList() {
-        const response = await fetch(API_SERVER + "/api/servers/" + serverName + "/backup", {
+    // loads the newest page of backups, or the page after the last loaded one with older set
+    async function updateBackupList(older = false) {
+        let url = API_SERVER + "/api/servers/" + serverName + "/backup?status=complete&limit=" + BACKUP_PAGE_SIZE;
+        if (older && backupList.length > 0) {
+            url += "&before_id=" + backupList[backupList.length - 1]["id"];
+        }
+        const response = await fetch(url, {
             headers: getAuthHeader(),
             method: 'GET'
         });
         const backupListResponse = await response.json();
         if (response.status == 200) {
-            setBackupList(backupListResponse);
+            setBackupList(older ? backupList.concat(backupListResponse["data"]) : backupListResponse["data"]);
+            setBackupTotal(backupListResponse["total"]);
         } else if (response.status == 401) {
             navigate("/login")
         } else {
@@ -57,6 +67,35 @@ function Backups() {
         }
     }
 
+    async function restoreBackup() {
+        if (selectedBackup === null) {
+            addNotification("Select a backup to restore.", "warning");
+            return;
+        }
+        const response = await fetch(API_SERVER + "/api/servers/" + serverName + "/backup/" + encodeURIComponent(selectedBackup) + "/restore", {
+            headers: getAuthHeader(),
+            method: 'POST'
+        });
+        const restoreResponse = await response.json();
+        if (response.status == 200) {
+            addNotification("Restoring backup " + selectedBackup + "...", "success");
+        } else if (response.status == 401) {
+            navigate("/login")
+        } else {
+            addNotification(restoreResponse["message"], "warning");
+        }
+    }
+
+    function downloadBackup() {
+        if (selectedBackup === null) {
+            addNotification("Select a backup to download.", "warning");
+            return;
+        }
+        // a plain navigation can't send headers, so the token goes in the query
+        window.location.href = API_SERVER + "/api/servers/" + serverName + "/backup/" + encodeURIComponent(selectedBackup)
+            + "/download?Authorization=" + encodeURIComponent(getAuthHeader()["Authorization"]);
+    }
+
     async function updateBackupProgress() {
         const response = await fetch(API_SERVER + "/api/servers/" + serverName + "/backup/progress", {
             headers: getAuthHeader(),
@@ -64,12 +103,17 @@ function Backups() {
         });
         const backupProgressResponse = await response.json();
         if (response.status == 200) {
+            setBackupDetails(backupProgressResponse["backup"]);
             if (backupProgressResponse["isBackupping"]) {
                 setBackupInProgress(true);
                 setBackupProgress(backupProgressResponse["backupProgress"]);
             } else {
                 if (backupInProgress) {
-                    addNotification("Backup completed.", "success");
+                    if (backupProgressResponse["backup"]["failed"]) {
+                        addNotification("Backup failed: " + backupProgressResponse["backup"]["error"], "error");
+                    } else {
+                        addNotification("Backup completed.", "success");
+                    }
                     updateBackupList();
                 }
                 setBackupInProgress(false);
@@ -104,6 +148,39 @@ function Backups() {
         return () => clearInterval(interval);
     }, [backupProgress]);
 
+    function formatBackupDetails(details) {
+        if (details === null || details["bytesTotal"] === 0) {
+            return "Preparing...";
+        }
+        const megabytes = (bytes) => (bytes / (1024 * 1024)).toFixed(1);
+        let text = `${megabytes(details["bytesDone"])} / ${megabytes(details["bytesTotal"])} MB, `
+            + `${details["filesDone"]} / ${details["filesTotal"]} files, ${details["mbPerSecond"]} MB/s`;
+        if (details["etaSeconds"] !== null) {
+            const minutes = Math.floor(details["etaSeconds"] / 60);
+            const seconds = details["etaSeconds"] % 60;
+            text += `, ${minutes}:${String(seconds).padStart(2, "0")} left`;
+        }
+        const throttle = details["throttle"];
+        if (throttle && throttle["lagging"]) {
+            text += throttle["limitMbPerSecond"] === 0 ? " (paused, the server can't keep up)"
+                : ` (slowed to ${throttle["limitMbPerSecond"]} MB/s, the server can't keep up)`;
+        } else if (throttle && throttle["limitMbPerSecond"] !== null) {
+            text += ` (limited to ${throttle["limitMbPerSecond"]} MB/s)`;
+        }
+        return text;
+    }
+
+    function formatBackupInfo(backup) {
+        let text = `${backup["format"]}, ${backup["files"] ?? "?"} files`;
+        if (backup["size"] !== null) {
+            text += `, ${(backup["size"] / (1024 * 1024)).toFixed(1)} MB`;
+        }
+        if (backup["verification"]["error"]) {
+            text += `\n${backup["verification"]["error"]}`;
+        }
+        return text;
+    }
+
     useEffect(() => {
         updateBackupList();
         updateBackupProgress();
@@ -113,13 +190,26 @@ function Backups() {
         <div className={styles.backupsContainer}>
             <ul className={styles.backupList}>
                 {backupList.map((backupListItem) => (
-                    <li key={backupListItem} 
-                    className={`${styles.backupListItem} ${selectedBackup === backupListItem ? styles.selectedBackupListItem : ""}`} 
-                    onClick={() => selectBackup(backupListItem)}>{backupListItem}</li>
+                    <li key={backupListItem["name"]} 
+                    className={`${styles.backupListItem} ${selectedBackup === backupListItem["name"] ? styles.selectedBackupListItem : ""}`} 
+                    onClick={() => selectBackup(backupListItem["name"])}
+                    title={formatBackupInfo(backupListItem)}>
+                        {backupListItem["name"]}
+                        <span className={`${styles.verification} ${styles[backupListItem["verification"]["status"]] || ""}`}>
+                            {backupListItem["verification"]["status"]}
+                        </span>
+                    </li>
                 ))}
+                {backupList.length < backupTotal && (
+                    <li className={styles.backupListItem} onClick={() => updateBackupList(true)}>
+                        Load older backups...
+                    </li>
+                )}
             </ul>
 
             <button className={styles.backupButton} onClick={startBackup}>Start Backup</button>
+            <button className={styles.backupButton} onClick={restoreBackup} disabled={selectedBackup === null}>Restore Selected Backup</button>
+            <button className={styles.backupButton} onClick={downloadBackup} disabled={selectedBackup === null}>Download Selected Backup</button>
 
 
             <div className={styles.backupProgress} style={{display: backupInProgress ? "block" : "none"}}>
@@ -127,6 +217,7 @@ function Backups() {
                 <div className={styles.backupProgressBarBorder}>
                     <div className={styles.backupProgressBar} style={{width: `${backupProgress}%`}}></div>
                 </div>
+                <p>{formatBackupDetails(backupDetails)}</p>
             </div>
             
         </div>
@@ -1,13 +1,17 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import {useNavigate, useParams} from 'react-router-dom';
 import styles from './Console.module.css';
 import API_SERVER from '../Constants';
 import { getAuthHeader } from '../AuthorizationHelper';
 import { useNotification } from '../NotificationContext';
 
+const MAX_CONSOLE_LINES = 1000;
+
 function Console() {
     const [serverConsole, setServerConsole] = useState("");
     const { serverName } = useParams();
+    const consoleLines = useRef([]);
+    const nextSeq = useRef(null);
 
     const { addNotification } = useNotification();
     const navigate = useNavigate();
@@ -31,14 +35,23 @@ function Console() {
     }
 
     async function updateConsole() {
-        const response = await fetch(API_SERVER + "/api/servers/" + serverName + "/console", {
+        // only ask for lines we haven't seen yet
+        var query = nextSeq.current === null ? "?limit=" + MAX_CONSOLE_LINES : "?since=" + nextSeq.current;
+        const response = await fetch(API_SERVER + "/api/servers/" + serverName + "/console" + query, {
             headers: getAuthHeader(),
             method: 'GET'
         });
-        const newServerConsoleList = await response.json();
+        const consoleResponse = await response.json();
         if (response.status === 200) {
-            var newServerConsole = newServerConsoleList.join('\n');
-            updateConsoleContent(addItalicsForTags(newServerConsole));
+            if (nextSeq.current !== null && consoleResponse["next"] < nextSeq.current) {
+                // sequence went backwards (backend restarted), start over
+                consoleLines.current = [];
+                nextSeq.current = null;
+                updateConsole();
+                return;
+            }
+            addConsoleLines(consoleResponse["start"], consoleResponse["lines"]);
+            nextSeq.current = consoleResponse["next"];
         } else if (response.status === 401) {
             navigate("/login");
         } else {
@@ -46,6 +59,19 @@ function Console() {
         }
     }
 
+    function addConsoleLines(start, lines) {
+        // skip lines we already have (the stream and a catch-up fetch can overlap)
+        if (nextSeq.current !== null && start < nextSeq.current) {
+            lines = lines.slice(nextSeq.current - start);
+        }
+        nextSeq.current = Math.max(nextSeq.current ?? 0, start + lines.length);
+        if (lines.length === 0 && consoleLines.current.length > 0) {
+            return;
+        }
+        consoleLines.current = consoleLines.current.concat(lines).slice(-MAX_CONSOLE_LINES);
+        updateConsoleContent(addItalicsForTags(consoleLines.current.join('\n')));
+    }
+
     function updateConsoleContent(newContent) {
         var consoleElement = document.getElementById("console");
         var { scrollTop, scrollHeight, clientHeight } = consoleElement;
@@ -61,17 +87,24 @@ function Console() {
     }
 
     useEffect(() => {
-        const interval = setInterval(() => {
-            updateConsole();
-        }, 2500);
+        consoleLines.current = [];
+        nextSeq.current = null;
+
+        // new lines are pushed over the event stream; a fetch on (re)connect fills any gap
+        const events = new EventSource(API_SERVER + "/api/servers/" + serverName + "/stream?Authorization="
+            + encodeURIComponent(getAuthHeader()["Authorization"]));
+        events.onopen = () => updateConsole();
+        events.addEventListener("console", (e) => {
+            const data = JSON.parse(e.data);
+            if (nextSeq.current !== null) {
+                addConsoleLines(data["start"], data["lines"]);
+            }
+        });
+        events.addEventListener("resync", () => updateConsole());
 
-        return () => clearInterval(interval);
+        return () => events.close();
     }, [serverName]);
 
-    useEffect(() => {
-        updateConsole();
-    }, []);
-
     async function sendCommand(command) {
         var form = new FormData();
         form.set("command", command);
@@ -82,9 +115,7 @@ function Console() {
         });
         const commandResponse = await response.json();
         if (response.status === 200) {
-            if (commandResponse["message"]) {
-                setTimeout(() => updateConsole(), 50);
-            } else {
+            if (!commandResponse["message"]) {
                 addNotification("Couldn't send command. Server is offline.", "error");
             }
         } else if (response.status === 401) {
@@ -153,7 +153,7 @@ function Mods() {
                     <ul className={styles.modList}>
                         {modList.map((modListItem) => (
                             <li key={modListItem[0]} className={styles.modListItem}>
-                                <p>{modListItem[1]}</p>
+                                <p title={modListItem[2] ? [modListItem[2]["version"], modListItem[2]["authors"].join(", ")].filter(Boolean).join(" - ") : ""}>{modListItem[1]}</p>
                                 {
                                     canInstallMods ? <button onClick={() => deleteMod(modListItem[0])}><i
                                         className="fa-solid fa-trash"></i></button>
@@ -1,6 +1,6 @@
 import styles from './Overview.module.css';
 import { useParams, useNavigate } from 'react-router-dom';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import API_SERVER from '../Constants';
 import { getAuthHeader } from '../AuthorizationHelper';
 import { useNotification } from '../NotificationContext';
@@ -12,6 +12,7 @@ function Overview() {
     const [serverStartTime, setServerStartTime] = useState(false);
     const [serverUptime, setServerUptime] = useState(false);
     const [playerList, setPlayerList] = useState([]);
+    const previousStatus = useRef([false, false]);
 
     const { serverName } = useParams();
     const navigate = useNavigate();
@@ -23,19 +24,7 @@ function Overview() {
         });
         const serverStatusResponse = await response.json();
         if (response.status == 200) {
-            if (serverStatus && !(serverOperationalStatus)) {
-                if (serverStatusResponse["message"][0] && serverStatusResponse["message"][1]) {
-                    addNotification("Server has been turned on successfully", "success");
-                } else if (!serverStatusResponse["message"][0]) {
-                    addNotification("Server failed to start", "error");
-                }
-            }
-            if (!serverStatusResponse["message"][0]) {
-                setServerStartTime(false);
-                setServerUptime(false);
-            }
-            setServerStatus(serverStatusResponse["message"][0]);
-            setServerOperationalStatus(serverStatusResponse["message"][1]);
+            applyStatus(serverStatusResponse["message"][0], serverStatusResponse["message"][1]);
             return serverStatusResponse["message"][0];
         } else if (response.status == 401) {
             navigate("/login");
@@ -44,6 +33,24 @@ function Overview() {
         }
     }
 
+    function applyStatus(running, operational) {
+        const [wasRunning, wasOperational] = previousStatus.current;
+        if (wasRunning && !wasOperational) {
+            if (running && operational) {
+                addNotification("Server has been turned on successfully", "success");
+            } else if (!running) {
+                addNotification("Server failed to start", "error");
+            }
+        }
+        if (!running) {
+            setServerStartTime(false);
+            setServerUptime(false);
+        }
+        previousStatus.current = [running, operational];
+        setServerStatus(running);
+        setServerOperationalStatus(operational);
+    }
+
     async function updateServerStartTime() {
         const response = await fetch(API_SERVER + "/api/servers/" + serverName + "/status/startTime", {
             method: "GET",
@@ -111,25 +118,28 @@ function Overview() {
         }
     }
 
-    // query status at intervals
+    // status and player changes are pushed over the event stream
     useEffect(() => {
-        const interval = setInterval(() => {
+        const events = new EventSource(API_SERVER + "/api/servers/" + serverName + "/stream?Authorization="
+            + encodeURIComponent(getAuthHeader()["Authorization"]));
+        events.addEventListener("status", (e) => {
+            const status = JSON.parse(e.data);
+            applyStatus(status["running"], status["operational"]);
+            if (status["running"]) {
+                setServerStartTime(status["start_time"]);
+            }
+        });
+        events.addEventListener("players", (e) => {
+            setPlayerList(JSON.parse(e.data));
+        });
+        events.addEventListener("resync", () => {
             queryStatus();
-        }, 2500);
- 
-        return () => clearInterval(interval);
-    }, [serverStatus, serverOperationalStatus]);
+            updateServerStartTime();
+            updatePlayersOnline();
+        });
 
-    useEffect(() => {
-        const interval = setInterval(() => {
-            if (serverStatus) {
-                updatePlayersOnline();
-            } else {
-                setPlayerList([]);
-            }
-        }, 3500);
-        return () => clearInterval(interval);
-    }, [serverStatus, playerList]);
+        return () => events.close();
+    }, [serverName]);
 
 
     // query status on load